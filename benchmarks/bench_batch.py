@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''
+Measure batch mode throughput in lines/second.
+
+    python3 benchmarks/bench_batch.py [lines]
+
+A reproducible mix of integer, rational and real expressions is generated
+in memory and run through Calculator.batch() with the output going to a
+string buffer, so only parsing, dispatch and formatting are timed.
+'''
+
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lhc import hc
+
+def make_input(lines, seed=1):
+    rnd = random.Random(seed)
+    templates = (
+        "%(a)d %(b)d +",
+        "%(a)d %(b)d *",
+        "%(a)d %(b)d - %(c)d *",
+        "%(a)d %(b)d /",
+        "%(a)d.%(c)d %(b)d.%(c)d *",
+        "%(a)d sqrt",
+        "2 %(c)d ^",
+    )
+    out = []
+    for i in range(lines):
+        values = {
+            "a": rnd.randint(1, 10**6),
+            "b": rnd.randint(1, 10**6),
+            "c": rnd.randint(1, 100),
+        }
+        out.append(rnd.choice(templates) % values)
+    return "\n".join(out) + "\n"
+
+def calculator():
+    opt, arg = hc.ParseCommandLine(["--batch", "-", "--default-config"])
+    return hc.Calculator(arg, opt)
+
+def run(lines):
+    calc = calculator()
+    text = make_input(lines)
+    out = io.StringIO()
+    start = time.perf_counter()
+    calc.batch(io.StringIO(text), out)
+    return time.perf_counter() - start
+
+def main(argv):
+    lines = 100000
+    if len(argv) > 1:
+        lines = int(argv[1])
+    elapsed = run(lines)
+    print("%d lines in %.3f s: %.0f lines/s" % (lines, elapsed, lines/elapsed))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+'''
+Show that tokenizing scales linearly with the length of a line.
+
+    python3 benchmarks/bench_lexer.py [max tokens]
+
+For one line programs and List literals of growing size, the time
+spent in Calculator.get_next_token() is printed along with the time per
+token, which should stay flat as the line grows.
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lhc import hc
+
+def calculator():
+    opt, arg = hc.ParseCommandLine(["--batch", "-", "--default-config", "--quiet"])
+    return hc.Calculator(arg, opt)
+
+def program(n):
+    # n numbers and n-1 operators with a mix of signs and exponents
+    words = ["1"]
+    for i in range(1, n):
+        words.append(("-%d" if i % 3 else "%de-2") % i)
+        words.append(("+", "<<", "*", ">=")[i % 4])
+    return " ".join(words)
+
+def list_literal(n):
+    return "{" + " ".join(str(i) for i in range(n)) + "} sum"
+
+def timeit(calc, line):
+    start = time.perf_counter()
+    count = sum(1 for t in calc.get_next_token(line))
+    return count, time.perf_counter() - start
+
+def main(argv):
+    largest = 10**6
+    if len(argv) > 1:
+        largest = int(argv[1])
+    calc = calculator()
+    for name, make in (("program", program), ("list", list_literal)):
+        n = 1000
+        while n <= largest:
+            line = make(n)
+            count, elapsed = timeit(calc, line)
+            print("%-8s %8d chars %8d tokens %8.3f s %7.3f us/char" %
+                  (name, len(line), count, elapsed, 1e6*elapsed/len(line)))
+            n *= 10
+    n = min(largest, 10**5)
+    start = time.perf_counter()
+    calc.evaluate(list_literal(n))
+    print("evaluate {%d numbers} sum: %.3f s" % (n, time.perf_counter() - start))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+'''
+Measure exact rational arithmetic.
+
+    python3 benchmarks/bench_rational.py [count]
+
+Sums count (default 10**5) random fractions with denominators up to
+1000, both directly with Rational and through the calculator's sum
+command, then times the exact-rational paths of the calculator:
+dividing two integers and taking the mean of a List of integers.
+'''
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lhc import config
+from lhc.engine import Context
+from lhc.numeric import Rational
+
+def fractions(count, seed=1):
+    rnd = random.Random(seed)
+    return [(rnd.randint(-1000, 1000), rnd.randint(1, 1000))
+            for i in range(count)]
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+def direct_sum(pairs):
+    total = Rational(0)
+    for n, d in pairs:
+        total = total + Rational(n, d)
+    return total
+
+def main(argv):
+    count = 10**5
+    if len(argv) > 1:
+        count = int(argv[1])
+    pairs = fractions(count)
+    t, total = timeit(direct_sum, pairs)
+    print("sum of %d Rationals:      %7.3f s  %6.2f us each" %
+          (count, t, 1e6*t/count))
+
+    config.defaults()
+    context = Context()
+    context.run_program("1 rat")
+    values = [Rational(n, d) for n, d in pairs]
+    context.stack.stack = values
+    t, result = timeit(context.run_program, "depth sum")
+    assert result == [total]
+    print("hc depth sum of %d:       %7.3f s  %6.2f us each" %
+          (count, t, 1e6*t/count))
+
+    context.clear()
+    lines = ["clr %d %d /" % (n, d) for n, d in pairs[:count//10]]
+    t, result = timeit(lambda: [context.run_program(l) for l in lines])
+    print("hc 'y x /' of ints:        %7.3f s  %6.2f us each" %
+          (t, 1e6*t/len(lines)))
+
+    context.clear()
+    ints = "{" + " ".join(str(n) for n, d in pairs[:1000]) + "}"
+    t, result = timeit(lambda: [context.run_program("clr %s mean" % ints)
+                                for i in range(100)])
+    print("hc mean of 1000 ints:      %7.3f s  %6.2f ms each" %
+          (t, 1e3*t/100))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+'''
+Load test hc --serve and report requests/second and latency.
+
+    python3 benchmarks/bench_serve.py [clients] [requests per client]
+
+A server is started on a temporary Unix socket and each client opens a
+session and sends its requests one after another, timing each round
+trip.  One request in fifty asks for a large Fibonacci number so the
+slow request path is exercised too.  For comparison, the cost of
+spawning 'hc --batch -' for a single request is also measured.
+'''
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+top = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+hc = [sys.executable, os.path.join(top, "hc")]
+
+def requests(n, seed):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        if i % 50 == 49:
+            out.append("clr %d fib bits" % rnd.randint(20000, 40000))
+        else:
+            out.append("clr %d %d + %d *" % (rnd.randint(1, 10**6),
+                       rnd.randint(1, 10**6), rnd.randint(1, 100)))
+    return out
+
+async def client(path, lines, latencies):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for line in lines:
+        start = time.perf_counter()
+        writer.write((line + "\n").encode())
+        reply = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        if reply.startswith(b"!"):
+            raise Exception("%s -> %s" % (line, reply.decode().strip()))
+    writer.write(b"quit\n")
+    writer.close()
+
+async def load(path, clients, count):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(path, requests(count, i), latencies)
+                           for i in range(clients)])
+    return time.perf_counter() - start, sorted(latencies)
+
+def wait_for(path, server):
+    for i in range(200):
+        if os.path.exists(path):
+            return
+        if server.poll() is not None:
+            raise Exception("server exited")
+        time.sleep(0.05)
+    raise Exception("server did not start")
+
+def spawn_cost(n=10):
+    start = time.perf_counter()
+    for i in range(n):
+        subprocess.run(hc + ["--batch", "-", "--default-config", "--quiet"],
+                       input=b"1 2 +\n", stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start)/n
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values)*p/100))]
+
+def main(argv):
+    clients, count = 20, 500
+    if len(argv) > 1:
+        clients = int(argv[1])
+    if len(argv) > 2:
+        count = int(argv[2])
+    path = os.path.join(tempfile.mkdtemp(), "hc.sock")
+    server = subprocess.Popen(hc + ["--serve", path, "--default-config",
+                              "--quiet"], stdout=subprocess.DEVNULL,
+                              env=dict(os.environ, HOME=os.path.dirname(path)))
+    try:
+        wait_for(path, server)
+        elapsed, latencies = asyncio.run(load(path, clients, count))
+    finally:
+        server.terminate()
+        server.wait()
+    n = len(latencies)
+    print("%d clients x %d requests: %.0f requests/s" %
+          (clients, count, n/elapsed))
+    print("latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % tuple(
+          1000*v for v in (percentile(latencies, 50), percentile(latencies, 90),
+                           percentile(latencies, 99), latencies[-1])))
+    print("spawning hc per request: %.1f ms" % (1000*spawn_cost()))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+'''
+Measure how long hc takes to start, evaluate one line and exit.
+
+    python3 benchmarks/bench_startup.py [--runs N] [--budget MS] [--record]
+
+'echo "1 2 +" | hc' is timed as wall clock over several runs, along with
+a bare python start and a bare 'import mpmath' for reference, since
+those are the floor hc can't go below.  The slowest imports reported by
+'python -X importtime' are listed so regressions are easy to find.
+
+The median is checked against the budget (BUDGET_MS unless --budget is
+given) and the exit status is 1 if it is over.  With --record, the
+result is appended to startup_history.json next to this script so the
+startup time can be tracked over time.
+'''
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.join(here, "..")
+hc = [sys.executable, os.path.join(top, "hc"), "--default-config", "--quiet"]
+history = os.path.join(here, "startup_history.json")
+
+# Target for the median time of 'echo "1 2 +" | hc', in milliseconds
+BUDGET_MS = 100
+
+def median_time(args, runs, env):
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, input=b"1 2 +\n", stdout=subprocess.DEVNULL,
+                       env=env, check=True)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return 1000*times[len(times)//2]
+
+def slowest_imports(env, count=10):
+    '''Return (cumulative ms, self ms, module) for the top level imports
+    with the largest cumulative time.
+    '''
+    p = subprocess.run([sys.executable, "-X", "importtime"] + hc[1:],
+                       input=b"1 2 +\n", stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE, env=env, check=True)
+    imports = []
+    for line in p.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        imports.append((cumulative/1000, own/1000, fields[2].rstrip()))
+    imports.sort(reverse=True)
+    return imports[:count]
+
+def revision():
+    try:
+        p = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=top,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return p.stdout.decode().strip()
+    except OSError:
+        return ""
+
+def main(argv):
+    runs, budget, record = 11, BUDGET_MS, False
+    args = argv[1:]
+    while args:
+        arg = args.pop(0)
+        if arg == "--runs":
+            runs = int(args.pop(0))
+        elif arg == "--budget":
+            budget = float(args.pop(0))
+        elif arg == "--record":
+            record = True
+        else:
+            print(__doc__)
+            return 2
+    # Keep the user's configuration and history out of the measurement
+    env = dict(os.environ, HOME=tempfile.mkdtemp())
+    result = {
+        "python_ms": median_time([sys.executable, "-c", "pass"], runs, env),
+        "mpmath_ms": median_time([sys.executable, "-c", "import mpmath"],
+                                 runs, env),
+        "hc_ms": median_time(hc, runs, env),
+    }
+    print("python -c pass     %7.1f ms" % result["python_ms"])
+    print("import mpmath      %7.1f ms" % result["mpmath_ms"])
+    print("echo '1 2 +' | hc  %7.1f ms  (budget %.0f ms)" % (result["hc_ms"],
+                                                            budget))
+    print("\nslowest imports (cumulative, self, module):")
+    for cumulative, own, module in slowest_imports(env):
+        print("  %7.1f ms %7.1f ms  %s" % (cumulative, own, module))
+    if record:
+        result["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        result["revision"] = revision()
+        result["budget_ms"] = budget
+        results = []
+        if os.path.exists(history):
+            with open(history) as f:
+                results = json.load(f)
+        results.append(result)
+        with open(history, "w") as f:
+            json.dump(results, f, indent=1)
+            f.write("\n")
+    if result["hc_ms"] > budget:
+        print("\nover budget by %.1f ms" % (result["hc_ms"] - budget))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
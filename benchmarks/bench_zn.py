@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+'''
+Measure fixed width integer (Zn) arithmetic against plain ints.
+
+    python3 benchmarks/bench_zn.py [iterations]
+
+A loop of bit twiddling (a xorshift random number generator and a
+population count) is run with plain Python ints masked by hand and
+with Zn values in u64 and s32 mode, and the slowdown of Zn relative to
+the ints is printed.  The same kind of script is also run through the
+calculator in u64 mode to show the cost per command.
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lhc import config
+from lhc.engine import Context
+from lhc.numeric import Zn
+from lhc.settings import Settings
+
+def xorshift(x, n, mask, one, s13, s7, s17, m55):
+    # Returns the n'th state and the sum of the low bits of each state
+    total = x & m55
+    for i in range(n):
+        x = x ^ ((x << s13) & mask)
+        x = x ^ (x >> s7)
+        x = x ^ ((x << s17) & mask)
+        total = total + (x & m55) & mask
+        total = total - one
+    return x, total
+
+def ints(n):
+    mask = 2**64 - 1
+    return xorshift(88172645463325252, n, mask, 1, 13, 7, 17, 0x5555)
+
+def zns(n, bits, signed):
+    with Settings() as s:
+        s.bits, s.signed = bits, signed
+        z = [Zn(v) for v in (88172645463325252, 2**bits - 1, 1, 13, 7, 17,
+                             0x5555)]
+        return xorshift(z[0], n, *z[1:])
+
+def timeit(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+def main(argv):
+    n = 100000
+    if len(argv) > 1:
+        n = int(argv[1])
+    base = timeit(ints, n)
+    print("int          %8.3f s  %7.3f us/iteration" % (base, 1e6*base/n))
+    for name, bits, signed in (("u64", 64, False), ("s32", 32, True)):
+        t = timeit(zns, n, bits, signed)
+        print("Zn %-9s %8.3f s  %7.3f us/iteration  %5.1fx int" %
+              (name, t, 1e6*t/n, t/base))
+    config.defaults()
+    context = Context()
+    context.run_program("u64 88172645463325252")
+    line = "dup 13 << xor dup 7 >> xor dup 17 << xor"
+    count = n//10
+    start = time.perf_counter()
+    for i in range(count):
+        context.run_program(line)
+    t = time.perf_counter() - start
+    print("hc u64 line  %8.3f s  %7.3f us/line (%d commands)" %
+          (t, 1e6*t/count, len(line.split())))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+'''
+Time the calculator's hot paths and compare them against a baseline.
+
+    python3 benchmarks/suite.py [options] [name ...]
+
+    -o, --output FILE      write the results as JSON to FILE
+    -b, --baseline FILE    compare against FILE (default baseline.json
+                           next to this script, if it exists)
+    -s, --save-baseline    write the results to the baseline file
+    -t, --threshold PCT    a benchmark slower than the baseline by more
+                           than PCT percent is a regression (default 10)
+    -r, --repeat N         best of N timings (default 5)
+    -l, --list             list the benchmarks and exit
+
+With names, only benchmarks whose name starts with one of them are run.
+Each benchmark is called enough times for one timing to take about
+min_time seconds and the best of the repeats is reported as the time
+per call.  The exit status is 1 if any benchmark regressed or failed.
+
+A baseline is only meaningful on the machine it was recorded on, so
+none is kept in the tree:  record one with --save-baseline before
+starting on a change and compare against it afterwards.
+'''
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+top = os.path.join(here, "..")
+sys.path.insert(0, top)
+
+from lhc import config
+from lhc.engine import Context
+from lhc.mpformat import mpFormat
+from lhc.numeric import Zn, Rational, mpf, mp
+
+# Minimum seconds for one timing of a benchmark
+min_time = 0.2
+
+benchmarks = []
+
+def benchmark(name):
+    '''Decorator that adds a function to the suite.  It is called with
+    the Context and returns the function to time, which takes no
+    arguments, so that setup isn't timed.
+    '''
+    def register(setup):
+        benchmarks.append((name, setup))
+        return setup
+    return register
+
+def program(text):
+    'Return a function evaluating text on a fresh stack.'
+    def setup(context):
+        def run():
+            context.clear()
+            context.run_program(text)
+        return run
+    return setup
+
+@benchmark("run/tokenize")
+def tokenize(context):
+    line = " ".join("%d %d.%d + 3 *" % (i, i, i) for i in range(50))
+    def run():
+        for t in context.get_next_token(line):
+            pass
+    return run
+
+@benchmark("run/dispatch")
+def dispatch(context):
+    # Compiled lines are cached, so this is dispatch and arithmetic
+    lines = ["%d %d + %d * dup drop" % (i, i + 1, i % 7) for i in range(20)]
+    def run():
+        context.clear()
+        for line in lines:
+            context.run_program(line)
+    return run
+
+@benchmark("run/uncached")
+def uncached(context):
+    # Distinct lines each time, so tokenizing and parsing are included
+    rnd = random.Random(1)
+    lines = ["%d %d.%d * %d -" % (rnd.randint(1, 10**9), rnd.randint(1, 999),
+             rnd.randint(1, 999), rnd.randint(1, 10**6)) for i in range(20000)]
+    state = [0]
+    def run():
+        context.clear()
+        i = state[0]
+        state[0] = (i + 20) % len(lines)
+        for line in lines[i:i+20]:
+            context.run_program(line)
+    return run
+
+@benchmark("number/parse")
+def parse(context):
+    words = ["12345", "-42", "3.14159", "6.02e23", "0x1f", "1/3", "1.5k",
+             "2+3i"]
+    def run():
+        for w in words:
+            context.number.parse(w)
+    return run
+
+@benchmark("format/stack")
+def format_stack(context):
+    values = context.run_program("12345 1 3 / 2 sqrt 2 -1 sqrt * 1 + 1.5e100")
+    def run():
+        for v in values:
+            context.Format(v)
+    return run
+
+def mpformat(method):
+    def setup(context):
+        f = mpFormat()
+        f.digits(12)
+        values = [mpf(v) for v in ("3.14159265358979", "-1.5e-20", "6.02e23",
+                                   "12345.678", "1")]
+        convert = getattr(f, method)
+        def run():
+            for v in values:
+                convert(v)
+        return run
+    return setup
+
+benchmark("mpformat/fix")(mpformat("fix"))
+benchmark("mpformat/sig")(mpformat("sig"))
+benchmark("mpformat/eng")(mpformat("eng"))
+
+@benchmark("zn/arithmetic")
+def zn_arithmetic(context):
+    a, b, c = Zn(123456789), Zn(987654321), Zn(12345)
+    def run():
+        x = a
+        for i in range(20):
+            x = (x + b)*c - a
+            x = x // c
+    return run
+
+@benchmark("rational/arithmetic")
+def rational_arithmetic(context):
+    a, b = Rational(355, 113), Rational(-22, 7)
+    def run():
+        x = a
+        for i in range(10):
+            x = x*b + a
+            x = x/b - a
+    return run
+
+@benchmark("rational/frac")
+def rational_frac(context):
+    values = [+mp.pi, +mp.e, mp.sqrt(2), mpf("0.1234567")]
+    def run():
+        for v in values:
+            Rational().frac(v)
+    return run
+
+benchmark("command/factor")(program("600851475143 factor"))
+benchmark("command/factorial")(program("300 !"))
+benchmark("stats/list")(program(
+    "{" + " ".join(str((i*7919) % 1000) for i in range(500)) + "} "
+    "dup mean swap dup median swap dup stddev swap sum"))
+
+def measure(run, repeat):
+    '''Return the best time per call of run() over repeat timings.
+    '''
+    run()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(1.2*min_time/elapsed))
+    best = elapsed/number
+    for r in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(number):
+            run()
+        best = min(best, (time.perf_counter() - start)/number)
+    return best
+
+def revision():
+    try:
+        p = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=top,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return p.stdout.decode().strip()
+    except OSError:
+        return ""
+
+def compare(results, baseline, threshold):
+    '''Print each result next to its baseline.  Return the names of the
+    benchmarks that regressed by more than threshold percent or failed.
+    '''
+    bad = []
+    old = baseline.get("benchmarks", {}) if baseline else {}
+    for name, result in sorted(results.items()):
+        if "error" in result:
+            print("%-22s  failed: %s" % (name, result["error"]))
+            bad.append(name)
+            continue
+        line = "%-22s %11.2f us" % (name, 1e6*result["seconds"])
+        before = old.get(name, {}).get("seconds")
+        if before:
+            change = 100*(result["seconds"] - before)/before
+            line += "  %11.2f us  %+7.1f%%" % (1e6*before, change)
+            if change > threshold:
+                line += "  REGRESSION"
+                bad.append(name)
+        print(line)
+    return bad
+
+def main(argv):
+    output, baseline_file, save = None, os.path.join(here, "baseline.json"), False
+    threshold, repeat, names = 10.0, 5, []
+    args = argv[1:]
+    while args:
+        arg = args.pop(0)
+        if arg in ("-o", "--output"):
+            output = args.pop(0)
+        elif arg in ("-b", "--baseline"):
+            baseline_file = args.pop(0)
+        elif arg in ("-s", "--save-baseline"):
+            save = True
+        elif arg in ("-t", "--threshold"):
+            threshold = float(args.pop(0))
+        elif arg in ("-r", "--repeat"):
+            repeat = int(args.pop(0))
+        elif arg in ("-l", "--list"):
+            for name, setup in benchmarks:
+                print(name)
+            return 0
+        elif arg.startswith("-"):
+            print(__doc__)
+            return 2
+        else:
+            names.append(arg)
+
+    config.defaults()
+    context = Context()
+    results = {}
+    for name, setup in benchmarks:
+        if names and not any(name.startswith(n) for n in names):
+            continue
+        context.clear()
+        try:
+            results[name] = {"seconds": measure(setup(context), repeat)}
+        except Exception as e:
+            results[name] = {"error": str(e) or e.__class__.__name__}
+
+    baseline = None
+    if not save and os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        print("%-22s %14s  %14s  %8s" % ("", "now", "baseline", "change"))
+    bad = compare(results, baseline, threshold)
+
+    report = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+    for path in [output] + [baseline_file]*save:
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=1, sort_keys=True)
+                f.write("\n")
+    if bad:
+        print("\n%d of %d benchmarks regressed or failed: %s" %
+              (len(bad), len(results), " ".join(bad)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
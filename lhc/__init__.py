@@ -1,12 +1,20 @@
 __all__ = [
     "hc",
+    "batch",
+    "combinatorics",
     "console",
     "constants",
     "debug",
+    "engine",
     "display",
     "mpformat",
     "numeric",
+    "primes",
+    "rsa",
+    "serve",
+    "settings",
     "si",
+    "stats",
     "stack",
     "config",
 ]
@@ -0,0 +1,140 @@
+"""
+Parallel evaluation for --batch.
+
+Every line of batch input is an independent program, so the lines can be
+spread over several processes.  The input is read lazily and cut into
+chunks of --chunk-size lines, and only a few chunks per process are in
+flight at any time, so memory use does not grow with the size of the
+input.  Each worker process keeps one Calculator, set up once with the
+configuration and C integer mode of the parent, and results are written
+in input order as soon as the chunk holding them is finished.  Every
+line starts from those settings whatever the lines before it changed, so
+the output does not depend on --jobs or --chunk-size.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import copy, itertools, multiprocessing, os
+from collections import deque
+from .settings import current
+
+nl = "\n"
+
+# Chunks queued per worker process before we wait for the oldest one
+backlog = 4
+
+# The calculator used by a worker process
+calculator = None
+
+def settings():
+    '''Return what a worker needs to evaluate the same way this process
+    does:  the configuration and the C integer mode of the active
+    settings.
+    '''
+    s = current()
+    return dict(s.cfg), s.bits, s.signed
+
+def init_worker(options, state):
+    global calculator
+    from .hc import Calculator
+    calculator = Calculator(None, options)
+    s = calculator.settings
+    s.cfg, s.bits, s.signed = state
+    calculator.ConfigChanged()
+
+def evaluate(chunk):
+    '''Evaluate a chunk, given as the number of its first line and the
+    lines.  Returns the output text, a list of (line number, message)
+    errors and whether a line asked to quit.
+    '''
+    lineno, lines = chunk
+    results = []
+    errors = []
+    for n, line in enumerate(lines, lineno):
+        try:
+            result, messages = calculator.batch_line(line)
+        except SystemExit:
+            return nl.join(results + ['']), errors, True
+        results.append(result)
+        errors += [(n, e) for e in messages]
+    return nl.join(results + ['']), errors, False
+
+def chunks(stream, size):
+    lineno = 1
+    while True:
+        lines = list(itertools.islice(stream, size))
+        if not lines:
+            return
+        yield lineno, lines
+        lineno += len(lines)
+
+def run(options, stream, out, display):
+    '''Evaluate the lines of stream on options.jobs processes and write
+    the results to out in input order.  Errors are reported through
+    display.  Returns the number of lines that had errors.
+    '''
+    jobs = options.jobs
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    size = max(1, options.chunk_size)
+    # The parent has already shown the startup messages and run the
+    # environment commands; workers get their state from settings().
+    worker_options = copy.copy(options)
+    worker_options.version = False
+    worker_options.default_config = True
+    worker_options.quiet = True
+    failed = 0
+    pending = deque()
+    with multiprocessing.Pool(jobs, init_worker,
+                              (worker_options, settings())) as pool:
+        for chunk in chunks(stream, size):
+            pending.append(pool.apply_async(evaluate, (chunk,)))
+            if len(pending) >= backlog*jobs:
+                n, quit = write(pending.popleft().get(), out, display)
+                failed += n
+                if quit:
+                    return failed
+        while pending:
+            n, quit = write(pending.popleft().get(), out, display)
+            failed += n
+            if quit:
+                break
+    return failed
+
+def write(result, out, display):
+    '''Write a finished chunk.  Returns the number of lines with errors
+    and whether to stop.
+    '''
+    text, errors, quit = result
+    out.write(text)
+    for lineno, e in errors:
+        display.err("%d: %s" % (lineno, e))
+    return len(set(lineno for lineno, e in errors)), quit
@@ -0,0 +1,350 @@
+'''
+Exact integer functions from combinatorics.
+
+    factorial(n)    n!
+    product(a, b)   a*(a + 1)*...*(b - 1)
+    comb(n, k)      the number of ways to choose k of n things
+    perm(n, k)      the number of ways to order k of n things
+    comb_mod(n, k, m, limit), perm_mod(n, k, m, limit)
+                    the same modulo m, without making large numbers
+                    when m is a prime, refusing to multiply limit or
+                    more factors
+    fibonacci(n)    the nth Fibonacci number, for any integer n
+    fibonacci_mod(n, m)
+                    the same modulo m
+    pisano(m)       the period of the Fibonacci numbers modulo m
+    fibonaccis(n)   the list of the first n Fibonacci numbers
+
+Factorials are kept in a cache shared by every calculator, dropping the
+least recently used ones once they take more than cache_bytes; a
+factorial too large for the cache isn't kept.  A factorial not in the
+cache is made from the largest smaller one in it if that is close
+enough, and otherwise by math.factorial, which multiplies the odd parts
+by binary splitting.
+
+comb and perm multiply only the factors that don't cancel, so they
+never make a factorial.  comb_mod with a prime modulus uses Lucas'
+theorem, which needs the binomials of the base m digits of n and k.
+
+Fibonacci numbers are found by fast doubling, from
+F(2k) = F(k)*(2*F(k+1) - F(k)) and F(2k+1) = F(k)**2 + F(k+1)**2, in
+about log2(n) steps.  Modulo m, an index past the Pisano period is
+first reduced by it.  The period is found from the prime factors of m
+and kept.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import bisect
+import math
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from . import primes
+
+# The most memory the cached factorials may take
+cache_bytes = 1 << 24
+
+# Factorials below this are quicker to make than to look up
+cache_min = 256
+
+# A factorial is made from a cached smaller one k! when n - k is no more
+# than n//extend_ratio
+extend_ratio = 4
+
+# Runs of fewer numbers than this are multiplied in a loop
+product_leaf = 32
+
+# The Pisano period is used for moduli below this; above it, factoring
+# the modulus may take longer than the index saves
+pisano_limit = 1 << 64
+
+# n -> n!, least recently used first, with the sorted list of the n
+_factorials = OrderedDict()
+_cached = []
+_cached_bytes = 0
+_lock = threading.Lock()
+
+def product(a, b):
+    '''Return the product of the integers from a up to but not
+    including b, multiplying the halves separately so the large
+    multiplications are of numbers the same size.
+    '''
+    if b - a <= product_leaf:
+        return math.prod(range(a, b))
+    m = (a + b)//2
+    return product(a, m)*product(m, b)
+
+def _remember(n, f):
+    '''Add f = n! to the cache, dropping the least recently used
+    factorials to make room.
+    '''
+    global _cached_bytes
+    size = sys.getsizeof(f)
+    if size > cache_bytes:
+        return
+    with _lock:
+        if n in _factorials:
+            return
+        while _cached_bytes + size > cache_bytes:
+            k, old = _factorials.popitem(last=False)
+            del _cached[bisect.bisect_left(_cached, k)]
+            _cached_bytes -= sys.getsizeof(old)
+        _factorials[n] = f
+        bisect.insort(_cached, n)
+        _cached_bytes += size
+
+def factorial(n):
+    '''Return n! for the integer n >= 0.
+    '''
+    if n < 0:
+        raise ValueError("Factorial of a negative number")
+    if n < cache_min:
+        return math.factorial(n)
+    with _lock:
+        f = _factorials.get(n)
+        if f is not None:
+            _factorials.move_to_end(n)
+            return f
+        i = bisect.bisect_left(_cached, n)
+        k = _cached[i - 1] if i else 0
+        if n - k <= n//extend_ratio:
+            f = _factorials[k]
+            _factorials.move_to_end(k)
+    if f is None:
+        f = math.factorial(n)
+    else:
+        f *= product(k + 1, n + 1)
+    _remember(n, f)
+    return f
+
+def comb(n, k):
+    '''Return the binomial coefficient n choose k for the integers
+    n, k >= 0; it is 0 for k > n.
+    '''
+    return math.comb(n, k)
+
+def perm(n, k):
+    '''Return n!/(n - k)! for the integers n, k >= 0; it is 0 for k > n.
+    '''
+    return math.perm(n, k)
+
+def _comb_digit(n, k, p):
+    'Return n choose k modulo the prime p, for 0 <= k <= n < p.'
+    k = min(k, n - k)
+    num = den = 1
+    for i in range(k):
+        num = num*(n - i) % p
+        den = den*(i + 1) % p
+    return num*pow(den, -1, p) % p
+
+def _check_factors(factors, limit):
+    'Raise ValueError if limit is not zero and factors is not below it.'
+    if limit and factors >= limit:
+        raise ValueError("%d factors are too many for the limit of %d" %
+                         (factors, limit))
+
+def comb_mod(n, k, m, limit=0):
+    '''Return n choose k modulo m, for the integers n, k >= 0 and
+    |m| > 1.  When |m| is a prime, no number larger than m*m is made.
+    ValueError is raised if that takes limit or more factors, unless
+    limit is zero.
+    '''
+    p = abs(m)
+    if k > n:
+        return 0
+    if not primes.isprime(p):
+        _check_factors(min(k, n - k), limit)
+        return math.comb(n, k) % m
+    digits = []
+    while k:
+        n, ni = divmod(n, p)
+        k, ki = divmod(k, p)
+        if ki > ni:
+            return 0
+        digits.append((ni, ki))
+    _check_factors(sum(min(ki, ni - ki) for ni, ki in digits), limit)
+    r = 1
+    for ni, ki in digits:
+        r = r*_comb_digit(ni, ki, p) % p
+    return r % m
+
+def perm_mod(n, k, m, limit=0):
+    '''Return n!/(n - k)! modulo m, for the integers n, k >= 0 and
+    |m| > 1, multiplying modulo m.  ValueError is raised if that takes
+    limit or more factors, unless limit is zero.
+    '''
+    if k > n or k >= abs(m):
+        # Any |m| consecutive integers include a multiple of m
+        return 0
+    _check_factors(k, limit)
+    r = 1 % m
+    for i in range(n - k + 1, n + 1):
+        r = r*i % m
+    return r
+
+def _fibonacci_pair(n, m=0):
+    '''Return F(n), F(n + 1) for the integer n >= 0, modulo m if m isn't
+    zero.
+    '''
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a*(2*b - a)
+        d = a*a + b*b
+        if m:
+            c %= m
+            d %= m
+        if bit == "1":
+            a, b = d, c + d
+            if m:
+                b %= m
+        else:
+            a, b = c, d
+    return a, b
+
+def fibonacci(n):
+    '''Return the nth Fibonacci number for the integer n; for a negative
+    n, F(n) = (-1)**(n + 1)*F(-n).
+    '''
+    f = _fibonacci_pair(abs(n))[0]
+    if n < 0 and n % 2 == 0:
+        return -f
+    return f
+
+def _powers(factors):
+    'Return the list of (p, k) for the sorted prime factors.'
+    result = []
+    for p in factors:
+        if result and result[-1][0] == p:
+            result[-1][1] += 1
+        else:
+            result.append([p, 1])
+    return result
+
+@lru_cache(maxsize=64)
+def pisano(m):
+    '''Return the period of the Fibonacci numbers modulo the integer
+    m > 1.  The period for a prime p divides p - 1 or 2*(p + 1), that
+    for p**k divides p**(k - 1) times that for p, and that for m is the
+    lcm of those for its prime powers; this starts from the multiple
+    and takes out each prime factor while F(n), F(n + 1) is still 0, 1.
+    '''
+    period = 1
+    for p, k in _powers(primes.factor(m)):
+        if p == 2:
+            d = 3
+        elif p == 5:
+            d = 20
+        elif p % 10 in (1, 9):
+            d = p - 1
+        else:
+            d = 2*(p + 1)
+        d *= p**(k - 1)
+        period = period*d//math.gcd(period, d)
+    for q, k in _powers(primes.factor(period)):
+        for i in range(k):
+            if _fibonacci_pair(period//q, m) != (0, 1):
+                break
+            period //= q
+    return period
+
+def fibonacci_mod(n, m):
+    '''Return the nth Fibonacci number modulo m, for the integer n and
+    |m| > 1.
+    '''
+    p = abs(m)
+    i = abs(n)
+    if i >= p and p < pisano_limit:
+        i %= pisano(p)
+    f = _fibonacci_pair(i, p)[0]
+    if n < 0 and n % 2 == 0:
+        f = -f
+    return f % m
+
+def fibonaccis(n, m=0):
+    '''Return the list of F(0) through F(n - 1), modulo m if m isn't
+    zero.
+    '''
+    result = []
+    a, b = 0, 1
+    for i in range(n):
+        result.append(a % m if m else a)
+        a, b = b, a + b
+        if m:
+            b %= m
+    return result
+
+if __name__ == "__main__":
+    assert product(5, 5) == 1 and product(1, 200) == math.factorial(199)
+    assert all(factorial(n) == math.factorial(n) for n in range(300))
+    assert factorial(5000) == math.factorial(5000)
+    assert factorial(5100) == math.factorial(5100) and 5000 in _factorials
+    cache_bytes = sys.getsizeof(factorial(5100))*3
+    for n in range(6000, 9000, 500):
+        assert factorial(n) == math.factorial(n)
+    assert _cached_bytes <= cache_bytes and _cached == sorted(_factorials)
+    assert _cached_bytes == sum(sys.getsizeof(f) for f in _factorials.values())
+    for m in (2, 3, 7, 13, 97, 100, -7, 10**9 + 7):
+        for n in range(0, 120, 7):
+            for k in range(0, 130, 11):
+                assert comb_mod(n, k, m) == comb(n, k) % m
+                assert perm_mod(n, k, m) == perm(n, k) % m
+    n, k = 3*10007 + 5, 2*10007 + 3
+    assert comb_mod(n, k, 10007) == comb(n, k) % 10007 == 30
+    assert comb_mod(n, k, 10007, 7) == 30
+    assert perm_mod(99, 5, 97, 6) == perm(99, 5) % 97
+    for f, args in ((perm_mod, (10**12, 10**6, 10**9 + 7, 1000)),
+                    (comb_mod, (10**12, 10**6, 10**9 + 7, 1000)),
+                    (comb_mod, (10**12, 10**6, 10**9, 1000))):
+        try:
+            f(*args)
+            raise AssertionError("%s over its limit" % f.__name__)
+        except ValueError:
+            pass
+    assert comb(5, 7) == perm(5, 7) == 0 and comb(1000000, 3) == 166666166667000000
+    f = fibonaccis(300)
+    assert f[:8] == [0, 1, 1, 2, 3, 5, 8, 13] and fibonaccis(0) == []
+    assert all(fibonacci(n) == f[n] for n in range(300))
+    assert [fibonacci(-n) for n in range(6)] == [0, 1, -1, 2, -3, 5]
+    assert fibonaccis(20, 7) == [x % 7 for x in f[:20]]
+    assert [pisano(m) for m in range(2, 13)] == [3, 8, 6, 20, 24, 16, 12, 24, 60, 10, 24]
+    assert pisano(10**9 + 7) == 2000000016 and pisano(2**16) == 3 << 15
+    for m in (2, 10, 97, 144, 1000, -13, 10**9 + 7):
+        for n in range(-40, 300, 3):
+            assert fibonacci_mod(n, m) == fibonacci(n) % m
+    assert fibonacci_mod(10**100, 1000) == fibonacci(10**100 % 1500) % 1000
+    try:
+        factorial(-1)
+        raise AssertionError("factorial(-1)")
+    except ValueError:
+        pass
+    exit(0)
@@ -49,7 +49,7 @@ defcfg = {
     # an mpf or mpc.  Set to zero if you want all factorials to be
     # calculated exactly (warning:  this can result in long calculation
     # times and lots of digits being printed).
-    "factorial_limit" : 20001,
+    "factorial_limit" : 100001,
 
     # The following string is used to separate commands on the command
     # input.  If this string is not in the command line, the command is
@@ -136,8 +136,16 @@ defcfg = {
     "helper_scripts" : "d:/p/math/hcpy/helpers",
     "helper_script_function_name" : "main",
 }
+# The loaded configuration.  Calculators start from a copy of it and
+# keep their own; see settings.Settings.
 cfg = {}
 
+def defaults():
+    '''Use the default configuration without reading the user's file.
+    '''
+    global cfg
+    cfg = dict(defcfg)
+
 def load():
     global cfg
     global defcfg
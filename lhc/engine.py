@@ -0,0 +1,190 @@
+'''
+Evaluate hc programs from other Python code.
+
+    from lhc import engine
+    context = engine.Context()
+    context.run_program("2 3 + 4 *")   # -> [Zn(20)]
+
+A Context is a calculator without the interactive parts:  it doesn't
+read the user's configuration or readline history, create files, set
+the terminal title or register exit handlers.  Messages that commands
+send to the display are collected in Context.messages instead of being
+written.  The CODATA constants are parsed once and shared by all
+contexts, so contexts are cheap enough to create per request, and one
+context can be reused for any number of evaluations.
+
+Each context has its own settings (see lhc.settings):  the integer
+mode, precision, display format, etc. start as the loaded configuration
+(the defaults if none has been loaded) and what a program changes stays
+with the context.  Contexts can evaluate in different threads at once
+once lhc.settings.threaded() has been called, but one context must not
+be used by two threads at a time.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import io
+from . import config
+from .display import Display
+from .hc import Calculator
+from .settings import Settings
+
+class EvaluationError(Exception):
+    '''Raised by Context.run_program() when any part of a program failed.
+    errors is the list of messages and values is the stack as it was
+    left.
+    '''
+    def __init__(self, errors, values):
+        Exception.__init__(self, "; ".join(errors))
+        self.errors = errors
+        self.values = values
+
+class Messages(Display):
+    '''A Display that keeps messages in a list instead of writing them.
+    '''
+    def __init__(self):
+        Display.__init__(self)
+        self.messages = []
+
+    def msg(self, string, suppress_nl=False):
+        if self.enabled == True:
+            self.messages.append(string)
+            self.log(string, suppress_nl)
+
+    def err(self, string, suppress_nl=False):
+        self.messages.append(string)
+        self.log(string, suppress_nl)
+
+class Context(Calculator):
+    '''A calculator for evaluating programs given as strings.  The stack
+    and registers persist from one evaluation to the next until clear()
+    is called.
+    '''
+    def __init__(self):
+        if not config.cfg:
+            config.defaults()
+        self.setup(Messages())
+        self.process_stdin = True
+        self.ConfigChanged()
+
+    @property
+    def messages(self):
+        'Messages sent to the display by the last evaluation.'
+        return self.display.messages
+
+    def run_program(self, program):
+        '''Run program, which may have several lines, against the stack.
+        Returns the values on the stack, x last.  Raises EvaluationError
+        if anything in the program failed.
+        '''
+        self.errors = []
+        self.display.messages = []
+        try:
+            with self.settings:
+                for line in program.splitlines():
+                    self.evaluate(self.strip_comment(line))
+        except SystemExit:
+            self.errors.append("quit is not available")
+        except Exception as e:
+            self.errors.append(str(e) or e.__class__.__name__)
+        if self.errors:
+            raise EvaluationError(self.errors, self.values())
+        return self.values()
+
+    def values(self):
+        'Return the values on the stack, x last.'
+        return list(self.stack.stack)
+
+    def format(self, value):
+        'Return value formatted as the calculator would display it.'
+        with self.settings:
+            return self.Format(value).strip()
+
+    def clear(self):
+        'Empty the stack and the registers.'
+        self.stack.clear_stack()
+        self.registers = {}
+
+    def reset(self):
+        '''Empty the stack and the registers and go back to the loaded
+        configuration, as a new context would start.
+        '''
+        self.clear()
+        self.settings = Settings()
+        self.compiled.cache_clear()
+        self.ConfigChanged()
+
+if __name__ == "__main__":
+    context = Context()
+    assert context.run_program("2 3 + 4 *") == [20]
+    assert context.format(context.run_program("1 2 /")[-1]) == "0.5"
+    context.clear()
+    try:
+        context.run_program("1 +")
+        assert False
+    except EvaluationError as e:
+        assert e.values == [1]
+    assert [context.format(v) for v in context.run_program("2 sqrt")]
+    # Settings changed by one context don't affect another
+    other = Context()
+    other.run_program("50 prec hex u8")
+    assert other.format(other.run_program("255 1 +")[-1]) == "0x56"
+    assert context.format(context.run_program("clr 255 1 +")[-1]) == "256"
+    assert len(other.format(other.run_program("2 sqrt")[-1])) > \
+           len(context.format(context.run_program("2 sqrt")[-1]))
+    dates = Context()
+    dates.run_program("ivc")
+    context.run_program("iva")
+    date = "2451545 2451545.5 iv T"
+    assert dates.format(dates.run_program(date)[-1]) == \
+           "<<1 Jan 2000 12:00, 2 Jan 2000>>"
+    assert context.format(context.run_program(date)[-1]) == \
+           "1 Jan 2000 18:00 +- 6.00 hours"
+    # In modulo mode y x - is y - x and y x / multiplies by the inverse
+    modular = Context()
+    for program, x in (("-13 modulo 3 5 -", "-2"), ("7 modulo 5 3 -", "2"),
+                       ("7 modulo 3 5 /", "2"), ("7 modulo 3 -1 ^", "5")):
+        modular.clear()
+        assert modular.format(modular.run_program(program)[-1]) == x
+    try:
+        modular.run_program("8 modulo 3 4 /")
+        assert False
+    except EvaluationError as e:
+        assert e.errors == ["4 has no inverse modulo 8"]
+    # The Calculator methods still work on a context
+    assert context.batch_line("2 3 + # sum") == ("5", [])
+    # An empty List or Vector doesn't read the lines after it
+    out = io.StringIO()
+    assert context.batch(io.StringIO("{}\n1 2 +\n[]\n{} mean\n5\n"), out) == 1
+    assert out.getvalue().split("\n") == ["{  }", "3", "[  ]", "{  }", "5", ""]
+    other.reset()
+    assert other.values() == [] and other.format(other.run_program("255 1 +")[-1]) == "256"
+    exit(0)
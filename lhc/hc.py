@@ -37,30 +37,28 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 # Python library stuff
 
 import builtins
-import sys, getopt, os, time, readline
-from socket import htonl
+import functools
+import itertools
+import sys, os, time
 from atexit import register as atexit
-import traceback
 import re as regex
-from tempfile import mkstemp
 from .debug import *
 from . import config
 
-try: from pdb import xx  # pdb.set_trace is xx; easy to find for debugging
-except: pass
+# Startup time matters (hc is often run once per calculation), so modules
+# that only some commands need (readline, socket, traceback) are imported
+# where they are used.  For debugging:  from pdb import set_trace as xx
 
 #----------------------------------
 # Modules we are dependent on
 try:
     import mpmath as m
-    from simpleparse.stt import TextTools
-    from simpleparse import generator
 except ImportError:
     print("""
 This is a complex program that requires several external python
-libraries.  Please install mpmath, simpleparse
+libraries.  Please install mpmath
 
-apt-get install python3-mpmath python3-simpleparse python3-simpleparse-mxtexttools
+apt-get install python3-mpmath
 
 """)
     sys.exit(1)
@@ -70,7 +68,7 @@ apt-get install python3-mpmath python3-simpleparse python3-simpleparse-mxtexttoo
 from .numeric import *
 from .stack import Stack
 from .mpformat import mpFormat
-from . import constants
+from .settings import Settings
 from . import console
 
 # You may create your own display (GUI, curses, etc.) by derivation.  The
@@ -99,289 +97,153 @@ def nop(*args):
     """
     return None
 
+def isiterable(obj):
+    return getattr(obj, '__iter__', False)
+
+class Command(object):
+    '''What the calculator knows about a command:  the name of the
+    Calculator method implementing it, its names, how many stack
+    arguments it takes and its help text.
+
+    arity is the number of arguments popped off the stack, or 'x' if x
+    says how many (a List in x is used as the arguments).  A command
+    with a pattern is used for any token the regular expression fully
+    matches; the groups are passed as arguments, preceded by values
+    popped off the stack until there are args of them.  Its names are
+    only shown by help, not looked up or completed.  A command with
+    rest_of_line gets the rest of the input line as its last argument.
+    '''
+    def __init__(self, method, name, arity=0, aliases=(), pattern=None,
+                 args=0, rest_of_line=False, help=None):
+        self.method = method
+        self.name = name
+        self.names = [name] + list(aliases)
+        self.arity = arity
+        self.pattern = pattern and regex.compile(pattern)
+        self.args = args
+        self.rest_of_line = rest_of_line
+        self.help = help
+
+# The calculator commands by name and alias, except those with a pattern,
+# which are kept apart
+command_table = {}
+command_patterns = []
+
+def command(name, arity=0, aliases=(), pattern=None, args=0, rest_of_line=False):
+    '''Decorator that registers a Calculator method as a command; see
+    Command for the arguments.  Instances bind the method when the
+    command is used.
+    '''
+    def register(method):
+        cmd = Command(method.__name__, name, arity, aliases, pattern, args,
+                      rest_of_line, method.__doc__)
+        if pattern:
+            command_patterns.append(cmd)
+        else:
+            for n in cmd.names:
+                command_table[n] = cmd
+        return method
+    return register
+
 
 class Calculator(object):
+    # The commands, shared by all instances; see command()
+    commands = command_table
+    patterns = command_patterns
+
+    # Number of distinct lines whose compiled form is kept
+    compile_cache_size = 1024
+
+    # The CODATA constants, parsed on first use and shared by all
+    # calculators
+    parsed_constants = None
+
+    @property
+    def cfg(self):
+        '''The calculator's configuration, from its settings.'''
+        return self.settings.cfg
+
     def __init__(self, arguments, options):
         if options.debug:
             debug(1)
+        # Neither batch nor serve mode is interactive
+        self.batch_mode = options.batch is not None or options.serve is not None
+        if self.batch_mode:
+            # stdout carries nothing but results in batch mode
+            self.setup(Display(out_stream=sys.stderr))
+        else:
+            self.setup(Display())   # Used to display messages to user
+        # This calculator has the thread to itself
+        self.settings.activate()
+        # set up readline stuff
+        # check for dir and file
+        try:
+            os.makedirs(os.path.expanduser('~')+'/.config/hc')
+        except OSError:
+            pass
+        if not self.batch_mode:
+            import readline     # line editing and history for input()
+            if hasattr(readline, "read_history_file"):
+                try:
+                    readline.read_history_file(os.path.expanduser('~')+'/.config/hc/history')
+                except IOError:
+                    pass
+                atexit(self.cleanup)
+            if hasattr(readline, "set_completer"):
+                readline.set_completer(self.complete)
+                readline.parse_and_bind("tab: complete")
+
+        self.process_stdin = not sys.stdin.isatty()
+        self.run_checks = False      # -c Run checks
+        self.quiet = options.quiet   # -q If true, don't print initial message
+        self.use_default_config_only = options.default_config
+
+        self.RunChecks()
+        config.load()
+        self.settings.cfg = dict(config.cfg)
+        self.CheckEnvironment()
+        self.GetConfiguration()
+
+        if options.default_config and not self.quiet:
+            self.display.msg("Using default configuration only")
+        if options.version:
+            self.display.msg("hc version 7 (29 Mar 2012)")
+        if not self.process_stdin and not self.batch_mode and \
+                builtins.type(self.cfg['console_title']) is str:
+            console.set_title(self.cfg['console_title'])
+
+    def setup(self, display):
+        '''Create what is needed to evaluate input:  the settings, stack,
+        registers, number formatting and parsing and the command table.  This does no
+        terminal or file I/O.
+        '''
         self.errors = []
+        self.settings = Settings()
         self.stack = Stack()
         self.stack_index = True
-        self.constants = constants.ParseRawData()
-        self.display = Display()     # Used to display messages to user
+        self.display = display
         self.fp = mpFormat()         # For formatting floating point numbers
         self.ap = mpFormat()         # For formatting arguments of complex numbers
         self.number = Number(self.get_next_token)
         self.registers = {}          # Keeps all stored registers
-        self.split_on = regex.compile('(\?<=|>=|!=|==|<<|>>|[-\+\*/%^&|~<>\r\n\t ])')
-        self.commands_dict = {
-            # Values are
-            # [
-            #   implementation function to call,
-            #   number of stack arguments consumed,
-            #   Optional dictionary of other needed things, such as:
-            #       "pre" : [func, (args,)]  Function to execute before calling
-            #                                the implementation function.
-            #       "post": [func, (args,)]  Function to execute after calling
-            #                                the implementation function.
-            # ]
-
-            # Binary functions
-            "+"        : [self.add, 2],
-            "-"        : [self.subtract, 2],
-            "*"        : [self.multiply, 2],
-            "/"        : [self.divide, 2],
-            "div"      : [self.integer_divide, 2],
-            "%"        : [self.Mod, 2],
-            "mod"      : [self.Mod, 2],
-            "and"      : [self.bit_and, 2],
-            "&"        : [self.bit_and, 2],
-            "or"       : [self.bit_or, 2],
-            "|"        : [self.bit_or, 2],
-            "xor"      : [self.bit_xor, 2],
-            "<<"       : [self.bit_leftshift, 2],
-            ">>"       : [self.bit_rightshift, 2],
-            "%ch"      : [self.percent_change, 2],
-            "comb"     : [self.combination, 2],    # Combinations of y choose x
-            "perm"     : [self.permutation, 2],    # Permutations of y choose x
-            "pow"      : [self.power, 2],  # Raise y to the power of x
-            "^"        : [self.power, 2],  # Raise y to the power of x
-            "atan2"    : [self.atan2, 2], # {"post" : self.Conv2Deg}], #
-            "hypot"    : [self.hypot, 2],  # sqrt(x*x + y*y)
-            "round"    : [self.Round, 2],  # Round y to nearest x
-            "in"       : [self.In, 2],     # True if x is in interval y
-            "=="       : [self.Equal, 2],     # True if x == y
-            "!="       : [self.NotEqual, 2],  # True if x != y
-            "<"        : [self.LessThan, 2],  # True if x < y
-            "<="       : [self.LessThanEqual, 2], # True if x <= y
-            ">"        : [self.GreaterThan, 2],      # True if x > y
-            ">="       : [self.GreaterThanEqual, 2], # True if x >= y
-            "="        : [self.DisplayEqual, 2],  # True if displayed strings of x & y are equal
-            "iv"       : [self.ToIV, 2],   # Convert to [y,x] interval number
-            "gcf"      : [self.gcf, 2],  # find the greatest common factor
-            "lcd"      : [self.lcd, 2],  # find the lowest common denominator
-            "rsa_info" : [self.rsa_info, 0],  # print rsa info
-            "modinv"   : [self.modinv, 2],  # find the multiplicative modular inverse
-
-            # Unary functions
-            "factor"   : [self.factor, 1],  # return a list of factors of x
-            "fib"      : [self.fibonacci, 1], # return fibonacci sequence for x
-            "I"        : [self.Cast_i, 1],  # Convert to integer
-            "Q"        : [self.Cast_q, 1],  # Convert to rational at display resolution
-            "QQ"       : [self.Cast_qq, 1], # Convert to rational at full precision
-            "R"        : [self.Cast_r, 1],  # Convert to real number
-            "C"        : [self.Cast_c, 1],  # Convert to complex number
-            "T"        : [self.Cast_t, 1],  # Convert to time/date
-            "V"        : [self.Cast_v, 1],  # Convert to interval number
-            "cast"     : [self.cast, 1],  # Convert integer to current C int type
-            "IP"       : [self.IP, 1],  # Convert to ip address
-            "2deg"     : [self.ToDegrees, 1],  # Convert x to radians
-            "2rad"     : [self.ToRadians, 1],  # Convert x to degrees
-            "unix"     : [self.ToUnix, 1],  # Convert julian to unix timestamp
-            "julian"   : [self.ToJulian, 1], # Convert unix timestamp to julian
-            "2hr"      : [self.hr, 1],    # Convert to decimal hour format
-            "2hms"     : [self.hms, 1],   # Convert to hour/minute/second format
-            "fp"       : [self.first_part, 1],    # Integer part of x
-            "sp"       : [self.second_part, 1],    # Fractional part of x
-
-            "inv"      : [self.reciprocal, 1], # reciprocal of x
-            "~"        : [self.bit_negate, 1],   # Flip all the bits of x
-            "split"    : [self.split, 1], # Take rational, complex, or interval apart
-            "chop"     : [self.Chop, 1],  # Convert x to its displayed value
-            "conj"     : [self.conj, 1],  # Complex conjugate of x
-            "sqrt"     : [self.sqrt, 1],  # Square root of x
-            "cbrt"     : [self.cbrt, 1],  # Cube root of x
-            "root"     : [self.root, 2],  # nth root of x
-            "roots"    : [self.roots, 2],  # nth roots of x
-            "sqr"      : [self.square, 1],# Square x
-            "neg"      : [self.negate, 1], # negative of x
-            "mid"      : [self.mid, 1],   # Take midpoint of interval number
-            "sum"      : [self.sum, 'x'],  # sum of top x values (depth sum for all)
-            "!"        : [self.Factorial, 1],  # factorial
-            "floor"    : [self.floor, 1], # Largest integer <= x
-            "ceil"     : [self.ceil, 1],  # Smallest integer >= x
-            "abs"      : [self.abs, 1],   # Absolute value of x
-            "arg"      : [self.arg, 1],# {"post" : Conv2Deg}],  # Argument of complex
-            "ln"       : [self.ln, 1],    # Natural logarithm
-            "log2"     : [self.log2, 1],     # Base 2 logarithm
-            "log"      : [self.log10, 1], # Base 10 logarithm
-            "exp"      : [self.exp, 1], # Exponential function
-            "bits"     : [self.bits, 1], # calculate the number of bits required for this integer
-            "db"       : [self.db, 1], # take a number in db and express it as a std ratio
-            "bd"       : [self.bd, 1], # take a ratio and express it in db
-            self.store.__name__: [self.store, 'match',
-                            {
-                                'regex': regex.compile(r"=@([a-zA-Z])"),
-                                'grammar': "('=@',[a-zA-Z])",
-                                'args': 2,
-                            }, ], # store register
-
-            # 0-nary functions
-            "rand"     : [self.rand, 0],  # Uniform random number
-            "ts"       : [self.unix_ts, 0], # return unix timestamp
-            self.recall.__name__: [self.recall, 'match',
-                            {
-                                'regex': regex.compile(r"@([a-zA-Z])"),
-                                'grammar': "('@',[a-zA-Z])",
-                            }, ], # recall register
-
-            # trig functions
-            "sin"      : [self.sin, 1],   # {"pre"  : self.Conv2Rad}],
-            "cos"      : [self.cos, 1],   # {"pre"  : self.Conv2Rad}],
-            "tan"      : [self.tan, 1],   # {"pre"  : self.Conv2Rad}],
-            "asin"     : [self.asin, 1],  # {"post" : self.Conv2Deg}],
-            "acos"     : [self.acos, 1],  # {"post" : self.Conv2Deg}],
-            "atan"     : [self.atan, 1],  # {"post" : self.Conv2Deg}],
-            "sec"      : [self.sec, 1],   # {"pre"  : self.Conv2Rad}],
-            "csc"      : [self.csc, 1],   # {"pre"  : self.Conv2Rad}],
-            "cot"      : [self.cot, 1],   # {"pre"  : self.Conv2Rad}],
-            "asec"     : [self.asec, 1],  # {"post" : self.Conv2Deg}],
-            "acsc"     : [self.acsc, 1],  # {"post" : self.Conv2Deg}],
-            "acot"     : [self.acot, 1],  # {"post" : self.Conv2Deg}],
-            "sinh"     : [self.sinh, 1],  # {"pre"  : self.Conv2Rad}],
-            "cosh"     : [self.cosh, 1],  # {"pre"  : self.Conv2Rad}],
-            "tanh"     : [self.tanh, 1],  # {"pre"  : self.Conv2Rad}],
-            "asinh"    : [self.asinh, 1], # {"post" : self.Conv2Deg}],
-            "acosh"    : [self.acosh, 1], # {"post" : self.Conv2Deg}],
-            "atanh"    : [self.atanh, 1], # {"post" : self.Conv2Deg}],
-            "sech"     : [self.sech, 1],  # {"pre"  : self.Conv2Rad}],
-            "csch"     : [self.csch, 1],  # {"pre"  : self.Conv2Rad}],
-            "coth"     : [self.coth, 1],  # {"pre"  : self.Conv2Rad}],
-            "asech"    : [self.asech, 1], # {"post" : self.Conv2Deg}],
-            "acsch"    : [self.acsch, 1], # {"post" : self.Conv2Deg}],
-            "acoth"    : [self.acoth, 1], # {"post" : self.Conv2Deg}],
-
-            # statistics functions
-            "stddev"   : [self.stddev, 1],  # take std deviation of a set
-            "mean"     : [self.mean, 1],    # return mean of a set
-            "median"   : [self.median, 1],  # return median of a set
-            "min"      : [self.minimum, 1],  # return minimum of a set
-            "max"      : [self.maximum, 1],  # return maximum of a set
-            "range"    : [self.Range, 1],  # return the range of a set as an interval
-            "sort"     : [self.sort, 1],  # return a sorted set
-
-            # Stack functions
-            "clr"      : [self.ClearStack, 0],
-            "clear"    : [self.Reset, 0], # Reset the calculator state
-            "stack"    : [self.SetStackDisplay, 1],
-            "lastx"    : [self.lastx, 0], # Recall last x used
-            "swap"     : [self.swap, 0],   # swap x and y
-            "roll"     : [self.roll, 0],  # Roll stack
-            "rolld"    : [self.rolld, 0],  # Roll stack down
-            "over"     : [self.over, 0],  # push y onto the stack at the top
-            "pick"     : [self.pick, 1],  # pick stack[x] off the stack and push it at the top
-            "drop"     : [self.drop, 1],   # Pop x off the stack
-            "drop2"    : [self.drop2, 2],   # Pop x and y off the stack
-            "dropn"    : [self.dropn, 'x'],   # Pop x items off the stack
-            "dup"      : [self.dup, 1],   # Push a copy of x onto the stack
-            "dup2"     : [self.dup2, 2],   # Push a copy of x and y onto the stack
-            "dupn"     : [self.dupn, 'x'],  # duplicate top x values on stack
-            "depth"    : [self.depth, 0],  # Push stack depth onto stack
-
-            # constants
-            "phi"      : [self.Phi, 0],   # Golden ratio
-            "pi"       : [self.Pi, 0],
-            "e"        : [self.E, 0],
-            "const"    : [self.const, 0],  # grab a list of constants
-
-            # network functions
-            # same net - 3 args -- 2 ips and a netmask
-            # broadcast - 2 args - ip and a netmask
-            "netmask"  : [self.netmask, 2],  # apply a given netmask to an ip address
-            "cidr"     : [self.cidr, 2],  # apply a given netmask to an ip address
-            # net match
-            "le"       : [nop, 0],  # set little-endian integer mode
-            "be"       : [nop, 0],  # set big-endian integer mode
-            "htonl"    : [self.ntohl, 1],  # return htonl x
-            "ntohl"    : [self.ntohl, 1],  # return ntohl x
-            "=net"     : [self.samenet, 2],  # check to see if y and x are on the same subnet
-
-            # Other stuff
-            self.help.__name__: [self.help, 'match',
-                            {
-                                'regex': regex.compile(r"(?:help|[?])\s+(.+)?"),
-                                'grammar': "(('?' / 'help'),(ws,([_a-zA-Z0-9]+ / delimited_func))?)",
-                            }, ], # help
-            "warranty" : [self.warranty, 0],  # Show warranty
-            "quit"     : [self.quit, 0],  # Exit the program
-            "deg"      : [self.deg, 0],  # Set degrees for angle mode
-            "rad"      : [self.rad, 0],  # Set radians for angle mode
-            "regs"     : [self.PrintRegisters, 0],
-            "cfg"      : [self.ShowConfig, 0], # Show configuration
-            "modulo"   : [self.Modulus, 1], # All answers displayed with this modulus
-            "clrg"     : [self.ClearRegisters, 0],
-            ">>."      : [self.display.logoff, 0],  # Turn off logging
-
-            # Display functions
-            "mixed"    : [self.mixed, 1], # Toggle mixed fraction display
-            "rat"      : [self.Rationals, 1], # Toggle whether to use rationals
-            "down"     : [self.ToggleDowncasting, 1],
-            "on"       : [self.display.on, 0],  # Turn display of answers on
-            "off"      : [self.display.off, 0],  # Turn display of answers off
-            "prec"     : [self.Prec, 1],  # Set calculation precision
-            "digits"   : [self.digits, 1],# Set significant figures for display
-            "width"    : [self.width, 1], # Set line width
-            "comma"    : [self.comma, 1], # Toggle comma decorating
-            "fix"      : [self.fix, 0],  # Fixed number of places after decimal point
-            "sig"      : [self.sig, 0],  # Display signification figures
-            "sci"      : [self.sci, 0],  # Scientific notation display
-            "eng"      : [self.eng, 0],  # Engineering display
-            "engsi"    : [self.engsi, 0],  # Engineering display with SI prefix
-            "raw"      : [self.raw, 0],  # raw fp mode
-            "brief"    : [self.brief, 1],  # Fit number on one line
-            "iva"      : [self.iva, 0],  # Interval display
-            "ivb"      : [self.ivb, 0],  # Interval display
-            "ivc"      : [self.ivc, 0],  # Interval display
-            "show"     : [self.Show, 0],  # Show full precision of x register
-            "debug"    : [self.Debug, 1], # Toggle the debug variable
-            # angle modes
-            "polar"    : [self.Polar, 0],  # Complex number display
-            "rect"     : [self.Rectangular, 0],  # Complex number display
-            # integer modes
-            "sx"       : [self.C_sX, 1],  # Unsigned n-bit integer mode
-            "ux"       : [self.C_uX, 1],  # Signed n-bit integer mode
-            self.C_int.__name__: [self.C_int, 'match',
-                            {
-                                'regex': regex.compile(r"([su])([0-9]+)"),
-                                'grammar': "([su],[0-9]+)"
-                            }, ], # c int u32 style
-            "dec"      : [self.dec, 0],  # Decimal display for integers
-            "hex"      : [self.hex, 0],  # Hex display for integers
-            "oct"      : [self.oct, 0],  # Octal for integers
-            "bin"      : [self.bin, 0],  # Binary display for integers
-            "roman"    : [self.roman, 0],  # roman numeral display for integers
-            # The none display mode is primarily intended for debugging.  It
-            # displays makes the mpmath numbers display in their native formats.
-
-            # Some other math functions
-            "gamma"    : [self.gamma, 1],
-            "zeta"     : [self.zeta, 1],
-            "ncdf"     : [self.Ncdf, 1],
-            "invn"     : [self.Incdf, 1],
-
-        }
-        self.commands_dict['?'] = self.commands_dict['help']
+        # Whether commands may read files named in their input; the
+        # server turns this off
+        self.file_access = True
+        # Settings every batch line starts from, saved by the first one
+        self.batch_state = None
+        # Used by get_next_token to split lines into tokens
+        self.lex_space = regex.compile(r"\s*")
+        self.lex_operator = regex.compile(r"<<|>>|<=|>=|!=|==|[-+*/%^&|~<>]")
+        self.lex_word = regex.compile(
+            r"(?:(?!!=|==)[^-+*/%^&|~<>\s{}\[\]()]|(?<=\d[eE])[-+](?=\d))*")
+        self.lex_bracket = regex.compile(r"[{}\[\]()]")
+        self.lex_sign_next = set("0123456789.")
+        self.compiled = functools.lru_cache(self.compile_cache_size)(self.compile_line)
         #t = datetime.now()
         #M.rand('init', 64)
         #M.rand('seed', (t.year+t.month+t.day)/(t.microsecond+1)+
         #    (((t.hour*60)+t.minute)*60+t.second*1000000)+t.microsecond)
-        # set up readline stuff
-        # check for dir and file
-        # consider adding tab completion
-        try:
-            os.makedirs(os.path.expanduser('~')+'/.config/hc')
-        except OSError:
-            pass
-        if hasattr(readline, "read_history_file"):
-            try:
-                readline.read_history_file(os.path.expanduser('~')+'/.config/hc/history')
-            except IOError:
-                pass
-            atexit(self.cleanup)
 
-        defined_functions = ["'nop'"]
-        funcs = list(self.commands_dict.keys())
-        funcs.sort(reverse=True)
         self.chomppre = regex.compile(r"^\s*")
         self.chomppost = regex.compile(r"\s*$")
 
@@ -390,12 +252,7 @@ class Calculator(object):
         # Global variables
         self.stdin_finished = False  # Flags when stdin has reached EOF
         self.argument_types = "%sThe two arguments must be the same type"
-        self.factorial_cache = {0:1, 1:1, 2:2}
-        self.process_stdin = not sys.stdin.isatty()
-        self.run_checks = False      # -c Run checks
-        self.quiet = False           # -q If true, don't print initial message
         self.testing = False         # -t If true, exit with nonzero status if x!=y
-        self.use_default_config_only = options.default_config
 
         # Used for binary conversions
         self.hexdigits = {
@@ -404,27 +261,19 @@ class Calculator(object):
             "a" : "1010", "b" : "1011", "c" : "1100", "d" : "1101", "e" : "1110",
             "f" : "1111"}
 
-        self.RunChecks()
-        config.load()
-        self.CheckEnvironment()
-        self.GetConfiguration()
-
-        if options.default_config:
-            self.display.msg("Using default configuration only")
-        if options.version:
-            self.display.msg("hc version 7 (29 Mar 2012)")
-        if not self.process_stdin and \
-                builtins.type(config.cfg['console_title']) is str:
-            console.set_title(config.cfg['console_title'])
-
     #---------------------------------------------------------------------------
     # Utility functions
 
     def use_modular_arithmetic(self, x, y):
-        return (isint(x) and isint(y) and abs(config.cfg["modulus"]) > 1)
+        modulus = self.cfg["modulus"]
+        return (isint(x) and isint(y) and isint(modulus) and abs(modulus) > 1)
+
+    def modular(self, x):
+        'Return the integer x as a Zmod with the configured modulus.'
+        return Zmod(x, self.cfg["modulus"])
 
     def TypeCheck(self, x, y):
-        if (not config.cfg["coerce"]) and (type(x) != type(y)):
+        if (not self.cfg["coerce"]) and (type(x) != type(y)):
             raise ValueError(self.argument_types % fln())
 
     def DownCast(self, x):
@@ -432,7 +281,7 @@ class Calculator(object):
         If x can be converted to an integer with no loss of information,
         do so.  If its a complex that can be converted to a real, do so.
         """
-        if config.cfg["downcasting"] == False:
+        if self.cfg["downcasting"] == False:
             return x
         if x == inf or x == -inf:
             return x
@@ -455,7 +304,7 @@ class Calculator(object):
         is typically done after calling inverse trig functions.
         """
         try:
-            if config.cfg["angle_mode"] == "deg":
+            if self.cfg["angle_mode"] == "deg":
                 if isinstance(x, m.mpc):  # Don't change complex numbers
                     return x
                 if isinstance(x, Zn): x = int(x)
@@ -470,7 +319,7 @@ class Calculator(object):
         is typically done before calling trig functions.
         """
         try:
-            if config.cfg["angle_mode"] == "deg":
+            if self.cfg["angle_mode"] == "deg":
                 if isinstance(x, m.mpc):  # Don't change complex numbers
                     return x
                 if isinstance(x, Zn): x = int(x)
@@ -482,6 +331,7 @@ class Calculator(object):
     #---------------------------------------------------------------------------
     # Binary functions
 
+    @command("+", 2)
     def add(self, y, x):
         """
     Usage: y x +
@@ -489,7 +339,7 @@ class Calculator(object):
     Return the sum of the bottom two items on the stack (y + x)
         """
         if self.use_modular_arithmetic(x, y):
-            return (x + y) % config.cfg["modulus"]
+            return Zn(int(self.modular(y) + x))
         self.TypeCheck(x, y)
         try:
             return y + x
@@ -499,6 +349,7 @@ class Calculator(object):
             self.errors.append(str(e))
             return x + y
 
+    @command("-", 2)
     def subtract(self, y, x):
         """
     Usage: y x -
@@ -506,13 +357,14 @@ class Calculator(object):
     Return the difference of the bottom two items on the stack (y - x)
         """
         if self.use_modular_arithmetic(x, y):
-            return (x - y) % config.cfg["modulus"]
+            return Zn(int(self.modular(y) - x))
         self.TypeCheck(x, y)
         try:
             return y - x
         except:
             return -(y - x)
 
+    @command("*", 2)
     def multiply(self, y, x):
         """
     Usage: y x *
@@ -520,24 +372,27 @@ class Calculator(object):
     Return the product of the bottom two items on the stack (y * x)
         """
         if self.use_modular_arithmetic(y, x):
-            return (y*x) % config.cfg["modulus"]
+            return Zn(int(self.modular(y)*x))
         self.TypeCheck(y, x)
         try:
             return y*x
         except:
             return x*y
 
+    @command("/", 2)
     def divide(self, y, x):
         """
     Usage: y x /
 
     Return the quotient of the bottom two items on the stack (y / x)
+
+    In modulo mode, this is y times the inverse of x.
         """
         if self.use_modular_arithmetic(x, y):
-            return (y//x) % config.cfg["modulus"]
+            return Zn(int(self.modular(y)/x))
         self.TypeCheck(y, x)
         if x == 0:
-            if config.cfg["allow_divide_by_zero"]:
+            if self.cfg["allow_divide_by_zero"]:
                 if y > 0:
                     return m.inf
                 elif y < 0:
@@ -558,6 +413,7 @@ class Calculator(object):
         except:
             return self.reciprocal(x/y)
 
+    @command("%", 2, aliases=["mod"])
     def Mod(self, n, d):
         """
     Usage: y x %
@@ -576,6 +432,7 @@ class Calculator(object):
             result = Zn(int(result))
         return result
 
+    @command("div", 2)
     def integer_divide(self, n, d):
         """
     Usage: y x div
@@ -583,7 +440,7 @@ class Calculator(object):
     Return the integer division quotient of the bottom two items on the stack (y // x)
         """
         if self.use_modular_arithmetic(n, d):
-            return (Zn(n)//Zn(d)) % config.cfg["modulus"]
+            return (Zn(n)//Zn(d)) % self.cfg["modulus"]
         self.TypeCheck(n, d)
         if isint(n) and isint(d):
             if not isinstance(n, Zn): n = Zn(n)
@@ -593,6 +450,7 @@ class Calculator(object):
         d = Convert(d, MPF)
         return int(m.floor(n/d))
 
+    @command("and", 2, aliases=["&"])
     def bit_and(self, y, x):
         """
     Usage: y x &
@@ -608,6 +466,7 @@ class Calculator(object):
         x = Convert(x, INT)
         return y & x
 
+    @command("or", 2, aliases=["|"])
     def bit_or(self, y, x):
         """
     Usage: y x |
@@ -623,6 +482,7 @@ class Calculator(object):
         x = Convert(x, INT)
         return y | x
 
+    @command("xor", 2)
     def bit_xor(self, y, x):
         """
     Usage: y x xor
@@ -638,6 +498,7 @@ class Calculator(object):
         x = Convert(x, INT)
         return y ^ x
 
+    @command("<<", 2)
     def bit_leftshift(self, y, x):
         """
     Usage: y x <<
@@ -653,6 +514,7 @@ class Calculator(object):
         x = Convert(x, INT)
         return y << x
 
+    @command(">>", 2)
     def bit_rightshift(self, y, x):
         """
     Usage: y x >>
@@ -668,6 +530,7 @@ class Calculator(object):
         x = Convert(x, INT)
         return y >> x
 
+    @command("%ch", 2)
     def percent_change(self, y, x):
         """
     Usage: y x %ch
@@ -680,6 +543,37 @@ class Calculator(object):
             raise ValueError("%sBase is zero for %ch" % fln())
         return 100*(x - y)/y
 
+    def CombinatoricArguments(self, y, x):
+        """Return y and x of comb or perm as the ints n and k, and
+        whether a result with the given number of factors may be exact:
+        it may when that is below cfg['factorial_limit'].
+        """
+        if not self.cfg["coerce"]:
+            if (not isint(y)) and (not isint(x)):
+                raise ValueError(self.argument_types % fln())
+        if not isint(x):
+            x = Convert(x, INT)
+        if not isint(y):
+            y = Convert(y, INT)
+        n, k = int(y), int(x)
+        if n < 0 or k < 0:
+            raise ValueError("%sArguments must be integers >= 0" % fln())
+        limit = self.cfg["factorial_limit"]
+        return n, k, lambda factors: limit == 0 or factors < limit
+
+    def LogGammaQuotient(self, n, *d):
+        """Return n!/(d[0]!*d[1]!...) for the large integers n and d,
+        from the log-gamma function.  The logarithms are found with
+        enough extra bits that their difference is accurate.
+        """
+        with m.extraprec(n.bit_length() + 10):
+            s = m.loggamma(n + 1)
+            for i in d:
+                s -= m.loggamma(i + 1)
+            r = m.exp(s)
+        return +r
+
+    @command("comb", 2)  # Combinations of y choose x
     def combination(self, y, x):
         """
     Usage: y x comb
@@ -700,17 +594,22 @@ class Calculator(object):
     |        | =  |        | =  --------
     \   x   /     \  y-1  /     x!(y-x)!
 
-        """
-        if not config.cfg["coerce"]:
-            if (not isint(y)) and (not isint(x)):
-                raise ValueError(self.argument_types % fln())
-        else:
-            if not isint(x):
-                x = Convert(x, INT)
-            if not isint(y):
-                y = Convert(y, INT)
-        return int(self.permutation(y, x)//self.Factorial(x))
-
+    The result is exact unless both x and y-x are at least
+    cfg['factorial_limit'], when it is a floating point approximation.
+    In modulo mode it is exact and reduced by the modulus; for a prime
+    modulus, it is found digit by digit (Lucas' theorem).  It is an
+    error if that takes cfg['factorial_limit'] or more factors.
+        """
+        from . import combinatorics
+        n, k, exact = self.CombinatoricArguments(y, x)
+        if self.use_modular_arithmetic(n, k):
+            return combinatorics.comb_mod(n, k, int(self.cfg["modulus"]),
+                                          self.cfg["factorial_limit"])
+        if exact(min(k, n - k)):
+            return combinatorics.comb(n, k)
+        return self.LogGammaQuotient(n, k, n - k)
+
+    @command("perm", 2)  # Permutations of y choose x
     def permutation(self, y, x):
         """
     Usage: y x perm
@@ -726,36 +625,48 @@ class Calculator(object):
 
     With repetition, use: y x ^
 
-        """
-        if not config.cfg["coerce"]:
-            if (not isint(y)) and (not isint(x)):
-                raise ValueError(self.argument_types % fln())
-        else:
-            if not isint(x):
-                x = Convert(x, INT)
-            if not isint(y):
-                y = Convert(y, INT)
-        return int(self.Factorial(y)//self.Factorial(y - x))
-
+    The result is exact unless x is at least cfg['factorial_limit'],
+    when it is a floating point approximation.  In modulo mode the
+    product is reduced by the modulus as it is made, and it is an error
+    if x is at least cfg['factorial_limit'] (and less than the modulus).
+        """
+        from . import combinatorics
+        n, k, exact = self.CombinatoricArguments(y, x)
+        if self.use_modular_arithmetic(n, k):
+            return combinatorics.perm_mod(n, k, int(self.cfg["modulus"]),
+                                          self.cfg["factorial_limit"])
+        if exact(k) or k > n:
+            return combinatorics.perm(n, k)
+        return self.LogGammaQuotient(n, n - k)
+
+    @command("pow", 2, aliases=["^"])  # Raise y to the power of x
     def power(self, y, x):
         """
     Usage: y x ^
 
     Return the value of the pow() function applied to the bottom two items on the stack (y^x)
+
+    In modulo mode, the power is reduced as it is made, and a negative x
+    is a power of the inverse of y.
         """
+        if self.use_modular_arithmetic(y, x):
+            return Zn(int(self.modular(y)**x))
         return y ** x
 
     #---------------------------------------------------------------------------
     # Unary functions
 
+    @command("inv", 1)  # reciprocal of x
     def reciprocal(self, x):
         """
     Usage: x inv
 
-    Returns the reciprocal of x (1/x)
+    Returns the reciprocal of x (1/x); in modulo mode, the inverse of x
         """
+        if self.use_modular_arithmetic(x, x):
+            return Zn(int(self.modular(x).inverse()))
         if x == 0:
-            if config.cfg["allow_divide_by_zero"]:
+            if self.cfg["allow_divide_by_zero"]:
                 return inf
             else:
                 raise ValueError("%sDivision by zero" % fln())
@@ -765,13 +676,14 @@ class Calculator(object):
             return Rational(x.d, x.n)
         return m.mpf(1)/x
 
+    @command("~", 1)  # Flip all the bits of x
     def bit_negate(self, x):
         """
     Usage: x ~
 
     Returns the bit-negated version of x (x may be cast to an int)
         """
-        if not config.cfg["coerce"]:
+        if not self.cfg["coerce"]:
             if not isint(x):
                 raise ValueError(self.argument_types % fln())
         else:
@@ -779,14 +691,18 @@ class Calculator(object):
                 x = Convert(x, INT)
         return ~x
 
+    @command("neg", 1)  # negative of x
     def negate(self, x):
         """
     Usage: x neg
 
     Returns negative x (-(x))
         """
+        if self.use_modular_arithmetic(x, x):
+            return Zn(int(-self.modular(x)))
         return -x
 
+    @command("conj", 1)  # Complex conjugate of x
     def conj(self, x):
         """
     Usage: x conj
@@ -798,6 +714,7 @@ class Calculator(object):
         else:
             return x
 
+    @command("sqrt", 1)  # Square root of x
     def sqrt(self, x):
         """
     Usage: x sqrt
@@ -807,6 +724,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.sqrt(x)
 
+    @command("cbrt", 1)  # Cube root of x
     def cbrt(self, x):
         """
     Usage: x cbrt
@@ -816,6 +734,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.cbrt(x)
 
+    @command("root", 2)  # nth root of x
     def root(self, y, x, k=0):
         """
     Usage: y x root
@@ -826,6 +745,7 @@ class Calculator(object):
         if isinstance(y, Zn): y = int(y)
         return m.root(y, x, k)
 
+    @command("roots", 2)  # nth roots of x
     def roots(self, y, x):
         """
     Usage: y x roots
@@ -834,14 +754,18 @@ class Calculator(object):
         """
         return [ self.root(y, x, k) for k in range(x) ]
 
+    @command("sqr", 1)  # Square x
     def square(self, x):
         """
     Usage: x sqr
 
     Returns the square of x
         """
+        if self.use_modular_arithmetic(x, x):
+            return Zn(int(self.modular(x)**2))
         return x*x
 
+    @command("mid", 1)  # Take midpoint of interval number
     def mid(self, x):
         """
     Usage: x mid
@@ -853,6 +777,7 @@ class Calculator(object):
         else:
             raise ValueError("%sNeed an interval number for mid" % fln())
 
+    @command("!", 1)  # factorial
     def Factorial(self, x):
         """
     Usage: x !
@@ -860,24 +785,16 @@ class Calculator(object):
     Returns the factorial of x.  This returns the exact factorial up to
     cfg['factorial_limit'] and a floating point approximation beyond that.
         """
-        def ExactIntegerFactorial(x):
-            if x in self.factorial_cache:
-                return self.factorial_cache[x]
-            else:
-                if x > 1:
-                    y = 1
-                    for i in range(2, x+1):
-                        y *= i
-                    self.factorial_cache[x] = y
-                    return y
-        limit = config.cfg["factorial_limit"]
+        from . import combinatorics
+        limit = self.cfg["factorial_limit"]
         if limit < 0 or not isint(limit):
             raise SyntaxError("%sFactorial limit needs to be an integer >= 0" % fln())
         if isint(x) and x >= 0:
             if limit == 0 or (limit > 0 and x < limit):
-                return ExactIntegerFactorial(x)
+                return combinatorics.factorial(int(x))
         return m.factorial(int(x))
 
+    @command("sum", 'x')  # sum of top x values (depth sum for all)
     def sum(self, *args):
         """
     Usage: x sum
@@ -893,6 +810,21 @@ class Calculator(object):
             return None
         return s
 
+    @command("prod", 'x')  # product of top x values
+    def prod(self, *args):
+        """
+    Usage: x prod
+
+    Returns the product of the bottom x items on the stack
+        """
+        if all(self.use_modular_arithmetic(x, x) for x in args):
+            return Zn(int(Zmod.product(args, int(self.cfg["modulus"]))))
+        p = Zn(1)
+        for x in args:
+            p = self.multiply(p, x)
+        return p
+
+    @command("floor", 1)  # Largest integer <= x
     def floor(self, x):
         """
     Usage: x floor
@@ -902,6 +834,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.floor(x)
 
+    @command("ceil", 1)  # Smallest integer >= x
     def ceil(self, x):
         """
     Usage: x ceil
@@ -911,6 +844,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.ceil(x)
 
+    @command("atan2", 2)
     def atan2(self, x, y):
         """
     Usage: y x atan2
@@ -920,6 +854,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.atan2(x, y)
 
+    @command("hypot", 2)  # sqrt(x*x + y*y)
     def hypot(self, x, y):
         """
     Usage: y x hypot
@@ -929,6 +864,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.hypot(x, y)
 
+    @command("sin", 1)
     def sin(self, x):
         """
     Usage: x sin
@@ -938,6 +874,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.sin(self.Conv2Rad(x))
 
+    @command("cos", 1)
     def cos(self, x):
         """
     Usage: x cos
@@ -947,6 +884,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.cos(self.Conv2Rad(x))
 
+    @command("tan", 1)
     def tan(self, x):
         """
     Usage: x tan
@@ -956,6 +894,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.tan(self.Conv2Rad(x))
 
+    @command("asin", 1)
     def asin(self, x):
         """
     Usage: x asin
@@ -965,6 +904,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.asin(x))
 
+    @command("acos", 1)
     def acos(self, x):
         """
     Usage: x acos
@@ -974,6 +914,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acos(x))
 
+    @command("atan", 1)
     def atan(self, x):
         """
     Usage: x atan
@@ -983,6 +924,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.atan(x))
 
+    @command("sec", 1)
     def sec(self, x):
         """
     Usage: x sec
@@ -992,6 +934,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.sec(self.Conv2Rad(x))
 
+    @command("csc", 1)
     def csc(self, x):
         """
     Usage: x csc
@@ -1001,6 +944,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.csc(self.Conv2Rad(x))
 
+    @command("cot", 1)
     def cot(self, x):
         """
     Usage: x cot
@@ -1010,6 +954,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.cot(self.Conv2Rad(x))
 
+    @command("asec", 1)
     def asec(self, x):
         """
     Usage: x asec
@@ -1019,6 +964,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.asec(x))
 
+    @command("acsc", 1)
     def acsc(self, x):
         """
     Usage: x acsc
@@ -1028,6 +974,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acsc(x))
 
+    @command("acot", 1)
     def acot(self, x):
         """
     Usage: x acot
@@ -1037,6 +984,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acot(x))
 
+    @command("sinh", 1)
     def sinh(self, x):
         """
     Usage: x sinh
@@ -1046,6 +994,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.sinh(self.Conv2Rad(x))
 
+    @command("cosh", 1)
     def cosh(self, x):
         """
     Usage: x cosh
@@ -1055,6 +1004,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.cosh(self.Conv2Rad(x))
 
+    @command("tanh", 1)
     def tanh(self, x):
         """
     Usage: x tanh
@@ -1064,6 +1014,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.tanh(self.Conv2Rad(x))
 
+    @command("asinh", 1)
     def asinh(self, x):
         """
     Usage: x asinh
@@ -1073,6 +1024,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.asinh(x))
 
+    @command("acosh", 1)
     def acosh(self, x):
         """
     Usage: x acosh
@@ -1082,6 +1034,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acosh(x))
 
+    @command("atanh", 1)
     def atanh(self, x):
         """
     Usage: x atanh
@@ -1091,6 +1044,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.atanh(x))
 
+    @command("sech", 1)
     def sech(self, x):
         """
     Usage: x sech
@@ -1100,6 +1054,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.sech(self.Conv2Rad(x))
 
+    @command("csch", 1)
     def csch(self, x):
         """
     Usage: x csch
@@ -1109,6 +1064,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.csch(self.Conv2Rad(x))
 
+    @command("coth", 1)
     def coth(self, x):
         """
     Usage: x coth
@@ -1118,6 +1074,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.coth(self.Conv2Rad(x))
 
+    @command("asech", 1)
     def asech(self, x):
         """
     Usage: x asech
@@ -1127,6 +1084,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.asech(x))
 
+    @command("acsch", 1)
     def acsch(self, x):
         """
     Usage: x acsch
@@ -1136,6 +1094,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acsch(x))
 
+    @command("acoth", 1)
     def acoth(self, x):
         """
     Usage: x acoth
@@ -1145,6 +1104,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return self.Conv2Deg(m.acoth(x))
 
+    @command("ln", 1)  # Natural logarithm
     def ln(self, x):
         """
     Usage: x ln
@@ -1154,6 +1114,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.ln(x)
 
+    @command("log2", 1)  # Base 2 logarithm
     def log2(self, x):
         """
     Usage: x log2
@@ -1163,6 +1124,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.ln(x)/m.ln(2)
 
+    @command("log", 1)  # Base 10 logarithm
     def log10(self, x):
         """
     Usage: x log
@@ -1172,6 +1134,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.log10(x)
 
+    @command("exp", 1)  # Exponential function
     def exp(self, x):
         """
     Usage: x exp
@@ -1181,6 +1144,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.exp(x)
 
+    @command("bits", 1)  # calculate the number of bits required for this integer
     def bits(self, x):
         """
     Usage: x bits
@@ -1191,6 +1155,7 @@ class Calculator(object):
         if x < 0: x = self.abs(x)
         return int(self.ceil(self.log2(x)))
 
+    @command("db", 1)  # take a number in db and express it as a std ratio
     def db(self, x):
         """
     Usage: x db
@@ -1201,6 +1166,7 @@ class Calculator(object):
         """
         return self.power(mpf('10.0'), x / mpf('10.0'))
 
+    @command("bd", 1)  # take a ratio and express it in db
     def bd(self, x):
         """
     Usage: x bd
@@ -1211,94 +1177,91 @@ class Calculator(object):
         """
         return 10 * self.log10(x)
 
+    @command("stddev", 1)  # take std deviation of a set
     def stddev(self, x):
         """
     Usage: x stddev
 
     Returns the standard deviation of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("StdDev requires a list")
-        mean = self.mean(x)
-        dx = List([ (v-mean)**2 for v in x.items ])
-        return self.sqrt(self.mean(dx))
+        return self.sqrt(stats.summary(x.items).variance())
 
+    @command("mean", 1)  # return mean of a set
     def mean(self, x):
         """
     Usage: x mean
 
     Returns the mean of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("mean requires a list")
-        total = self.sum(*x.items)
-        return self.divide(total, Zn(len(x)))
+        if not x.items:
+            raise ValueError("%smean requires a list that isn't empty" % fln())
+        return stats.summary(x.items).mean
 
+    @command("median", 1)  # return median of a set
     def median(self, x):
         """
     Usage: x median
 
     Returns the median of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("median requires a list")
-        l = x.items
-        l.sort()
-        c = len(x)
-        h = c >> 1
-        if c & 1:
-            return l[h]
-        return self.mean(List(l[h-1:h+1]))
+        middle = stats.median(x.items)
+        if len(middle) == 1:
+            return middle[0]
+        return self.mean(List(middle))
 
+    @command("min", 1)  # return minimum of a set
     def minimum(self, x):
         """
     Usage: x min
 
     Returns the minimum of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("min requires a list")
-        l = x.items
-        l.sort()
-        return l[0]
+        return stats.extremes(x.items)[0]
 
+    @command("max", 1)  # return maximum of a set
     def maximum(self, x):
         """
     Usage: x max
 
     Returns the maximum of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("max requires a list")
-        l = x.items
-        l.sort()
-        return l[-1]
+        return stats.extremes(x.items)[1]
 
+    @command("range", 1)  # return the range of a set as an interval
     def Range(self, x):
         """
     Usage: x range
 
     Returns the range of list x
         """
+        from . import stats
         if not isinstance(x, List):
             raise TypeError("range requires a list")
-        l = x.items
-        l.sort()
-        rl = None
-        if isint(l[0]):
-            rl = int(l[0])
-        elif isinstance(l[0], Julian):
-            rl = l[0].value
-        else:
-            rl = l[0]
-        if isint(l[-1]):
-            rh = int(l[-1])
-        elif isinstance(l[-1], Julian):
-            rh = l[-1].value
-        else:
-            rh = l[-1]
-        return mpi(rl, rh)
-
+        ends = []
+        for v in stats.extremes(x.items):
+            if isint(v):
+                v = int(v)
+            elif isinstance(v, Julian):
+                v = v.value
+            ends.append(v)
+        return mpi(*ends)
+
+    @command("sort", 1)  # return a sorted set
     def sort(self, x):
         """
     Usage: x sort
@@ -1307,11 +1270,59 @@ class Calculator(object):
         """
         if not isinstance(x, List):
             raise TypeError("sort requires a list")
+        return List(sorted(x.items))
+
+    @command("stats", 0, rest_of_line=True)  # statistics of a file of numbers
+    def file_stats(self, line=''):
+        """
+    Usage: stats FILE [column]
 
-        l = x.items
-        l.sort()
-        return List(l)
+    Returns { count mean variance min max p50 p90 p99 } of the numbers
+    in FILE, a text file of numbers separated by white space or a CSV
+    file.  If column is given, only that field of each line is read;
+    it is counted from 1, or is the name of the field in the first
+    line.  A CSV file with more than one column needs a column.  Fields
+    that aren't numbers, like names and times, are skipped.  Quote a
+    FILE with spaces in its name.
 
+    The file is read a chunk at a time, so it can be larger than
+    memory.  The percentiles are estimates (from a t-digest) to float
+    precision; the rest are computed from every number.
+        """
+        if not self.file_access:
+            raise ValueError("%sstats FILE isn't available here" % fln())
+        import shlex
+        from . import stats
+        try:
+            args = shlex.split(line)
+        except ValueError:
+            args = []
+        if not 1 <= len(args) <= 2:
+            raise ValueError("%sUsage: stats FILE [column]" % fln())
+        column = None
+        if len(args) == 2:
+            column = args[1]
+            if column.isdigit():
+                column = int(column) - 1
+                if column < 0:
+                    raise ValueError("%sColumns are counted from 1" % fln())
+        try:
+            f = open(os.path.expanduser(args[0]), newline='', errors='replace')
+        except OSError as e:
+            raise ValueError("%sCan't read '%s':  %s" % (fln(), args[0], e.strerror))
+        # Plain decimals parse the same without the Number parser unless
+        # integers are read in another base or wrapped to a width
+        plain = self.cfg["integer_mode"] not in Number.bases and \
+                self.settings.bits == 0
+        with f:
+            total, digest = stats.read(f, self.number, column, plain)
+        if total.n == 0:
+            raise ValueError("%sThere are no numbers in '%s'" % (fln(), args[0]))
+        # The percentiles are floats; repr rounds them to what they hold
+        return List([total.n, total.mean, total.variance(), total.min, total.max] +
+                    [mpf(repr(digest.quantile(q))) for q in stats.quantiles])
+
+    @command("=@R", args=2, pattern=r"=@([a-zA-Z])")
     def store(self, x, r):
         """
     Usage: x =@R
@@ -1320,6 +1331,7 @@ class Calculator(object):
         """
         self.registers[r] = x
 
+    @command("@R", pattern=r"@([a-zA-Z])")
     def recall(self, r):
         """
     Usage: @R
@@ -1330,6 +1342,7 @@ class Calculator(object):
             return None
         return self.registers[r]
 
+    @command("abs", 1)  # Absolute value of x
     def abs(self, x):
         """
     Usage: x abs
@@ -1338,6 +1351,7 @@ class Calculator(object):
         """
         return abs(x)
 
+    @command("arg", 1)
     def arg(self, x):
         """
     Usage: x arg
@@ -1347,6 +1361,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.arg(x)
 
+    @command("gamma", 1)
     def gamma(self, x):
         """
     Usage: x gamma
@@ -1356,6 +1371,7 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.gamma(x)
 
+    @command("zeta", 1)
     def zeta(self, x):
         """
     Usage: x zeta
@@ -1365,10 +1381,12 @@ class Calculator(object):
         if isinstance(x, Zn): x = int(x)
         return m.zeta(x)
 
+    @command("ncdf", 1)
     def Ncdf(self, x):
         'Normal probability CDF'
         return ncdf(x, 0, 1)
 
+    @command("invn", 1)
     def Incdf(self, x):
         'Inverse of normal probability CDF'
         if not (0 < x < 1):
@@ -1388,6 +1406,7 @@ class Calculator(object):
         y = m.findroot(lambda z: ncdf(z) - x, 0)
         return y
 
+    @command("rand", 0)  # Uniform random number
     def rand(self):
         """
     Usage: rand
@@ -1402,6 +1421,7 @@ class Calculator(object):
         number = self.sum(*args)
         return number
 
+    @command("ts", 0)  # return unix timestamp
     def unix_ts(self):
         """
     Usage: ts
@@ -1415,6 +1435,14 @@ class Calculator(object):
     # constants.  Should these be handled differently?
     ############################################################################
 
+    @property
+    def constants(self):
+        if Calculator.parsed_constants is None:
+            from . import constants
+            Calculator.parsed_constants = constants.ParseRawData()
+        return Calculator.parsed_constants
+
+    @command("phi", 0)  # Golden ratio
     def Phi(self):
         """
     Usage: phi
@@ -1423,6 +1451,7 @@ class Calculator(object):
         """
         return m.mpf(m.phi)
 
+    @command("pi", 0)
     def Pi(self):
         """
     Usage: pi
@@ -1431,6 +1460,7 @@ class Calculator(object):
         """
         return m.mpf(m.mp.pi)
 
+    @command("e", 0)
     def E(self):
         """
     Usage: e
@@ -1470,6 +1500,7 @@ class Calculator(object):
             offset += 24
         return None
 
+    @command("const", 0, rest_of_line=True)  # grab a list of constants
     def const(self, line=''):
         """
     Usage: const
@@ -1503,6 +1534,7 @@ class Calculator(object):
     # networking functions
     ############################################################################
 
+    @command("htonl", 1, aliases=["ntohl"])  # return htonl x
     def ntohl(self, x):
         """
     Usage: x ntohl
@@ -1512,8 +1544,10 @@ class Calculator(object):
         """
         if not isint(x):
             raise TypeError("ntohl requires an integer argument")
+        from socket import htonl
         return htonl(int(x))
 
+    @command("netmask", 2)  # apply a given netmask to an ip address
     def netmask(self, y, x):
         """
     Usage: y x netmask
@@ -1537,6 +1571,7 @@ class Calculator(object):
             raise ValueError("Invalid netmask %s" % str(x))
         return ipaddr(y, (32-z))
 
+    @command("cidr", 2)  # apply a given netmask to an ip address
     def cidr(self, y, x):
         """
     Usage: y x cidr
@@ -1553,6 +1588,7 @@ class Calculator(object):
             raise TypeError("cidr requires an integer (or IP) argument for IP address")
         return ipaddr(y, x)
 
+    @command("=net", 2)  # check to see if y and x are on the same subnet
     def samenet(self, y, x):
         pass
 
@@ -1561,6 +1597,7 @@ class Calculator(object):
     # Stack callback functions
     ############################################################################
 
+    @command("clr", 0)
     def ClearStack(self):
         """
     Usage: clear
@@ -1569,6 +1606,7 @@ class Calculator(object):
         """
         self.stack.clear_stack()
 
+    @command("clear", 0)  # Reset the calculator state
     def Reset(self):
         """
     Usage: reset
@@ -1578,8 +1616,10 @@ class Calculator(object):
         self.ClearRegisters()
         self.ClearStack()
         config.load()
+        self.settings.cfg = dict(config.cfg)
         self.ConfigChanged()
 
+    @command("stack", 1)
     def SetStackDisplay(self, x):
         """
     Usage: n stack
@@ -1590,7 +1630,7 @@ class Calculator(object):
         msg = "Stack display size be an integer >= 0"
         if int(x) == x:
             if x >= 0:
-                config.cfg["stack_display"] = int(x)
+                self.cfg["stack_display"] = int(x)
                 return None
             else:
                 self.display.msg(msg)
@@ -1599,6 +1639,7 @@ class Calculator(object):
             self.display.msg(msg)
             return x
 
+    @command("lastx", 0)  # Recall last x used
     def lastx(self):
         """
     Usage: lastx
@@ -1609,6 +1650,7 @@ class Calculator(object):
         return self.stack.lastx
 
 
+    @command("swap", 0)  # swap x and y
     def swap(self):
         """
     Usage: swap
@@ -1620,6 +1662,7 @@ class Calculator(object):
         except:
             self.display.msg("%sStack is not large enough" % fln())
 
+    @command("roll", 0)  # Roll stack
     def roll(self):
         """
     Usage: roll
@@ -1628,6 +1671,7 @@ class Calculator(object):
         """
         self.stack.roll(0)
 
+    @command("rolld", 0)  # Roll stack down
     def rolld(self):
         """
     Usage: rolld
@@ -1636,6 +1680,7 @@ class Calculator(object):
         """
         self.stack.roll(-1)
 
+    @command("over", 0)  # push y onto the stack at the top
     def over(self):
         """
     Usage: over
@@ -1644,6 +1689,7 @@ class Calculator(object):
         """
         return self.stack[1]
 
+    @command("pick", 1)  # pick stack[x] off the stack and push it at the top
     def pick(self, x):
         """
     Usage: n pick
@@ -1653,6 +1699,7 @@ class Calculator(object):
         x = int(x)
         return self.stack[x-1]
 
+    @command("drop", 1)  # Pop x off the stack
     def drop(self, x):
         """
     Usage: drop
@@ -1661,6 +1708,7 @@ class Calculator(object):
         """
         return None
 
+    @command("drop2", 2)  # Pop x and y off the stack
     def drop2(self, y, x):
         """
     Usage: drop2
@@ -1669,6 +1717,7 @@ class Calculator(object):
         """
         return None
 
+    @command("dropn", 'x')  # Pop x items off the stack
     def dropn(self, *args):
         """
     Usage: n dropn
@@ -1677,6 +1726,7 @@ class Calculator(object):
         """
         return None
 
+    @command("dup", 1)  # Push a copy of x onto the stack
     def dup(self, x):
         """
     Usage: dup
@@ -1685,6 +1735,7 @@ class Calculator(object):
         """
         return x, x
 
+    @command("dup2", 2)  # Push a copy of x and y onto the stack
     def dup2(self, y, x):
         """
     Usage: dup2
@@ -1693,6 +1744,7 @@ class Calculator(object):
         """
         return y, x, y, x
 
+    @command("dupn", 'x')  # duplicate top x values on stack
     def dupn(self, *args):
         """
     Usage: n dupn
@@ -1701,6 +1753,7 @@ class Calculator(object):
         """
         return args+args
 
+    @command("depth", 0)  # Push stack depth onto stack
     def depth(self):
         """
     Usage: depth
@@ -1727,6 +1780,7 @@ class Calculator(object):
             self.display.msg("%sCouldn't perform conversion" % fln())
             raise e
 
+    @command("I", 1)  # Convert to integer
     def Cast_i(self, x):
         """
     Usage: x I
@@ -1735,6 +1789,7 @@ class Calculator(object):
         """
         return self.Cast(x, INT)
 
+    @command("QQ", 1)  # Convert to rational at full precision
     def Cast_qq(self, x):
         """
     Usage: x QQ
@@ -1743,6 +1798,7 @@ class Calculator(object):
         """
         return self.Cast(x, RAT, use_prec=True)
 
+    @command("Q", 1)  # Convert to rational at display resolution
     def Cast_q(self, x):
         """
     Usage: x Q
@@ -1751,6 +1807,7 @@ class Calculator(object):
         """
         return self.Cast(x, RAT, use_prec=False)
 
+    @command("R", 1)  # Convert to real number
     def Cast_r(self, x):
         """
     Usage: x R
@@ -1759,6 +1816,7 @@ class Calculator(object):
         """
         return self.Cast(x, MPF)
 
+    @command("C", 1)  # Convert to complex number
     def Cast_c(self, x):
         """
     Usage: x C
@@ -1767,6 +1825,7 @@ class Calculator(object):
         """
         return self.Cast(x, MPC)
 
+    @command("T", 1)  # Convert to time/date
     def Cast_t(self, x):
         """
     Usage: x T
@@ -1775,6 +1834,7 @@ class Calculator(object):
         """
         return self.Cast(x, JUL)
 
+    @command("V", 1)  # Convert to interval number
     def Cast_v(self, x):
         """
     Usage: x V
@@ -1783,6 +1843,7 @@ class Calculator(object):
         """
         return self.Cast(x, MPI)
 
+    @command("cast", 1)  # Convert integer to current C int type
     def cast(self, x):
         """
     Usage: x cast
@@ -1795,6 +1856,7 @@ class Calculator(object):
         """
         return Zn(int(x))
 
+    @command("IP", 1)  # Convert to ip address
     def IP(self, x):
         """
     Usage: IP
@@ -1803,6 +1865,7 @@ class Calculator(object):
         """
         return ipaddr(x)
 
+    @command("2deg", 1)  # Convert x to radians
     def ToDegrees(self, x):
         """
     Usage: x 2deg
@@ -1814,6 +1877,7 @@ class Calculator(object):
             raise ValueError("%sNot an appropriate operation for a complex number" % fln())
         return m.degrees(x)
 
+    @command("2rad", 1)  # Convert x to degrees
     def ToRadians(self, x):
         """
     Usage: x 2rad
@@ -1825,6 +1889,7 @@ class Calculator(object):
             raise ValueError("%sNot an appropriate operation for a complex number" % fln())
         return m.radians(x)
 
+    @command("unix", 1)  # Convert julian to unix timestamp
     def ToUnix(self, x):
         """
     Usage: x unix
@@ -1838,6 +1903,7 @@ class Calculator(object):
             utc_offset += 3600
         return (self.Cast_r(x-JULIAN_UNIX_EPOCH))*86400-utc_offset
 
+    @command("julian", 1)  # Convert unix timestamp to julian
     def ToJulian(self, x):
         """
     Usage: x julian
@@ -1849,6 +1915,7 @@ class Calculator(object):
             utc_offset += 3600
         return Julian((self.Cast_r(x)+utc_offset)/86400)+JULIAN_UNIX_EPOCH
 
+    @command("2hr", 1)  # Convert to decimal hour format
     def hr(self, x):
         """
     Usage: x hr
@@ -1864,6 +1931,7 @@ class Calculator(object):
         x *= 100
         return hours + minutes/mpf(60) + x/3600
 
+    @command("2hms", 1)  # Convert to hour/minute/second format
     def hms(self, x):
         """
     Usage: x hms
@@ -1888,6 +1956,7 @@ class Calculator(object):
             minutes = 0
         return hours + minutes/mpf(100) + seconds/mpf(10000)
 
+    @command("split", 1)  # Take rational, complex, or interval apart
     def split(self, x):
         """
     Usage: x split
@@ -1911,6 +1980,7 @@ class Calculator(object):
             msg = "%sapart requires rational, complex, or interval number"
             raise TypeError(msg % fln())
 
+    @command("fp", 1)  # Integer part of x
     def first_part(self, x):
         """
     Usage: x fp
@@ -1925,6 +1995,7 @@ class Calculator(object):
         a,b = self.split(x)
         return a
 
+    @command("sp", 1)  # Fractional part of x
     def second_part(self, x):
         """
     Usage: x sp
@@ -1939,6 +2010,7 @@ class Calculator(object):
         a,b = self.split(x)
         return b
 
+    @command("iv", 2)  # Convert to [y,x] interval number
     def ToIV(self, y, x):
         """
     Usage: y x iv
@@ -1952,22 +2024,36 @@ class Calculator(object):
         x = Convert(x, MPF)
         return mpi(y, x)
 
+    @command("gcf", 2)  # find the greatest common factor
     def gcf(self, y, x):
         """
     Usage: y x gcf
 
     Returns the greatest common factor of x and y
         """
-        def subgcf(a, b):
-            if b == 0: return a
-            return subgcf(b, a % b)
-
         if not isint(x) or not isint(y):
             raise TypeError("operands to gcf must be integers")
-        if y > x:
-            return subgcf(y, x)
-        return subgcf(x, y)
+        return Zn(gcd(y, x))
 
+    @command("batchgcd", 1)  # shared factors of a list of moduli
+    def batchgcd(self, x):
+        """
+    Usage: {n1 n2 ...} batchgcd
+
+    Returns a list of the greatest common factor of each of the numbers in
+    list x with the product of the others:  1 for a number with no factor
+    in common with any other, the number itself for a repeated one.  For
+    RSA moduli, anything else is a shared prime.  This uses product and
+    remainder trees, so it takes quasi-linear time rather than a gcf of
+    every pair.
+        """
+        from . import rsa
+        if not isinstance(x, List):
+            raise TypeError("batchgcd requires a list")
+        moduli = self.IntegerArguments("batchgcd", *x.items)
+        return List([Zn(g) for g in rsa.batch_gcd(moduli)])
+
+    @command("lcd", 2)  # find the lowest common denominator
     def lcd(self, y, x):
         """
     Usage: y x lcd
@@ -1978,6 +2064,7 @@ class Calculator(object):
             raise TypeError("operands to lcd must be integers")
         return self.multiply(y, x)/self.gcf(y, x)
 
+    @command("modinv", 2)  # find the multiplicative modular inverse
     def modinv(self, y, x):
         """
     Usage: y x modinv
@@ -1986,18 +2073,12 @@ class Calculator(object):
         """
         if not isint(x) or not isint(y):
             raise TypeError("operands to modinv must be integers")
-        t, newt = 0, 1
-        r, newr = x, y
-        while newr != 0:
-            quotient = r // newr
-            t, newt = newt, t - quotient * newt
-            r, newr = newr, r - quotient * newr
-        if r > 1:
+        try:
+            return pow(int(y), -1, int(x))
+        except ValueError:
             raise ValueError("y is not invertible")
-        if t < 0:
-            t += x
-        return t
 
+    @command("rsa_info", 0)  # print rsa info
     def rsa_info(self):
         """
     Usage: rsa_info
@@ -2033,60 +2114,199 @@ class Calculator(object):
     p,q =  --------------------------------------------
                                2
 
+    Commands to compute them:
+        p q e rsa_key       -> {d dp dq qinv}
+        n phi rsa_pq        -> {p q}
+        n e d rsa_pq_ed     -> {p q}
+        c p q d rsa_decrypt -> c^d mod n, using dp, dq and qinv
+        {residues} {moduli} crt -> x with x = residue (mod modulus) for each
+
         """
         print(self.rsa_info.__doc__)
 
         return None
 
+    def IntegerArguments(self, name, *args):
+        """Return args as ints, or raise a TypeError naming the command
+        if one of them isn't an integer.
+        """
+        if not all(isint(a) for a in args):
+            raise TypeError("operands to %s must be integers" % name)
+        return [int(a) for a in args]
+
+    @command("rsa_key", 3)  # derive the private parts of an rsa key
+    def rsa_key(self, p, q, e):
+        """
+    Usage: p q e rsa_key
+
+    Returns a list of the private parts of the RSA key with primes p and q
+    and public exponent e:  {d dp dq qinv}.  See rsa_info.
+        """
+        from . import rsa
+        p, q, e = self.IntegerArguments("rsa_key", p, q, e)
+        return List([Zn(v) for v in rsa.private(p, q, e)])
+
+    @command("rsa_pq", 2)  # recover p and q from n and phi
+    def rsa_pq(self, n, phi):
+        """
+    Usage: n phi rsa_pq
+
+    Returns a list of the primes {p q} of the RSA modulus n with totient
+    phi = (p-1)*(q-1), smallest first.  See rsa_info.
+        """
+        from . import rsa
+        n, phi = self.IntegerArguments("rsa_pq", n, phi)
+        return List([Zn(v) for v in rsa.factor_phi(n, phi)])
+
+    @command("rsa_pq_ed", 3)  # recover p and q from n, e and d
+    def rsa_pq_ed(self, n, e, d):
+        """
+    Usage: n e d rsa_pq_ed
+
+    Returns a list of the primes {p q} of the RSA modulus n, given the
+    public and private exponents e and d, smallest first.
+        """
+        from . import rsa
+        n, e, d = self.IntegerArguments("rsa_pq_ed", n, e, d)
+        return List([Zn(v) for v in rsa.factor_exponents(n, e, d)])
+
+    @command("rsa_decrypt", 4)  # c^d mod p*q by the chinese remainder theorem
+    def rsa_decrypt(self, c, p, q, d):
+        """
+    Usage: c p q d rsa_decrypt
+
+    Returns c^d mod p*q, the RSA private key operation, computed as a power
+    mod p and one mod q put together by the chinese remainder theorem.
+        """
+        from . import rsa
+        c, p, q, d = self.IntegerArguments("rsa_decrypt", c, p, q, d)
+        return Zn(rsa.decrypt(c, p, q, d))
+
+    @command("crt", 2)  # chinese remainder theorem
+    def crt(self, y, x):
+        """
+    Usage: {residues} {moduli} crt
+
+    Returns the smallest x >= 0 with x = residue (mod modulus) for each
+    residue in list y and modulus in list x (chinese remainder theorem).
+    The moduli need not be coprime, but then the residues must agree.
+        """
+        from . import rsa
+        if not isinstance(y, List) or not isinstance(x, List):
+            raise TypeError("crt requires two lists")
+        residues = self.IntegerArguments("crt", *y.items)
+        moduli = self.IntegerArguments("crt", *x.items)
+        return Zn(rsa.crt(residues, moduli)[0])
+
+    @command("factor", 1)  # return a list of the prime factors of x
     def factor(self, x):
         """
     Usage: x factor
 
-    Returns a list containing the factors of x
+    Returns a list of the prime factors of x, smallest first, each as
+    many times as it divides x.  A negative x has -1 as its first factor.
         """
+        from . import primes
         if not isint(x):
             raise TypeError("operand to factor must be an integer")
+        return List([Zn(p) for p in primes.factor(int(x))])
+
+    @command("isprime", 1)  # True if x is prime
+    def isprime(self, x):
+        """
+    Usage: x isprime
+
+    If x is a prime number, return True; otherwise, return False.
+        """
+        from . import primes
+        if not isint(x):
+            raise TypeError("operand to isprime must be an integer")
+        return primes.isprime(int(x))
+
+    @command("nextprime", 1)  # smallest prime greater than x
+    def nextprime(self, x):
+        """
+    Usage: x nextprime
 
-        facts = []
-        maxf = int(self.sqrt(x))
-        n = int(2)
-        while n <= maxf:
-            if (x % n) == 0:
-                facts.append(Zn(n))
-                o = int(x)//n
-                facts.append(Zn(o))
-            n += 1
-        facts.sort()
-        return facts
+    Returns the smallest prime number greater than x
+        """
+        from . import primes
+        if not isint(x):
+            raise TypeError("operand to nextprime must be an integer")
+        return Zn(primes.nextprime(int(x)))
+
+    @command("prevprime", 1)  # largest prime less than x
+    def prevprime(self, x):
+        """
+    Usage: x prevprime
+
+    Returns the largest prime number less than x
+        """
+        from . import primes
+        if not isint(x):
+            raise TypeError("operand to prevprime must be an integer")
+        return Zn(primes.prevprime(int(x)))
 
+    @command("primepi", 1)  # number of primes <= x
+    def primepi(self, x):
+        """
+    Usage: x primepi
+
+    Returns the number of primes less than or equal to x, for x below
+    2**32
+        """
+        from . import primes
+        if not isint(x):
+            raise TypeError("operand to primepi must be an integer")
+        return Zn(primes.primepi(int(x)))
+
+    @command("primes", 1)  # list of the first x primes
+    def primes(self, x):
+        """
+    Usage: x primes
+
+    Returns a list of the first x prime numbers
+        """
+        from . import primes
+        if not isint(x):
+            raise TypeError("operand to primes must be an integer")
+        return List([Zn(p) for p in primes.first(int(x))])
+
+    @command("fib", 1)  # return fibonacci sequence for x
     def fibonacci(self, x):
         """
     Usage: x fib
 
-    Returns the x-th entry in the fibonacci sequence
-        """
-        fx = 0
-        if not isint(x) or x > 1000 or x < 0:
-            if isint(x):
-                x = int(x)
-            # direct calculation with Binet's equation
-            phi = (self.sqrt(5) + 1)/2
-            fx = (self.power(phi, x) - self.power(-phi, -x))/(phi * 2 - 1)
-            if isint(x):
-                fx = int(fx)
-        else:
-            if x == 0:
-                return 0
-            fx = 1
-            fp = 0
-            n = 1
-            while n < x:
-                ft = fx
-                fx += fp
-                fp = ft
-                n = n + 1
-        return fx
+    Returns the x-th entry in the fibonacci sequence.  This is exact for
+    any integer x (reduced by the modulus in modulo mode); for other x it
+    is the floating point value of Binet's formula.
+        """
+        from . import combinatorics
+        if isint(x):
+            if self.use_modular_arithmetic(x, x):
+                return combinatorics.fibonacci_mod(int(x), int(self.cfg["modulus"]))
+            return combinatorics.fibonacci(int(x))
+        # direct calculation with Binet's equation
+        phi = (self.sqrt(5) + 1)/2
+        return (self.power(phi, x) - self.power(-phi, -x))/(phi * 2 - 1)
 
+    @command("fibs", 1)
+    def fibonaccis(self, x):
+        """
+    Usage: x fibs
+
+    Returns a list of the first x entries in the fibonacci sequence,
+    starting with 0 (reduced by the modulus in modulo mode).
+        """
+        from . import combinatorics
+        if not isint(x):
+            raise TypeError("operand to fibs must be an integer")
+        m = 0
+        if self.use_modular_arithmetic(x, x):
+            m = int(self.cfg["modulus"])
+        return List([Zn(f) for f in combinatorics.fibonaccis(int(x), m)])
+
+    @command("chop", 1)  # Convert x to its displayed value
     def Chop(self, x):
         """
     Usage: x chop
@@ -2095,6 +2315,7 @@ class Calculator(object):
         """
         return self.number(self.Format(x).replace(" ", ""))
 
+    @command("prec", 1)  # Set calculation precision
     def Prec(self, x):
         """
     Usage: x prec
@@ -2103,15 +2324,17 @@ class Calculator(object):
         """
         if isint(x) and x > 0:
             mp.dps = int(x)
-            config.cfg["prec"] = int(x)
-            if config.cfg["fp_digits"] > mp.dps:
-                config.cfg["fp_digits"] = mp.dps
+            self.cfg["prec"] = int(x)
+            self.settings.changed()
+            if self.cfg["fp_digits"] > mp.dps:
+                self.cfg["fp_digits"] = mp.dps
             if self.fp.num_digits > mp.dps:
                 self.fp.digits(mp.dps)
             return None
         else:
             self.display.msg("You must supply an integer > 0")
 
+    @command("digits", 1)  # Set significant figures for display
     def digits(self, x):
         """
     Usage: x digits
@@ -2121,7 +2344,7 @@ class Calculator(object):
         if int(x) == x:
             if x >= 0:
                 d = min(int(x), mp.dps)
-                config.cfg["fp_digits"] = d
+                self.cfg["fp_digits"] = d
                 self.fp.digits(min(int(x), mp.dps))
                 return None
             else:
@@ -2129,6 +2352,7 @@ class Calculator(object):
         else:
             self.display.msg("You must supply an integer >= 0")
 
+    @command("round", 2)  # Round y to nearest x
     def Round(self, y, x):
         """
     Usage: y x round
@@ -2141,6 +2365,7 @@ class Calculator(object):
         if y < 0: sgn = -1
         return sgn*int(mpf("0.5") + abs(y)/x)*x
 
+    @command("in", 2)  # True if x is in interval y
     def In(self, y, x):
         """
     Usage: y x in
@@ -2186,6 +2411,25 @@ class Calculator(object):
     # Display modification functions
     ############################################################################
 
+    @command("on", 0)  # Turn display of answers on
+    def DisplayOn(self):
+        """
+    Usage: on
+
+    Turns display of answers on
+        """
+        self.display.on()
+
+    @command("off", 0)  # Turn display of answers off
+    def DisplayOff(self):
+        """
+    Usage: off
+
+    Turns display of answers off
+        """
+        self.display.off()
+
+    @command("mixed", 1)  # Toggle mixed fraction display
     def mixed(self, x):
         """
     Usage: x mixed
@@ -2193,12 +2437,11 @@ class Calculator(object):
     Show the rationals as mixed fractions or not
         """
         if x != 0:
-            config.cfg["mixed_fractions"] = True
-            Rational.mixed = True
+            self.cfg["mixed_fractions"] = True
         else:
-            config.cfg["mixed_fractions"] = False
-            Rational.mixed = False
+            self.cfg["mixed_fractions"] = False
 
+    @command("debug", 1)  # Toggle the debug variable
     def Debug(self, x):
         """
     Usage: x debug
@@ -2210,6 +2453,7 @@ class Calculator(object):
         else:
             debug(False)
 
+    @command("show", 0)  # Show full precision of x register
     def Show(self):
         """
     Usage: x show
@@ -2237,6 +2481,7 @@ class Calculator(object):
             showx(x.a, "  x.a:  ")
             showx(x.b, "  x.b:  ")
 
+    @command("comma", 1)  # Toggle comma decorating
     def comma(self, x):
         """
     Usage: x comma
@@ -2244,11 +2489,13 @@ class Calculator(object):
     If x, use commas to decorate displayed values
         """
         if x != 0:
-            config.cfg["fp_comma_decorate"] = True
+            self.cfg["fp_comma_decorate"] = True
         else:
-            config.cfg["fp_comma_decorate"] = False
-        mpFormat.comma_decorate = config.cfg["fp_comma_decorate"]
+            self.cfg["fp_comma_decorate"] = False
+        self.fp.comma_decorate = self.cfg["fp_comma_decorate"]
+        self.ap.comma_decorate = self.cfg["fp_comma_decorate"]
 
+    @command("width", 1)  # Set line width
     def width(self, x):
         """
     Usage: x width
@@ -2256,140 +2503,158 @@ class Calculator(object):
     Set display width to x (x must be > 20)
         """
         if isint(x) and x > 20:
-            config.cfg["line_width"] = int(x)
+            self.cfg["line_width"] = int(x)
         else:
             self.display.msg("width command requires an integer > 20")
 
+    @command("rect", 0)  # Complex number display
     def Rectangular(self):
         """
     Usage: rec
 
     Set rectangular mode for display of complex numbers and vectors
         """
-        config.cfg["imaginary_mode"] = "rect"
+        self.cfg["imaginary_mode"] = "rect"
 
+    @command("polar", 0)  # Complex number display
     def Polar(self):
         """
     Usage: polar
 
     Set polar mode for display of complex numbers and vectors
         """
-        config.cfg["imaginary_mode"] = "polar"
+        self.cfg["imaginary_mode"] = "polar"
 
+    @command("fix", 0)  # Fixed number of places after decimal point
     def fix(self):
         """
     Usage: fix
 
     Set fixed-point mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "fix"
+        self.cfg["fp_format"] = "fix"
 
+    @command("sig", 0)  # Display signification figures
     def sig(self):
         """
     Usage: sig
 
     Set significant digits mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "sig"
+        self.cfg["fp_format"] = "sig"
 
+    @command("sci", 0)  # Scientific notation display
     def sci(self):
         """
     Usage: sci
 
     Set scientific mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "sci"
+        self.cfg["fp_format"] = "sci"
 
+    @command("eng", 0)  # Engineering display
     def eng(self):
         """
     Usage: eng
 
     Set engineering mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "eng"
+        self.cfg["fp_format"] = "eng"
 
+    @command("engsi", 0)  # Engineering display with SI prefix
     def engsi(self):
         """
     Usage: eng
 
     Set engineering mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "engsi"
+        self.cfg["fp_format"] = "engsi"
 
+    @command("raw", 0)  # raw fp mode
     def raw(self):
         """
     Usage: raw
 
     Set raw mode for display of floating point numbers
         """
-        config.cfg["fp_format"] = "raw"
+        self.cfg["fp_format"] = "raw"
 
+    @command("dec", 0)  # Decimal display for integers
     def dec(self):
         """
     Usage: dec
 
     Set decimal mode for display of integers
         """
-        config.cfg["integer_mode"] = "dec"
+        self.cfg["integer_mode"] = "dec"
+        self.settings.changed()
 
+    @command("hex", 0)  # Hex display for integers
     def hex(self):
         """
     Usage: hex
 
     Set hexadecimal mode for display of integers
         """
-        config.cfg["integer_mode"] = "hex"
+        self.cfg["integer_mode"] = "hex"
+        self.settings.changed()
 
+    @command("oct", 0)  # Octal for integers
     def oct(self):
         """
     Usage: oct
 
     Set octal mode for display of integers
         """
-        config.cfg["integer_mode"] = "oct"
+        self.cfg["integer_mode"] = "oct"
+        self.settings.changed()
 
+    @command("bin", 0)  # Binary display for integers
     def bin(self):
         """
     Usage: bin
 
     Set binary mode for display of integers
         """
-        config.cfg["integer_mode"] = "bin"
+        self.cfg["integer_mode"] = "bin"
+        self.settings.changed()
 
+    @command("roman", 0)  # roman numeral display for integers
     def roman(self):
         """
     Usage: roman
 
     Set roman numeral mode for display of integers
         """
-        config.cfg["integer_mode"] = "roman"
+        self.cfg["integer_mode"] = "roman"
+        self.settings.changed()
 
+    @command("iva", 0)  # Interval display
     def iva(self):
         """
     Usage: iva
 
     Set interval mode A for display of intervals
         """
-        config.cfg["iv_mode"] = "a"
-        Julian.interval_representation = "a"
+        self.cfg["iv_mode"] = "a"
 
+    @command("ivb", 0)  # Interval display
     def ivb(self):
         """
     Usage: ivb
 
     Set interval mode B for display of intervals
         """
-        config.cfg["iv_mode"] = "b"
-        Julian.interval_representation = "b"
+        self.cfg["iv_mode"] = "b"
 
+    @command("ivc", 0)  # Interval display
     def ivc(self):
         """
     Usage: ivc
 
     Set interval mode C for display of intervals
         """
-        config.cfg["iv_mode"] = "c"
-        Julian.interval_representation = "c"
+        self.cfg["iv_mode"] = "c"
 
     def on(self):
         """
@@ -2409,6 +2674,7 @@ class Calculator(object):
         self.display.off()
         return status_ok_no_display
 
+    @command("deg", 0)  # Set degrees for angle mode
     def deg(self):
         """
     Usage: deg
@@ -2419,8 +2685,9 @@ class Calculator(object):
     values are converted behind the scenes to radians before
     passing them to the functions
         """
-        config.cfg["angle_mode"] = "deg"
+        self.cfg["angle_mode"] = "deg"
 
+    @command("rad", 0)  # Set radians for angle mode
     def rad(self):
         """
     Usage: rad
@@ -2429,8 +2696,9 @@ class Calculator(object):
     used by the various trigonometric functions are assumed
     to be already expressed in radians.
         """
-        config.cfg["angle_mode"] = "rad"
+        self.cfg["angle_mode"] = "rad"
 
+    @command("rat", 1)  # Toggle whether to use rationals
     def Rationals(self, x):
         """
     Usage: x rat
@@ -2438,10 +2706,11 @@ class Calculator(object):
     If x, show rationals as rationals instead of decimals
         """
         if x != 0:
-            config.cfg["no_rationals"] = True
+            self.cfg["no_rationals"] = True
         else:
-            config.cfg["no_rationals"] = False
+            self.cfg["no_rationals"] = False
 
+    @command("down", 1)
     def ToggleDowncasting(self, x):
         """
     Usage: x down
@@ -2449,27 +2718,29 @@ class Calculator(object):
     Toggle downcasting: if X, downcast floats to ints if precision permits
         """
         if x != 0:
-            config.cfg["downcasting"] = True
+            self.cfg["downcasting"] = True
         else:
-            config.cfg["downcasting"] = False
+            self.cfg["downcasting"] = False
 
     #---------------------------------------------------------------------------
     # Other functions
 
+    @command("modulo", 1)  # All answers displayed with this modulus
     def Modulus(self, x):
         """
     Usage: modulo
 
     Set up modulus arithmetic with X as the modulus (1 or 0 to cancel)
         """
-        if isinstance(x, m.mpc) or isinstance(x, m.ctx_iv.ivmpf):
-            raise ValueError("%sModulus cannot be a complex or interval number" % fln())
+        if not isint(x):
+            raise ValueError("%sModulus must be an integer" % fln())
         if x == 0:
-            config.cfg["modulus"] = 1
+            self.cfg["modulus"] = 1
         else:
-            config.cfg["modulus"] = x
+            self.cfg["modulus"] = x
         return None
 
+    @command("clrg", 0)
     def ClearRegisters(self):
         """
     Usage: clrg
@@ -2478,6 +2749,25 @@ class Calculator(object):
         """
         self.registers = {}
 
+    @command(">>.", 0)  # Turn off logging
+    def LogOff(self):
+        """
+    Usage: >>.
+
+    Stops logging to the log file
+        """
+        self.display.logoff()
+
+    @command("le", 0, aliases=["be"])  # set integer endianness
+    def endian(self):
+        """
+    Usage: le | be
+
+    Sets little or big-endian integer mode (not yet implemented)
+        """
+        pass
+
+    @command("cfg", 0)  # Show configuration
     def ShowConfig(self):
         """
     Usage: cfg
@@ -2485,27 +2775,27 @@ class Calculator(object):
     Shows the current config
         """
         d = {True:"on", False:"off"}
-        per = d[config.cfg["persist"]]
-        st = str(config.cfg["stack_display"])
-        lw = config.cfg["line_width"]
-        mf = str(config.cfg["mixed_fractions"])
-        dc = d[config.cfg["downcasting"]]
-        sps = d[config.cfg["fp_show_plus_sign"]]
-        am = config.cfg["angle_mode"]
-        im = config.cfg["integer_mode"]
-        imm = config.cfg["imaginary_mode"]
-        sd = str(config.cfg["stack_display"])
-        fmt = config.cfg["fp_format"]
-        dig = str(config.cfg["fp_digits"])
-        ad = str(config.cfg["arg_digits"])
-        af = config.cfg["arg_format"]
+        per = d[self.cfg["persist"]]
+        st = str(self.cfg["stack_display"])
+        lw = self.cfg["line_width"]
+        mf = str(self.cfg["mixed_fractions"])
+        dc = d[self.cfg["downcasting"]]
+        sps = d[self.cfg["fp_show_plus_sign"]]
+        am = self.cfg["angle_mode"]
+        im = self.cfg["integer_mode"]
+        imm = self.cfg["imaginary_mode"]
+        sd = str(self.cfg["stack_display"])
+        fmt = self.cfg["fp_format"]
+        dig = str(self.cfg["fp_digits"])
+        ad = str(self.cfg["arg_digits"])
+        af = self.cfg["arg_format"]
         pr = str(mp.dps)
-        br = d[config.cfg["brief"]]
-        nr = d[config.cfg["no_rationals"]]
-        cd = d[config.cfg["fp_comma_decorate"]]
-        adz = d[config.cfg["allow_divide_by_zero"]]
-        iv = config.cfg["iv_mode"]
-        cdiv = d[config.cfg["C_division"]]
+        br = d[self.cfg["brief"]]
+        nr = d[self.cfg["no_rationals"]]
+        cd = d[self.cfg["fp_comma_decorate"]]
+        adz = d[self.cfg["allow_divide_by_zero"]]
+        iv = self.cfg["iv_mode"]
+        cdiv = d[self.cfg["C_division"]]
         dbg = d[get_debug()]
         if 1:
             s = '''Configuration:
@@ -2518,6 +2808,7 @@ class Calculator(object):
 
         self.display.msg(s)
 
+    @command("brief", 1)  # Fit number on one line
     def brief(self, x):
         """
     Usage: x brief
@@ -2525,9 +2816,9 @@ class Calculator(object):
     Set display to truncate long numbers to one line (shown with ...)
         """
         if x != 0:
-            config.cfg["brief"] = True
+            self.cfg["brief"] = True
         else:
-            config.cfg["brief"] = False
+            self.cfg["brief"] = False
 
     ############################################################################
     # End of callback functions
@@ -2548,23 +2839,24 @@ class Calculator(object):
         self.stack.stack += items[:n]
 
     def ConfigChanged(self):
-        try:
-            self.fp.digits(config.cfg["fp_digits"])
-        except:
-            raise ValueError("%s'fp_digits' value in configuration is bad" % fln())
-        try:
-            self.ap.digits(config.cfg["arg_digits"])
-        except:
-            raise ValueError("%s'arg_digits' value in configuration is bad" % fln())
-        mpFormat.comma_decorate = config.cfg["fp_comma_decorate"]
-        mpFormat.cuddle_si = config.cfg["fp_cuddle_si"]
-        mpFormat.explicit_plus_sign = config.cfg["fp_show_plus_sign"]
-        Rational.mixed = config.cfg["mixed_fractions"]
-        Zn().C_division = config.cfg["C_division"]
-        if isint(config.cfg["prec"]) and int(config.cfg["prec"]) > 0:
-            mp.dps = config.cfg["prec"]
-        else:
-            raise ValueError("%s'prec' value in configuration is bad" % fln())
+        with self.settings:
+            try:
+                self.fp.digits(self.cfg["fp_digits"])
+            except:
+                raise ValueError("%s'fp_digits' value in configuration is bad" % fln())
+            try:
+                self.ap.digits(self.cfg["arg_digits"])
+            except:
+                raise ValueError("%s'arg_digits' value in configuration is bad" % fln())
+            for f in (self.fp, self.ap):
+                f.comma_decorate = self.cfg["fp_comma_decorate"]
+                f.cuddle_si = self.cfg["fp_cuddle_si"]
+                f.explicit_plus_sign = self.cfg["fp_show_plus_sign"]
+            if isint(self.cfg["prec"]) and int(self.cfg["prec"]) > 0:
+                mp.dps = self.cfg["prec"]
+            else:
+                raise ValueError("%s'prec' value in configuration is bad" % fln())
+        self.settings.changed()
 
     def GetFullPath(self, s):
         '''If s doesn't have a slash in it, prepend it with the directory where
@@ -2577,20 +2869,20 @@ class Calculator(object):
             return os.normalize(s)
 
     def SaveConfiguration(self):
-        if config.cfg["persist"]:
+        if self.cfg["persist"]:
             c = os.path.expanduser(os.path.join("~", ".config", "hc", "config"))
             msg = "%sCould not write %s to:\n  %s"
             try:
                 WriteSettings(c, config)
             except:
                 self.display.msg(msg % (fln(), "config", c))
-        if config.cfg["persist_registers"]:
+        if self.cfg["persist_registers"]:
             r = os.path.expanduser(os.path.join("~", ".config", "hc", "registers"))
             try:
                 WriteSettings(r, self.registers)
             except:
                 self.display.msg(msg % (fln(), "registers", r))
-        if config.cfg["persist_stack"]:
+        if self.cfg["persist_stack"]:
             s = os.path.expanduser(os.path.join("~", ".config", "hc", "stack"))
             try:
                 WriteList(s, self.stack.stack)
@@ -2598,16 +2890,16 @@ class Calculator(object):
                 self.display.msg(msg % (fln(), "stack", s))
 
     def GetLineWidth(self):
-        config.cfg["line_width"],height = console.size()
+        self.cfg["line_width"],height = console.size()
 
     def GetConfiguration(self):
         from . import config
         self.GetLineWidth()
         self.ConfigChanged()
         us = "Using default configuration"
-        if config.cfg["persist"]:
-            c, r, s = config.cfg["config_file"], config.cfg["config_save_registers"], \
-                      config.cfg["config_save_stack"]
+        if self.cfg["persist"]:
+            c, r, s = self.cfg["config_file"], self.cfg["config_save_registers"], \
+                      self.cfg["config_save_stack"]
             if c and not self.use_default_config_only:
                 try:
                     d = {}
@@ -2643,13 +2935,13 @@ class Calculator(object):
                     self.display.msg(msg)
 
     def DisplayStack(self):
-        size = config.cfg["stack_display"]
+        size = self.cfg["stack_display"]
         assert size >= 0 and isint(size)
         stack = self.stack._string(self.Format, size, not self.process_stdin)
         if len(stack) > 0:
             self.display.msg(stack)
-        if config.cfg["modulus"] != 1:
-            self.display.msg(" (mod " + self.Format(config.cfg["modulus"])+ ")")
+        if self.cfg["modulus"] != 1:
+            self.display.msg(" (mod " + self.Format(self.cfg["modulus"])+ ")")
         if len(self.errors) > 0:
             self.display.msg("\n".join(self.errors))
             self.errors = []
@@ -2688,10 +2980,10 @@ class Calculator(object):
         ellipsize x, no matter the size.  This is passed in by the stack display
         function as it processes the stack.
         '''
-        width = abs(config.cfg["line_width"])
-        brief = config.cfg["brief"] and not item_is_x
-        e = config.cfg["ellipsis"]
-        im = config.cfg["integer_mode"]
+        width = abs(self.cfg["line_width"])
+        brief = self.cfg["brief"] and not item_is_x
+        e = self.cfg["ellipsis"]
+        im = self.cfg["integer_mode"]
         stack_header_allowance = 5
         if isinstance(x, ipaddr):
             s = str(x)
@@ -2714,22 +3006,22 @@ class Calculator(object):
             # object.  This is a hack; eventually, there will be a single
             # number object where the formatting is handled.
             if x >= Zn(0):
-                if mpFormat.implicit_plus_sign == True:  sign = " "
-                if mpFormat.explicit_plus_sign == True:  sign = "+"
+                if self.fp.implicit_plus_sign == True:  sign = " "
+                if self.fp.explicit_plus_sign == True:  sign = "+"
                 s = sign + s
             if s[-1] == "L": s = s[:-1]  # Handle old python longs
             if brief:
                 s = self.EllipsizeString(s, width - stack_header_allowance, e)
             return s
         elif isinstance(x, Rational):
-            if config.cfg["no_rationals"]:
+            if self.cfg["no_rationals"]:
                 x = mpf(x.n)/mpf(x.d)
-                s = self.fp.format(x, config.cfg["fp_format"])
+                s = self.fp.format(x, self.cfg["fp_format"])
             else:
                 s = str(x)
                 if x >= Rational(0):
-                    if mpFormat.implicit_plus_sign == True:  sign = " "
-                    if mpFormat.explicit_plus_sign == True:  sign = "+"
+                    if self.fp.implicit_plus_sign == True:  sign = " "
+                    if self.fp.explicit_plus_sign == True:  sign = "+"
                     s = sign + s
             if len(s) > width//2:
                 s = s.replace("/", " / ") # Makes / easier to see
@@ -2738,36 +3030,36 @@ class Calculator(object):
                 s = self.EllipsizeString(s, size, e)
             return s
         elif isinstance(x, mpf):
-            s = self.fp.format(x, config.cfg["fp_format"])
+            s = self.fp.format(x, self.cfg["fp_format"])
             if s[-1] == ".": s = s[:-1]  # Remove a trailing dot
             if brief:
                 s = self.EllipsizeString(s, width - stack_header_allowance, e)
             return s
         elif isinstance(x, mpc):
-            space = config.cfg["imaginary_space"]
+            space = self.cfg["imaginary_space"]
             s = ""
             if space:
                 s = " "
-            sre = self.fp.format(x.real, config.cfg["fp_format"])
-            sim = self.fp.format(abs(x.imag), config.cfg["fp_format"]).strip()
-            if config.cfg["ordered_pair"]:
+            sre = self.fp.format(x.real, self.cfg["fp_format"])
+            sim = self.fp.format(abs(x.imag), self.cfg["fp_format"]).strip()
+            if self.cfg["ordered_pair"]:
                 if brief:
                     size = (width - stack_header_allowance)//2 - 4
                     sre = self.EllipsizeString(sre, size, e).strip()
                     sim = self.EllipsizeString(sim, size, e)
                 s = "(" + sre + "," + s + sim + ")"
             else:
-                mode = config.cfg["imaginary_mode"]
-                first = config.cfg["imaginary_unit_first"]
-                unit = config.cfg["imaginary_unit"]
+                mode = self.cfg["imaginary_mode"]
+                first = self.cfg["imaginary_unit_first"]
+                unit = self.cfg["imaginary_unit"]
                 if mode == "polar":
                     # Polar mode
-                    sep = config.cfg["polar_separator"]
-                    angle_mode = config.cfg["angle_mode"]
+                    sep = self.cfg["polar_separator"]
+                    angle_mode = self.cfg["angle_mode"]
                     mag = abs(x)
                     ang = arg(x)
                     if angle_mode == "deg":
-                        ang_sym = config.cfg["degree_symbol"]
+                        ang_sym = self.cfg["degree_symbol"]
                         ang *= 180/pi
                     else:
                         ang_sym = "rad"
@@ -2776,15 +3068,15 @@ class Calculator(object):
                             % angle_mode)
                     m = str(mag)
                     a = str(ang)
-                    if config.cfg["fp_format"] != "raw":
-                        m = self.fp.format(mag, config.cfg["fp_format"])
-                        a = self.ap.format(ang, config.cfg["arg_format"])
+                    if self.cfg["fp_format"] != "raw":
+                        m = self.fp.format(mag, self.cfg["fp_format"])
+                        a = self.ap.format(ang, self.cfg["arg_format"])
                     if brief:
                         size = (width - stack_header_allowance)//2 - \
                                len(sep) - 4
                         mag = self.EllipsizeString(m, size, e)
                         ang = self.EllipsizeString(a, size, e)
-                    s = m + config.cfg["polar_separator"] + a + " " + ang_sym
+                    s = m + self.cfg["polar_separator"] + a + " " + ang_sym
                 else:
                     # Rectangular mode
                     if brief:
@@ -2794,8 +3086,8 @@ class Calculator(object):
                     if x.real == 0:
                         # Pure imaginary
                         sign = ""
-                        if mpFormat.implicit_plus_sign == True:  sign = " "
-                        if mpFormat.explicit_plus_sign == True:  sign = "+"
+                        if self.fp.implicit_plus_sign == True:  sign = " "
+                        if self.fp.explicit_plus_sign == True:  sign = "+"
                         if x.imag < 0:
                             if x.imag == -1:
                                 s = "-" + unit
@@ -2848,10 +3140,10 @@ class Calculator(object):
             b = mpf(x.b)
             mid = mpf(x.mid)
             delta = mpf(x.delta)/2
-            f = config.cfg["fp_format"]
-            mode = config.cfg["iv_mode"]
+            f = self.cfg["fp_format"]
+            mode = self.cfg["iv_mode"]
             sp = ""
-            if config.cfg["iv_space"]:
+            if self.cfg["iv_space"]:
                 sp = " "
             if mode == "a":
                 mid = self.fp.format(mid, f)
@@ -2932,6 +3224,7 @@ class Calculator(object):
             self.display.msg(msg)
             raise
 
+    @command("regs", 0)
     def PrintRegisters(self):
         """
     Usage: regs
@@ -2955,19 +3248,12 @@ class Calculator(object):
         do this if we're not using the default configuation (-d option).
         '''
         if self.use_default_config_only: return
-        for var in config.cfg["environment"]:
+        for var in self.cfg["environment"]:
             if var in os.environ:
                 try:
-                    finished = False
-                    status = None
-                    cmd_line = os.environ[var]
-                    cmds = ParseCommandInput(cmd_line)
-                    n = len(cmds) - 1
-                    for i, cmd in enumerate(cmds):
-                        status = ProcessCommand(cmd, self.commands_dict, i==n)
-                        if status == status_quit:
-                            finished = True
-                    if finished:
+                    try:
+                        self.evaluate(os.environ[var])
+                    except SystemExit:
                         raise Exception("%sGot a quit command" % fln())
                 except Exception as e:
                     msg = "%sFor environment variable '%s', got exception:" + nl
@@ -2980,12 +3266,10 @@ class Calculator(object):
         '''
         if not self.run_checks:  return
         # Look for commands that don't have associated help strings
-        method = regex.compile(r"<bound method [_a-z][_a-z0-9]*[.]([^ ]*) of .*", regex.I)
         undocumented = []
-        for f in list(self.commands_dict.keys()):
-            if self.commands_dict[f][0].__doc__ is None:
-                name = method.match(self.commands_dict[f][0].__str__()).groups()[0]
-                undocumented.append(name)
+        for cmd in itertools.chain(self.commands.values(), self.patterns):
+            if cmd.help is None and cmd.method not in undocumented:
+                undocumented.append(cmd.method)
         if len(undocumented):
             print("undocumented functions: %s" % ' '.join(undocumented))
 
@@ -3009,6 +3293,7 @@ class Calculator(object):
         self.registers[name] = stack[0]
         return status_ok
 
+    @command("sN", aliases=["uN"], pattern=r"([su])([0-9]+)")
     def C_int(self, cmd, val):
         """
     Usage: sX or uX where X is is an integer
@@ -3030,19 +3315,13 @@ class Calculator(object):
             if n < 1:
                 msg = "%sInteger for int command must be > 0"
                 raise ValueError(msg % fln())
-            Number.bits = n
-            Zn.num_bits = n
+            self.settings.bits = n
         else:
-            Number.bits = 0
-            Zn.num_bits = 0
-        # TODO This is ugly and needs refactoring...
-        if cmd == 's':
-            Number.signed = True
-            Zn.is_signed = True
-        else:
-            Number.signed = False
-            Zn.is_signed = False
+            self.settings.bits = 0
+        self.settings.signed = cmd == 's'
+        self.settings.changed()
 
+    @command("sx", 1)  # Unsigned n-bit integer mode
     def C_sX(self, val):
         """
     Usage: sX where X is 'X' or X is an integer
@@ -3052,6 +3331,7 @@ class Calculator(object):
         """
         self.C_int('s', val)
 
+    @command("ux", 1)  # Signed n-bit integer mode
     def C_uX(self, val):
         """
     Usage: uX where X is 'X' or X is an integer
@@ -3061,6 +3341,7 @@ class Calculator(object):
         """
         self.C_int('u', val)
 
+    @command(">=", 2)  # True if x >= y
     def GreaterThanEqual(self, x, y):
         """
     Usage: y x >=
@@ -3071,6 +3352,7 @@ class Calculator(object):
         if not result and self.testing: exit(1)
         return result
 
+    @command(">", 2)  # True if x > y
     def GreaterThan(self, x, y):
         """
     Usage: y x >
@@ -3081,6 +3363,7 @@ class Calculator(object):
         if not result and self.testing: exit(1)
         return result
 
+    @command("<=", 2)  # True if x <= y
     def LessThanEqual(self, x, y):
         """
     Usage: y x <=
@@ -3091,6 +3374,7 @@ class Calculator(object):
         if not result and self.testing: exit(1)
         return result
 
+    @command("<", 2)  # True if x < y
     def LessThan(self, x, y):
         """
     Usage: y x <
@@ -3101,6 +3385,7 @@ class Calculator(object):
         if not result and self.testing: exit(1)
         return result
 
+    @command("==", 2)  # True if x == y
     def Equal(self, x, y):
         """
     Usage: y x =
@@ -3112,6 +3397,7 @@ class Calculator(object):
             exit(1)
         return result
 
+    @command("!=", 2)  # True if x != y
     def NotEqual(self, x, y):
         """
     Usage: y x !=
@@ -3123,6 +3409,7 @@ class Calculator(object):
             exit(1)
         return result
 
+    @command("=", 2)  # True if displayed strings of x & y are equal
     def DisplayEqual(self, x, y):
         """
     Usage: y x =
@@ -3140,6 +3427,7 @@ class Calculator(object):
         return result
 
     def cleanup(self):
+        import readline
         self.SaveConfiguration()
         readline.write_history_file(os.path.expanduser('~')+'/.config/hc/history')
 
@@ -3161,7 +3449,7 @@ class Calculator(object):
         else:
             while True:
                 try:
-                    line = input(config.cfg["prompt"])
+                    line = input(self.cfg["prompt"])
                     break
                 except KeyboardInterrupt:
                     print('^C')
@@ -3171,12 +3459,12 @@ class Calculator(object):
             self.display.log('--> "%s"' % line, suppress_nl=True)
         else:
             self.display.log('--> "%s"' % line)
+        return self.strip_comment(line)
+
+    def strip_comment(self, line):
         pos = line.find("#")  # Delete comments
         if pos != -1:
             line = line[:pos]
-            if pos == 0:
-                # This line was nothing but a comment
-                return ''
         return line
 
     def chomp(self, line):
@@ -3189,43 +3477,70 @@ class Calculator(object):
             tags = tags[0][3]
         return ft
 
-    def get_next_token(self, line=''):
-        # snag the next token from the line
-        from_stdin = False
-        if line == '':
-            from_stdin = True
-            line = self.read_line()
-
-        # print "got new line: '%s'" % line
-        while line != '':
-            # look for opening delimiters [, {, (
-                # increment depth
-            # look for matching closing delimeters
-                # decrement depth
-            # if depth is 0, split on whitespace and operators
-            try:
-                tokens = self.split_on.split(line)
-                tokens.append('')
-                tokens.append('')
-            except e:
-                raise ParseError("Not a command or value: '%s'"%line)
-            while len(tokens) > 0:
-                token = tokens.pop(0)
-                yield self.chomp(token), line
-            break
-
-    def prepare_args(self, fn, inf):
-        if debug(): print("prepare_args(%s,%s)"%(fn,str(inf)))
+    def get_next_token(self, line):
+        '''Generate (token, end) for each token in line, where end is the
+        offset just past the token.  Tokens are operators and words;
+        a {...}, [...] or (...) group, nested to any depth, is part of
+        the word it appears in.  A + or - starting a token and followed
+        by a digit is the sign of a number, as is the sign of an
+        exponent.  The line is scanned once, so this is linear in its
+        length.  An empty line has no tokens.
+        '''
+        space = self.lex_space.match
+        operator = self.lex_operator.match
+        word = self.lex_word.match
+        pos = space(line).end()
+        end = len(line)
+        while pos < end:
+            start = pos
+            c = line[pos]
+            if c in "+-" and line[pos+1:pos+2] in self.lex_sign_next and \
+                    (pos == 0 or line[pos-1].isspace()):
+                pos += 1
+            else:
+                mo = operator(line, pos)
+                if mo:
+                    pos = mo.end()
+                    yield line[start:pos], pos
+                    pos = space(line, pos).end()
+                    continue
+            while True:
+                pos = word(line, pos).end()
+                if pos < end and line[pos] in "{[(":
+                    pos = self.match_bracket(line, pos)
+                else:
+                    break
+            if pos == start:
+                # a closing bracket with no opening one
+                pos += 1
+            yield line[start:pos], pos
+            pos = space(line, pos).end()
+
+    def match_bracket(self, line, pos):
+        '''Return the offset just past the bracket that closes the one
+        at line[pos].
+        '''
+        depth = 0
+        for mo in self.lex_bracket.finditer(line, pos):
+            if mo.group() in "{[(":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return mo.end()
+        raise ParseError("Unbalanced '%s' in input" % line[pos])
+
+    def prepare_args(self, fn, cmd):
+        if debug(): print("prepare_args(%s,%s)"%(fn,cmd.name))
         args = []
         v = None
-        n = inf[1]
-        if len(inf) == 3 and n == 'match' and 'regex' in inf[2]:
-            matches = inf[2]['regex'].match(fn)
+        n = cmd.arity
+        if cmd.pattern:
+            matches = cmd.pattern.fullmatch(fn)
             if matches:
                 args = [ g for g in matches.groups() ]
-                if 'args' in inf[2]:
-                    while len(args) < inf[2]['args']:
-                        args.insert(0, self.pop())
+                while len(args) < cmd.args:
+                    args.insert(0, self.pop())
                 return args
             return []
         if n == 'x':
@@ -3246,58 +3561,124 @@ class Calculator(object):
             else:
                 raise IndexError("'%s' requires %d args (stack size is %d)" %
                     (fn, n, l))
-        for i in range(n):
-            val = self.pop()
-            args.insert(0, val)
-        return args
+        return self.stack.popn(n)
+
+    def compile(self, line):
+        '''Turn line into a tuple of ops, each a (handler, token, data)
+        triple that evaluate() applies in order.  Commands are resolved
+        to their Command and literals are parsed up front, so
+        running a line again skips tokenizing and parsing.  Compiled
+        lines are cached by their text and the configuration generation.
+        '''
+        return self.compiled(line, self.settings.generation)
+
+    def compile_line(self, line, generation):
+        ops = []
+        for arg, end in self.get_next_token(line):
+            cmd = self.lookup(arg)
+            if cmd is not None:
+                if cmd.rest_of_line:
+                    ops.append((self.dispatch, arg, (cmd, [line[end:]])))
+                    break
+                ops.append((self.dispatch, arg, (cmd, [])))
+            elif arg in ['null', 'nop']:
+                pass
+            else:
+                try:
+                    num = self.number(arg, '')
+                except Exception:
+                    # let the error surface when the line is run
+                    ops.append((self.push_number, arg, None))
+                    continue
+                if isinstance(num, (Julian, List, Vector)):
+                    # mutable or time dependent; parse on each run
+                    ops.append((self.push_number, arg, None))
+                else:
+                    ops.append((self.push_literal, arg, (generation, num)))
+        return tuple(ops)
+
+    def lookup(self, name):
+        '''Return the Command for name, or None if it isn't one.
+        '''
+        cmd = self.commands.get(name)
+        if cmd is None:
+            for c in self.patterns:
+                if c.pattern.fullmatch(name):
+                    return c
+        return cmd
+
+    def complete(self, text, state):
+        '''readline completer for command names.
+        '''
+        names = sorted(k for k in self.commands if k.startswith(text))
+        if state < len(names):
+            return names[state]
+        return None
+
+    def dispatch(self, arg, data):
+        '''Run the command arg against the stack.  data is its Command
+        and a list of arguments to pass after those from the stack.
+        '''
+        cmd, extra = data
+        if debug(): print(arg)
+        try:
+            args = self.prepare_args(arg, cmd)
+            if debug(): print(args)
+            try:
+                retval = getattr(self, cmd.method)(*(args + extra))
+            except (ValueError, TypeError) as e:
+                # put back what came off the stack
+                retval = [a for a in args if not isinstance(a, str)]
+                if debug():
+                    import traceback
+                    self.errors.append(traceback.format_exc())
+                else:
+                    self.errors.append(str(e))
+        except (IndexError, TypeError) as e:
+            self.errors.append(str(e))
+            return
+        if not isiterable(retval):
+            retval = [retval]
+        for v in retval:
+            if v is not None:
+                if isint_native(v):
+                    v = Zn(v)
+                self.push(v)
+
+    def push_literal(self, arg, data):
+        generation, num = data
+        if generation != self.settings.generation:
+            # an earlier command on this line changed how input parses
+            return self.push_number(arg)
+        if num is None:
+            self.errors.append("Invalid input: %s" % arg)
+        else:
+            self.push(num)
+
+    def push_number(self, arg, data=None):
+        try:
+            num = self.number(arg, '')
+            if num is None:
+                raise ValueError(arg)
+            self.push(num)
+        except ValueError:
+            self.errors.append("Invalid input: %s" % arg)
+
+    def evaluate(self, line):
+        '''Run all the commands and numbers in line against the stack.
+        Returns the last token processed.
+        '''
+        arg = ''
+        if line == '':
+            return arg
+        for handler, arg, data in self.compile(line):
+            handler(arg, data)
+        return arg
 
     def run(self):
-        isiterable = lambda obj: getattr(obj, '__iter__', False)
         while True:
-            arg = ''
             try:
-                for arg,line in self.get_next_token():
-                    if debug(): print(arg,line)
-                    if arg == "const":
-                        cv = self.commands_dict['const'][0](line)
-                        if cv is not None:
-                            self.push(cv)
-                        break
-                    elif arg in self.commands_dict:
-                        try:
-                            args = self.prepare_args(arg, self.commands_dict[arg])
-                            if debug(): print(args)
-                            try:
-                                retval = self.commands_dict[arg][0](*args)
-                            except (ValueError, TypeError) as e:
-                                retval = args
-                                if debug():
-                                    self.errors.append(traceback.format_exc())
-                                else:
-                                    self.errors.append(str(e))
-                        except (IndexError, TypeError) as e:
-                            self.errors.append(str(e))
-                            continue
-                        if not isiterable(retval):
-                            retval = [retval]
-                        for v in retval:
-                            if v is not None:
-                                if isint_native(v):
-                                    v = Zn(v)
-                                self.push(v)
-                    elif arg in ['null', 'nop']:
-                        pass
-                    else:
-                        # this should be a number....
-                        num = self.chomp(arg)
-                        #print "num = '%s', arg = '%s'"%(num,arg)
-                        if len(num) > 0:
-                            try:
-                                num = self.number(self.chomp(arg), '')
-                                if num is not None:
-                                    self.push(num)
-                            except ValueError:
-                                self.errors.append("Invalid input: %s" % arg)
+                arg = self.evaluate(self.read_line())
                 if arg not in ['help', '?']:
                     self.DisplayStack()
             except EOFError:
@@ -3308,11 +3689,66 @@ class Calculator(object):
             except SystemExit:
                 raise
             except:
+                import traceback
                 print("Something bad happened.  Don't do that again!")
                 type,value,tb = sys.exc_info()
                 traceback.print_exception(type, value, tb, None, sys.stdout)
+        import readline
         readline.write_history_file()
 
+    def batch(self, stream, out=sys.stdout):
+        '''Evaluate each line of stream as its own program on a fresh stack
+        and write the resulting x value (or an empty line if the stack is
+        empty) to out, so output lines match input lines one for one.
+        Errors go to the display's error stream prefixed with the line
+        number.  Returns the number of lines that had errors.
+        '''
+        write = out.write
+        failed = 0
+        for lineno, line in enumerate(stream, 1):
+            result, errors = self.batch_line(line)
+            write(result + nl)
+            if errors:
+                failed += 1
+                for e in errors:
+                    self.display.err("%d: %s" % (lineno, e))
+        return failed
+
+    def batch_line(self, line):
+        '''Evaluate line on a fresh stack and registers, with the settings
+        the first batch line started with:  a mode the line changes
+        (modulo, hex, C integer width, precision...) applies to that line
+        only, so the output doesn't depend on how lines are split among
+        --jobs.  Returns the formatted x value ('' if the stack is empty)
+        and the list of error messages.
+        '''
+        if self.batch_state is None:
+            self.batch_state = self.batch_settings()
+        self.stack.clear_stack()
+        self.registers = {}
+        self.errors = []
+        try:
+            self.evaluate(self.strip_comment(line))
+        except SystemExit:
+            raise
+        except Exception as e:
+            self.errors.append(str(e) or e.__class__.__name__)
+        result = ''
+        if len(self.stack):
+            result = self.Format(self.stack[0]).strip()
+        if self.batch_settings() != self.batch_state:
+            cfg, bits, signed, prec, rounding = self.batch_state
+            s = self.settings
+            s.cfg, s.bits, s.signed = dict(cfg), bits, signed
+            self.ConfigChanged()
+            mp.prec, mp.rounding = prec, rounding
+        return result, self.errors
+
+    def batch_settings(self):
+        s = self.settings
+        return dict(s.cfg), s.bits, s.signed, mp.prec, mp.rounding
+
+    @command("help", aliases=["?"], rest_of_line=True)
     def help(self, args=None):
         """
     Usage: help [function]
@@ -3325,19 +3761,23 @@ class Calculator(object):
             args = args.split()
             if args:
                 arg = args[0]
-                if arg not in self.commands_dict:
-                    arg, line = self.get_next_token()
-                if arg in self.commands_dict:
-                    if self.commands_dict[arg][0].__doc__ is None:
+                cmd = self.lookup(arg)
+                if cmd is None:
+                    for c in self.patterns:
+                        if arg in c.names:
+                            cmd = c
+                if cmd is not None:
+                    if cmd.help is None:
                         print("No help for %s" % arg)
                     else:
-                        print(self.commands_dict[arg][0].__doc__)
+                        print(cmd.help)
                 else:
                     print("unknown function:", arg)
                 return
         maxlen = 0
         functions = []
-        for k in self.commands_dict.keys():
+        for k in itertools.chain(self.commands.keys(),
+                                 *(c.names for c in self.patterns)):
             maxlen = max(maxlen, len(k))
             functions.append(k)
         functions.sort();
@@ -3360,8 +3800,9 @@ class Calculator(object):
     Lists the constants available for use by name
         """
         for a,k in self.constants.items():
-            print("%s = %s" % (a, k.show(self.base, config.cfg["prec"], self.vector_mode, self.angle_mode)))
+            print("%s = %s" % (a, k.show(self.base, self.cfg["prec"], self.vector_mode, self.angle_mode)))
 
+    @command("warranty", 0)  # Show warranty
     def warranty(self):
         """
     Usage: warranty
@@ -3383,6 +3824,7 @@ parsing of things that should break
     dup23
         """)
 
+    @command("quit", 0)  # Exit the program
     def quit(self):
         """
     Usage: quit
@@ -3396,15 +3838,29 @@ def ParseCommandLine(args):
     usage = "usage: %prog [options]"
     descr = "Command line RPN calculator"
     parser = OptionParser(usage, description=descr)
-    c,d,r,g,v = ("Check that commands have help info",
+    c,d,r,g,v,b = ("Check that commands have help info",
                    "Use default configuration in hc.py file only",
                    "Read input from file",
                    "Start with debug enabled",
-                   "Display program version")
+                   "Display program version",
+                   "Evaluate each line of FILE ('-' for stdin) on its own "
+                   "stack and print one result per line")
+    j,k = ("Number of processes for --batch (0 for one per CPU) or "
+           "threads for slow --serve requests",
+           "Lines handed to a --batch process at a time")
+    s = ("Serve sessions on ADDRESS: a Unix socket path, or a TCP "
+         "[host:]port (host defaults to 127.0.0.1)")
+    parser.add_option("-b", "--batch", metavar="FILE", help=b)
+    parser.add_option("--serve", metavar="ADDRESS", help=s)
+    parser.add_option("-j", "--jobs", type="int", default=1, metavar="N", help=j)
+    parser.add_option("--chunk-size", type="int", default=1000, metavar="N",
+                      help=k)
     parser.add_option("-c", "--run-checks", action="store_true", help=c)
     parser.add_option("-d", "--default-config", action="store_true", help=d)
     parser.add_option("-r", "--read-file", dest="file", help=r)
     parser.add_option("-g", "--debug", action="store_true", help=g)
+    parser.add_option("-q", "--quiet", action="store_true",
+                      help="Don't print startup messages")
     parser.add_option("-v", "--version", action="store_true", help=v)
     return parser.parse_args(args, values=None)
 
@@ -3413,6 +3869,21 @@ def main(argv):
     status = None
     opt, arg = ParseCommandLine(argv)
     calculator = Calculator(arg, opt)
+    if opt.batch is not None:
+        if opt.batch == "-":
+            stream = sys.stdin
+        else:
+            stream = open(opt.batch)
+        if opt.jobs == 1:
+            failed = calculator.batch(stream)
+        else:
+            from . import batch
+            failed = batch.run(opt, stream, sys.stdout, calculator.display)
+        sys.exit(failed and 1)
+    if opt.serve is not None:
+        from . import serve
+        serve.run(opt, calculator.display)
+        sys.exit(0)
     try:
         calculator.run()
     except KeyboardInterrupt as e:
@@ -35,8 +35,7 @@ from mpmath import mpf, mp, nan, inf, nstr
 from mpmath.libmp.libmpf import to_digits_exp, fzero, finf, fninf, fnan
 from .si import suffixes_nl
 
-try: from pdb import xx  # pdb.set_trace is xx; easy to find for debugging
-except: pass
+# For debugging:  from pdb import set_trace as xx
 
 class mpFormatException(Exception): pass
 
@@ -82,7 +81,8 @@ class mpFormat(object):
          12.34567890 k
          12.34567890k
 
-    Class variables:
+    Class variables (the defaults; setting one on an instance changes
+    only that instance):
 
         fix_low     If the number is less than this, the fix mode
                     underflows to the sci format.
@@ -168,8 +168,8 @@ class mpFormat(object):
             s = s[:e+1]
             if s[-1] == '.': s = s[:-1]
             if number >= 0:
-                if mpFormat.implicit_plus_sign == True:  sign = " "
-                if mpFormat.explicit_plus_sign == True:  sign = "+"
+                if self.implicit_plus_sign == True:  sign = " "
+                if self.explicit_plus_sign == True:  sign = "+"
             return "%s%s" % (sign, s)
 
     def _pathological(self, number):
@@ -197,15 +197,15 @@ class mpFormat(object):
         dps = max(1, min(dps, mp.dps))
         if not s[1]:
             if s == fzero:
-                if mpFormat.implicit_plus_sign: sign = " "
-                if mpFormat.explicit_plus_sign: sign = "+"
+                if self.implicit_plus_sign: sign = " "
+                if self.explicit_plus_sign: sign = "+"
                 return sign, '0', 0
             if s == finf or s == fninf or s == fnan:
                 raise ValueError("_to_estr:  should have caught pathology")
         sign, digits, exponent = to_digits_exp(s, dps+3)
-        if sign == "" and mpFormat.implicit_plus_sign: sign = " "
+        if sign == "" and self.implicit_plus_sign: sign = " "
         if (sign == "" or sign == " ") and \
-           mpFormat.explicit_plus_sign:
+           self.explicit_plus_sign:
             sign = "+"
         if not dps:
             if digits[0] in '56789':
@@ -227,12 +227,12 @@ class mpFormat(object):
     def fix(self, number):
         s = self._pathological(number)
         if s: return s
-        if number != 0 and abs(number) <= mpFormat.fix_low or \
-                           abs(number) >= mpFormat.fix_high:
+        if number != 0 and abs(number) <= self.fix_low or \
+                           abs(number) >= self.fix_high:
             return self.sci(number)
         sign, mant, exp = self._to_estr(number, mp.dps)
         digits = self.num_digits
-        dp = mpFormat.decimal_point
+        dp = self.decimal_point
         mant = mant[0] + mant[2:]  # Remove the decimal point
         if digits < mp.dps:
             # Round the mantissa if needed
@@ -260,7 +260,7 @@ class mpFormat(object):
         elif digits_to_right_of_dp > digits:
             # Truncate, as we have too many digits
             mant = mant[:-(digits_to_right_of_dp - digits)]
-        if mpFormat.comma_decorate:
+        if self.comma_decorate:
             mant = self.decorate_with_comma(mant)
         return sign + mant
 
@@ -268,9 +268,9 @@ class mpFormat(object):
         s = self._pathological(number)
         if s: return s
         sign, mant, exp = self._to_estr(number, self.num_digits)
-        s = sign + mant + mpFormat.exponent_character + \
-            (mpFormat.exponent_format % exp)
-        if not mpFormat.show_zero_exponent and exp == 0:
+        s = sign + mant + self.exponent_character + \
+            (self.exponent_format % exp)
+        if not self.show_zero_exponent and exp == 0:
             return sign + mant
         return s
 
@@ -279,9 +279,9 @@ class mpFormat(object):
         s = self._pathological(number)
         if s: return s
         mant, exp = self._eng(number)
-        s = mant + mpFormat.exponent_character + \
-            (mpFormat.exponent_format % exp)
-        if not mpFormat.show_zero_exponent and exp == 0:
+        s = mant + self.exponent_character + \
+            (self.exponent_format % exp)
+        if not self.show_zero_exponent and exp == 0:
             return mant
         return s
 
@@ -292,7 +292,7 @@ class mpFormat(object):
         mant, exp = self._eng(number)
         if exp in suffixes_nl:
             spc = " "
-            if mpFormat.cuddle_si: spc = ""
+            if self.cuddle_si: spc = ""
             return mant + spc + suffixes_nl[exp]
         else:
             return self.eng(number)
@@ -307,7 +307,7 @@ class mpFormat(object):
             dp += 1
             if len(mant) < dp:
                 mant += "0"*max(0, dp - len(mant))
-            mant = mant[:dp] + mpFormat.decimal_point + mant[dp:]
+            mant = mant[:dp] + self.decimal_point + mant[dp:]
         else:
             mant += "0"*dp
         return sign + mant, 3*num3
@@ -315,12 +315,12 @@ class mpFormat(object):
     def sig(self, number):
         s = self._pathological(number)
         if s: return s
-        if number != 0 and abs(number) <= mpFormat.sig_low or \
-                           abs(number) >= mpFormat.sig_high:
+        if number != 0 and abs(number) <= self.sig_low or \
+                           abs(number) >= self.sig_high:
             return self.sci(number)
         digits = self.num_digits
         sign, mant, exp = self._to_estr(number, digits)
-        dp = mpFormat.decimal_point
+        dp = self.decimal_point
         mant = mant[0] + mant[2:]  # Remove the decimal point
         exp += 1  # Now implied decimal point is at left of mantissa
         if exp < 0:
@@ -336,35 +336,35 @@ class mpFormat(object):
                 if len(mant) < digits:
                     mant += "0"*max(0, digits - len(mant))
                 mant = mant[:exp] + dp + mant[exp:]
-        if mpFormat.comma_decorate:
+        if self.comma_decorate:
             mant = self.decorate_with_comma(mant)
         return sign + mant
 
     def decorate_with_comma(self, mant):
-        dp = mant.find(mpFormat.decimal_point)
+        dp = mant.find(self.decimal_point)
         # Separate into two strings on either side of decimal point
         fp = mant[dp+1:]  # Fractional part
         ip = mant[:dp]    # Integer part
-        if mpFormat.left_comma_spacing > 0 and \
-           dp >= mpFormat.left_comma_spacing:
+        if self.left_comma_spacing > 0 and \
+           dp >= self.left_comma_spacing:
             ip = list(ip)
             ip.reverse()
             s = []
             for i, digit in enumerate(ip):
-                if i != 0 and i % mpFormat.left_comma_spacing == 0:
-                    s.append(mpFormat.left_comma_character)
+                if i != 0 and i % self.left_comma_spacing == 0:
+                    s.append(self.left_comma_character)
                 s.append(digit)
             s.reverse()
             ip = "".join(s)
-        if mpFormat.right_comma_spacing > 0:
+        if self.right_comma_spacing > 0:
             fp = list(fp)
             s = []
             for i, digit in enumerate(fp):
-                if i != 0 and i % mpFormat.right_comma_spacing == 0:
-                    s.append(mpFormat.right_comma_character)
+                if i != 0 and i % self.right_comma_spacing == 0:
+                    s.append(self.right_comma_character)
                 s.append(digit)
             fp = "".join(s)
-        return ip + mpFormat.decimal_point + fp
+        return ip + self.decimal_point + fp
 
 if __name__ == "__main__":
     # Test the mpFormat class.
@@ -35,16 +35,20 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
 from mpmath import mpf, mpc, mpi, ctx_iv, eps, mp, pi, root
-from .mpformat import mpFormat, inf
+from .mpformat import inf
 from .debug import *
-import socket
+from collections import OrderedDict
+import math
+import operator
+import sys
+from decimal import Decimal, Context as DecimalContext, Inexact, \
+        MAX_PREC, MAX_EMAX, MIN_EMIN
 import time
 import re
 from .si import suffixes_ln
-from . import config
+from . import settings
 
-try: from pdb import xx  # pdb.set_trace is xx; easy to find for debugging
-except: pass
+# For debugging:  from pdb import set_trace as xx
 
 def isint_native(x):
     return isinstance(x, int)
@@ -53,56 +57,174 @@ def isint(x):
     return isinstance(x, (int, Zn))
 
 def gcd(a, b):
-    '''Determine the greatest common divisor of integers u and v.
-    Euclid's algorithm from Knuth, vol 2, pg 320.
+    '''Return the greatest common divisor of the integers a and b.
     '''
     if not isint(a) or not isint(b):
         raise ValueError("Arguments must be integers")
-    a, b = int(a), int(b)
-    if a == 0:  return b
-    if b == 0:  return a
-    while b != 0:
-        a, b = b, a % b
-    return a
+    return math.gcd(int(a), int(b))
+
+# str() takes time quadratic in the number of digits and by default
+# refuses more than 4300 digits, so integers longer than this many bits
+# are converted by int_str
+str_cutover = 1 << 13
+
+# Likewise for int(), decimal strings longer than this are read by str_int
+int_cutover = 2048
+
+_decimal_context = DecimalContext(prec=MAX_PREC, Emax=MAX_EMAX,
+                                  Emin=MIN_EMIN, traps=[Inexact])
+
+def int_str(n):
+    '''Return the decimal string of the integer n.  A large n is split
+    in halves by bits until the pieces are small enough for str(), and
+    the pieces are put back together with the decimal module, whose
+    multiplication is fast for numbers this size.
+    '''
+    if n.bit_length() <= str_cutover:
+        return str(n)
+    c = _decimal_context
+    powers = {}
+    def power(w):
+        'Return 2**w as a Decimal.'
+        p = powers.get(w)
+        if p is None:
+            if w <= str_cutover:
+                p = Decimal(1 << w)
+            else:
+                p = c.multiply(power(w >> 1), power(w - (w >> 1)))
+            powers[w] = p
+        return p
+    def convert(n, w):
+        'Return the n of w bits or fewer as a Decimal.'
+        if w <= str_cutover:
+            return Decimal(n)
+        half = w >> 1
+        hi = n >> half
+        lo = n - (hi << half)
+        return c.add(c.multiply(convert(hi, w - half), power(half)),
+                     convert(lo, half))
+    if n < 0:
+        return "-" + int_str(-n)
+    return str(convert(n, n.bit_length()))
+
+def str_int(s, base=10):
+    '''Return int(s, base).  A long decimal string is split in halves
+    until the pieces are short enough for int(), and the pieces are put
+    back together with multiplications by powers of ten.
+    '''
+    if base != 10 or len(s) <= int_cutover:
+        return int(s, base)
+    t = s.strip().replace("_", "")
+    sign = t[:1]
+    if sign in ("+", "-"):
+        t = t[1:]
+    if not t.isdecimal():
+        raise ValueError("invalid literal for int() with base 10: %r" % s)
+    powers = {}
+    def convert(t):
+        'Return the value of the digit string t.'
+        if len(t) <= int_cutover:
+            return int(t)
+        w = len(t) >> 1
+        p = powers.get(w)
+        if p is None:
+            p = powers[w] = 10**w
+        return convert(t[:-w])*p + convert(t[-w:])
+    n = convert(t)
+    return -n if sign == "-" else n
+
+_new_object = object.__new__
 
 class Rational(object):
-    mixed = False  # If set to true, str() returns mixed form
+    '''A fraction n/d in lowest terms with d > 0.  Rationals are
+    immutable and hash like the equal int or fractions.Fraction.
+    '''
+    __slots__ = ("n", "d")
+
     def __init__(self, a=0, b=1):
         if b == 1:
             if isinstance(a, mpf):
                 r = self.frac(a)
                 self.n, self.d = r.n, r.d
                 return
-            else:
-                try:
-                    # C++ copy constructor behavior
-                    self.n = a.numer()
-                    self.d = a.denom()
-                    return
-                except:
-                    pass
+            elif isinstance(a, Rational):
+                self.n, self.d = a.n, a.d
+                return
+        if not isint(a) or not isint(b):
+            raise ValueError("Arguments must be integers")
+        a, b = int(a), int(b)
         if b == 0:
             raise ZeroDivisionError("Denominator is zero")
+        g = math.gcd(a, b)
+        if b < 0:
+            g = -g
+        self.n = a//g
+        self.d = b//g
+
+    @staticmethod
+    def _make(n, d):
+        '''Return n/d without reducing it; n and d must already be in
+        lowest terms with d > 0.
+        '''
+        r = _new_object(Rational)
+        r.n = n
+        r.d = d
+        return r
+
+    @staticmethod
+    def _reduce(n, d):
+        'Return n/d reduced, for d > 0.'
+        g = math.gcd(n, d)
+        if g == 1:
+            return Rational._make(n, d)
+        return Rational._make(n//g, d//g)
+
+    def _add(self, n, d):
+        '''Return self + n/d as a Rational.  The denominators' gcd is
+        taken out first so the numbers being reduced stay small (Knuth,
+        vol 2, 4.5.1).
+        '''
+        g = math.gcd(self.d, d)
+        if g == 1:
+            return Rational._make(self.n*d + n*self.d, self.d*d)
+        s = self.d//g
+        t = self.n*(d//g) + n*s
+        g2 = math.gcd(t, g)
+        if g2 == 1:
+            return Rational._make(t, s*d)
+        return Rational._make(t//g2, s*(d//g2))
+
+    def _mul(self, n, d):
+        'Return self * n/d as a Rational, for n/d in lowest terms.'
+        g1 = math.gcd(self.n, d)
+        if g1 > 1:
+            a, d = self.n//g1, d//g1
+        else:
+            a = self.n
+        g2 = math.gcd(n, self.d)
+        if g2 > 1:
+            n, b = n//g2, self.d//g2
         else:
-            g = gcd(a, b)
-            self.n = int(a)//g
-            self.d = int(b)//g
+            b = self.d
+        if d < 0:
+            n, d = -n, -d
+        return Rational._make(a*n, b*d)
 
     def __abs__(self):
-        return Rational(abs(self.n), abs(self.d))
+        return Rational._make(abs(self.n), self.d)
 
     def __pos__(self):
-        return Rational(self)
+        return self
 
     def __neg__(self):
-        return Rational(-self.n, self.d)
+        return Rational._make(-self.n, self.d)
 
     def __radd__(self, other):
         return self.__add__(other)
 
     def __add__(self, other):
         if isinstance(other, Rational):
-            y = Rational(self.n*other.d + other.n*self.d, self.d*other.d)
+            y = self._add(other.n, other.d)
             if y.d == 1:
                 return y.n
             else:
@@ -110,11 +232,11 @@ class Rational(object):
         elif isinstance(other, float):
             raise ValueError("float addition not supported")
         else:
-            assert isinstance(other, int) or isinstance(other, mpf) or \
+            assert isint(other) or isinstance(other, mpf) or \
                    isinstance(other, mpc) or isinstance(other, ctx_iv.ivmpf)
             n = other*self.d + self.n
             if isinstance(n, int):
-                y = Rational(n, self.d)
+                y = Rational._reduce(n, self.d)
                 if y.d == 1:
                     return y.n
                 else:
@@ -127,15 +249,15 @@ class Rational(object):
 
     def __sub__(self, other):
         if isinstance(other, Rational):
-            return Rational(self.n*other.d - other.n*self.d, self.d*other.d)
+            return self._add(-other.n, other.d)
         elif isinstance(other, float):
             raise ValueError("float subtraction not supported")
         else:
-            assert isint(other) or isinstance(other, mpf) or isinstance(other, Rational) or \
+            assert isint(other) or isinstance(other, mpf) or \
                    isinstance(other, mpc) or isinstance(other, ctx_iv.ivmpf)
             n = self.n - other*self.d
             if isinstance(n, int):
-                y = Rational(n, self.d)
+                y = Rational._reduce(n, self.d)
                 if y.d == 1:
                     return y.n
                 else:
@@ -148,7 +270,7 @@ class Rational(object):
 
     def __mul__(self, other):
         if isinstance(other, Rational):
-            return Rational(self.n*other.n, self.d*other.d)
+            return self._mul(other.n, other.d)
         elif isinstance(other, float):
             raise ValueError("float multiplication not supported")
         else:
@@ -156,7 +278,7 @@ class Rational(object):
                    isinstance(other, mpc) or isinstance(other, ctx_iv.ivmpf)
             n = other*self.n
             if isinstance(n, int):
-                y = Rational(n, self.d)
+                y = Rational._reduce(n, self.d)
                 if y.d == 1:
                     return y.n
                 else:
@@ -164,18 +286,20 @@ class Rational(object):
             else:
                 return n/self.d
 
-    def __rdiv__(self, other):
-        one = Rational(1)
-        return one/(self*(one/other))
+    def __rtruediv__(self, other):
+        if self.n == 0:
+            raise ZeroDivisionError("Divisor is zero")
+        if isint(other):
+            return Rational(int(other)*self.d, self.n)
+        return (other*self.d)/self.n
 
-    def __div__(self, other):
-        # print "rational::__div__", self, other, type(other)
+    def __truediv__(self, other):
         if other == 0:
             raise ZeroDivisionError("Divisor is zero")
         if isinstance(other, Rational):
-            return Rational(self.n*other.d, self.d*other.n)
+            return self._mul(other.d, other.n)
         elif isint(other):
-            return Rational(self.n, self.d*int(other))
+            return self._mul(1, int(other))
         elif isinstance(other, float):
             raise ValueError("float division not supported")
         else:
@@ -184,9 +308,6 @@ class Rational(object):
                    isinstance(other, ctx_iv.ivmpf)
             return (self.n/other)/self.d
 
-    def __truediv__(self, other):
-        return self.__div__(other)
-
     def __pow__(self, y):
         x1 = mpf(self.n)/mpf(self.d)
         if isinstance(y, Rational):
@@ -217,10 +338,11 @@ class Rational(object):
     def __str__(self):
         if self.d == 1:
             return "%d" % self.n
-        if config.cfg["no_rationals"]:
+        cfg = settings.current().cfg
+        if cfg["no_rationals"]:
             v = mpf(self.n)/mpf(self.d)
             return v.__str__()
-        if Rational.mixed:
+        if cfg["mixed_fractions"]:
             return self._mixed()
         else:
             return "%d/%d" % (self.n, self.d)
@@ -231,40 +353,58 @@ class Rational(object):
     def __float__(self):
         return float(self.n)/self.d
 
-    def __getattr__(self, key):
-        '''This function is necessary when a Rational gets compared to an
-        mpf.  The mpf comparison routine looks for the _mpf_ attribute; if
-        it finds it, then it knows it has an mpf.  We fake it out by doing
-        an mpf conversion at the point the information is needed.  Thus,
-        the comparison will be done with the proper number of digits; this
-        wouldn't necessarily be true if we cached the _mpf_ data earlier.
+    def get_mpf(self):
+        '''mpmath looks for _mpf_ to use a Rational as an mpf.  It is
+        converted when asked for, so it is done with the current number
+        of digits.
         '''
-        if key == "_mpf_":
-            return (mpf(self.n)/mpf(self.d))._mpf_
-        else:
-            raise AttributeError("'%s' not an attribute" % key)
+        return (mpf(self.n)/mpf(self.d))._mpf_
 
-    def __cmp__(self, other):
-        if other == None:
-            return -1
+    _mpf_ = property(get_mpf)
+
+    def _compare(self, other, op):
+        '''Return op applied to the numerators of self and other over a
+        common (positive) denominator, or to the mpf values.
+        '''
         if isinstance(other, Rational):
-            if (self.n == other.n) and (self.d == other.d):
-                return 0
-            else:
-                if self.mpf() < other.mpf(): return -1
-                else: return 1
+            return op(self.n*other.d, other.n*self.d)
+        elif isint(other):
+            return op(self.n, int(other)*self.d)
         elif isinstance(other, mpf):
-            a, b = self.mpf(), other.mpf()
-            if a < b: return -1
-            elif a > b: return 1
-            else: return 0
-        elif isinstance(other, int):
-            a, b = self.mpf(), mpf(other)
-            if a < b: return -1
-            elif a > b: return 1
-            else: return 0
-        else:
-            raise ValueError("Second argument is unsupported type")
+            return op(self.mpf(), other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt)
+
+    def __le__(self, other):
+        return self._compare(other, operator.le)
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge)
+
+    def __eq__(self, other):
+        if isinstance(other, Rational):
+            return self.n == other.n and self.d == other.d
+        elif isint(other):
+            return self.d == 1 and self.n == int(other)
+        elif isinstance(other, mpf):
+            return self.mpf() == other
+        return NotImplemented
+
+    def __hash__(self):
+        # The same as fractions.Fraction.__hash__
+        modulus = sys.hash_info.modulus
+        try:
+            h = hash(hash(abs(self.n))*pow(self.d, -1, modulus))
+        except ValueError:
+            h = sys.hash_info.inf
+        if self.n < 0:
+            h = -h
+        return -2 if h == -1 else h
 
     def mpf(self):
         return mpf(self.n)/mpf(self.d)
@@ -282,33 +422,28 @@ class Rational(object):
     def numer(self):
         return self.n
 
-    def frac(self, x, digits=0, max_iterations=0):
+    def frac(self, x, digits=0, max_denominator=0):
         '''Converts an mpf to a Rational approximation and returns a
-        Rational object.  The iteration goal is to return a rational
-        approximation whose difference from x is less than 1/10**mp.dps;
-        i.e., the approximation as good as the current number of digits
-        used in the mpmath library.
-
-        x will be converted to an mpf type.  This routine is converted from
-        a C routine I downloaded from NETLIB on Tue Nov 11 18:08:26 1997
-        from NIST Guide to Available Math Software, source for module FRAC
-        from package C.
-
-        digits sets the precision of the conversion at 10**(-digits).  If
-        it is 0, then mp.dps is used.
-
-        Set max_iterations to a postive nonzero value to limit the number
-        of iterations.
-
-        See http://gams.nist.gov/,
-        http://gams.nist.gov/serve.cgi/Package/C/,
-        http://www.netlib.org/c/frac (location of actual source)
+        Rational object:  the one with the smallest denominator whose
+        relative difference from x is at most 10**(-digits).  If digits
+        is 0, then mp.dps is used.
+
+        x will be converted to an mpf type.  An mpf is exactly
+        mantissa*2**exponent, so the continued fraction of that ratio is
+        expanded with integer arithmetic; the answer is the first
+        convergent close enough to x, or the smallest intermediate
+        fraction before it that is.  Nothing depends on or changes the
+        mpmath precision.
+
+        Set max_denominator to a positive nonzero value to limit the
+        denominator; the closest fraction within the limit is returned
+        if none close enough is.
         '''
         if isinstance(x, mpc) or isinstance(x, complex):
             x = abs(x)
         elif isinstance(x, ctx_iv.ivmpf):
             x = x.mid
-        elif isinstance(x, int) or isinstance(x, int):
+        elif isinstance(x, int):
             x = mpf(x)
         elif isinstance(x, Zn):
             x = mpf(int(x))
@@ -316,66 +451,54 @@ class Rational(object):
             if not isinstance(x, mpf):
                 # Note we explicitly do not handle floats
                 raise SyntaxError("Unsupported type")
-        # Handle a special case that results in no convergence.
-        if x == mpf("1")/mpf("2"):
-            return Rational(1, 2)
-        digits_increase = 2
+        sign, man, exp, bc = x._mpf_
+        if not man:
+            if exp:
+                raise ValueError("%sCan't convert %s to a rational" % (fln(), x))
+            return Rational._make(0, 1)
+        # x is p/q exactly
+        if exp >= 0:
+            p, q = man << exp, 1
+        else:
+            p, q = man, 1 << -exp
         if digits == 0:
             digits = mp.dps
-        error = mpf(10)**(-digits)
-        # We'll increase the precision to ensure the error is greater
-        # than the minimal fractional digits.
-        mp.dps += digits_increase
-        sign = 1
-        if x < 0:
-            sign = -1
-            x = abs(x)
-        if x == 0:
-            mp.dps -= digits_increase
-            return Rational(0, 1)
-        d, D, n, r, epsilon, iterations = 1, 1, int(x), mpf(1), mpf(0), 0
-        N = n + 1
-        one = True
+        scale = 10**digits
+        # The last two convergents; h1/k1 is the latest
+        h0, k0, h1, k1 = 0, 1, 1, 0
+        num, den = p, q
         while True:
-            iterations += 1
-            if max_iterations and iterations > max_iterations:
-                raise Exception("Too many iterations")
-            if not one:
-                if r > 1.0:
-                    N += n*int(r)
-                    D += d*int(r)
-                    n += N
-                    d += D
-                else:
-                    r = 1.0/r
-            else:
-                one = False
-            r = 0.0
-            if x*d != n:
-                r = (N - x*D)/(x*d - n)
-                if r <= 1.0:
-                    t = N
-                    N = n
-                    n = t
-                    t = D
-                    D = d
-                    d = t
-            epsilon = abs(1.0 - n/(x*d))
-            if epsilon <= error:
-                mp.dps -= digits_increase
-                return Rational(sign*n, d)
-            if r != 0.0:
-                continue
-            m = 10.0
-            while m*epsilon < 1.0:
-                m *= 10.0
-            epsilon = (1.0/m)*(int(0.5 + m*epsilon))
-            if r == 0.0:
-                mp.dps -= digits_increase
-                raise Exception("Error in frac() routine")
-
-if __name__ == "__main__":
+            a, r = divmod(num, den)
+            h2, k2 = a*h1 + h0, a*k1 + k0
+            if max_denominator and k2 > max_denominator:
+                # The best fraction within the limit is the last
+                # convergent or the largest intermediate fraction after it
+                t = (max_denominator - k0)//k1
+                hs, ks = t*h1 + h0, t*k1 + k0
+                if abs(p*ks - hs*q)*k1 < abs(p*k1 - h1*q)*ks:
+                    h1, k1 = hs, ks
+                break
+            # r is |p*k2 - h2*q|, so this is |x - h2/k2| <= x/scale
+            if r*scale <= p*k2:
+                # The intermediate fractions (t*h1 + h0)/(t*k1 + k0),
+                # t = 1..a, get closer to x as t grows; their errors
+                # are d0 - t*d1, so the smallest close enough has the
+                # least t with (d0 - t*d1)*scale <= p*(t*k1 + k0)
+                d0, d1 = abs(p*k0 - h0*q), abs(p*k1 - h1*q)
+                t = max(1, -((p*k0 - d0*scale)//(d1*scale + p*k1)))
+                h1, k1 = t*h1 + h0, t*k1 + k0
+                break
+            h0, k0, h1, k1 = h1, k1, h2, k2
+            num, den = den, r
+        if sign:
+            h1 = -h1
+        return Rational._make(h1, k1)
+
+def _rational_tests():
     # Test code
+    cfg = settings.current().cfg
+    cfg["no_rationals"] = False
+    cfg["mixed_fractions"] = False
 
     def gcd_tests():
         assert(gcd(8, 12) == 4)
@@ -385,7 +508,7 @@ if __name__ == "__main__":
 
     def generalTests():
         three = Rational(3)
-        assert(str(three) == "3/1")
+        assert(str(three) == "3")
         third = Rational(1,3)
         assert(str(third) == "1/3")
         fifth = Rational(1,5)
@@ -403,7 +526,7 @@ if __name__ == "__main__":
 
     def mixedTests():
         badPi = Rational(22,7)
-        Rational.mixed = True
+        settings.current().cfg["mixed_fractions"] = True
         assert(str(badPi) == "3 1/7")
         proper_fraction = Rational(3,5)
         assert(str(proper_fraction) == "3/5")
@@ -536,20 +659,23 @@ if __name__ == "__main__":
         assert not (third != Rational(1, 3))
 
     def fracTest():
-        '''I experimentally determined that factor = 3.1 for the loop
-        shown up to 1000 digits (but it only goes to 100 for speed).
-        '''
-        factor = mpf(3.1)
-        for digits in range(5, 100, 5):
+        for digits in range(5, 1000, 5):
             mp.dps = digits
-            r = Rational()
-            approx = r.frac(pi)
-            num = mpf(approx.n)/approx.d
-            #assert abs(pi - num) < factor*mpf(10)**(-digits)
-            if abs(pi - num) > factor*mpf(10)**(-digits):
-                print("digits", digits, end=' ')
-                a = str(abs(pi - num))
-                print(a[:6], a[-6:])
+            x = +pi
+            approx = Rational().frac(x)
+            with mp.workdps(3*digits):
+                num = mpf(approx.n)/approx.d
+                assert abs(x - num) <= x*mpf(10)**(-digits)
+        mp.dps = 15
+        assert Rational().frac(+pi, 0, 1000) == Rational(355, 113)
+        assert Rational().frac(mpf(-0.75)) == Rational(-3, 4)
+        assert Rational().frac(mpf(0.3), 1) == Rational(2, 7)
+        for x in (mpf(0.3), +pi, mpf(2)/7 + mpf(10)**-4, mpf(123.456)):
+            for digits in range(1, 8):
+                r = Rational().frac(x, digits)
+                close = lambda n, d: abs(x - mpf(n)/d)*10**digits <= x
+                assert close(r.n, r.d)
+                assert not any(close(int(x*d + mpf(0.5)), d) for d in range(1, r.d))
     generalTests()
     mixedTests()
     errorTests()
@@ -558,7 +684,6 @@ if __name__ == "__main__":
     mpiTests()
     comparisonTest()
     fracTest()
-    exit(0)
 '''
 $Id: integer.py 1.22 2009/02/10 05:24:01 donp Exp $
 
@@ -576,11 +701,16 @@ are:
                 characteristic, this only applies when bits is
                 nonzero.
 
-    C_division  If True, integer division behaves like it does in C;
-                i.e., 3/8 == -3/8 == 3/-8 == 0.  If False, then the
-                behavior is pythonic:  floor division.  This means
+    C_division  True (read only) when bits is nonzero:  integer
+                division then behaves like it does in C; i.e.,
+                3/8 == -3/8 == 3/-8 == 0.  Unlimited integers divide
+                pythonically:  floor division.  This means
                 -3/8 == 3/-8 == -1.
 
+A shift count is the value of the right operand as it is, not reduced
+to the width of the left one; a negative count is a ValueError, as it
+is for Python integers.
+
 Four bit two's complement representation:
 Uns binary 2's comp
 15  1111   -1
@@ -602,147 +732,207 @@ Uns binary 2's comp
 '''
 
 
+class Width(object):
+    '''The constants for one integer size and signedness:  the number of
+    bits, the base (2**bits), the mask of the low bits and the sign bit.
+    Every Zn refers to the Width it was made with, and all Zn of the same
+    size and signedness share one, so nothing is recomputed per value.
+    Use Width.get() rather than constructing them.
+
+    small holds the interned Zn of this width for the values from
+    Zn.small_min to Zn.small_max, made on first use.
+    '''
+    __slots__ = ("bits", "signed", "base", "mask", "sign_bit", "small")
+
+    # Width objects by (bits, signed)
+    widths = {}
+
+    def __init__(self, bits, signed):
+        self.bits = bits
+        # Unlimited integers are always signed
+        self.signed = signed or bits == 0
+        self.base = 1 << bits if bits else 0
+        self.mask = self.base - 1
+        self.sign_bit = self.base >> 1
+        self.small = None
+
+    @staticmethod
+    def get(bits, signed):
+        '''Return the shared Width for bits (0 for unlimited) and signed.
+        '''
+        w = Width.widths.get((bits, signed))
+        if w is None:
+            if not isinstance(bits, int) or bits < 0:
+                msg = "%sNumber of bits in integer must be >= 0"
+                raise ValueError(msg % fln())
+            w = Width.widths[(bits, signed)] = Width(bits, not not signed)
+        return w
+
+    def wrap(self, n):
+        '''Return the integer n reduced to this width, in 2's complement
+        if signed.
+        '''
+        if self.bits:
+            n &= self.mask
+            if self.signed and n & self.sign_bit:
+                n -= self.base
+        return n
+
+    def __reduce__(self):
+        return (Width.get, (self.bits, self.signed))
+
+    def join(self, w):
+        '''Return the Width of the result of an operation between
+        integers of this width and w:  the larger of the two, signed
+        only if both are.
+        '''
+        if w is self:
+            return self
+        return Width.get(max(self.bits, w.bits), self.signed and w.signed)
+
 def isint(x):
-    return isinstance(x, int) or isinstance(x, int) or isinstance(x, Zn)
+    return isinstance(x, int) or isinstance(x, Zn)
+
+class Zn(object):
+    '''An integer, either unlimited or of a fixed number of bits, signed
+    (2's complement) or unsigned.  n is the value, always reduced to the
+    width w.  Operations between two Zn give a Zn of the larger width;
+    operations with other numbers are done on the integer value.
+
+    Zn are immutable, so they can be shared freely (by the stack,
+    registers and caches) and are hashable.  Values from small_min to
+    small_max are interned per width:  making one returns the same
+    object every time.
+    '''
+    __slots__ = ("n", "w")
+
+    # The range of values that are interned
+    small_min = -128
+    small_max = 1024
 
-class Zn:
     # These characters are used in the str representation of Zn objects
     # Example:  a 4-bit signed value of -2 is given as '-2<4s>'.
     left  = "<"
     right = ">"
     space = ""  # Put a space between the number and its designator
 
-    # These variables are private
-    num_bits = 0
-    is_signed = True
-    use_C_division = False
-    base = 0
-    high_unsigned = 0
-    high_signed = 0
-
     # This variable is used to hold 0, 1, or 2.  These settings have
     # to do with the subtleties of negating 2's complement numbers.
     # See the comments in the __neg__ method.
     negate_zero = 0
 
-    def __init__(self, value=0, proto=None):
-        self.n = 0
+    def __new__(cls, value=0, proto=None):
         if proto is not None:
-            self.num_bits = proto.num_bits
-            self.is_signed = proto.is_signed
+            w = proto.w
         elif isinstance(value, Zn):
-            self.num_bits = value.num_bits
-            self.is_signed = value.is_signed
+            w = value.w
         else:
-            self.num_bits = Zn.num_bits
-            self.is_signed = Zn.is_signed
-        if self.num_bits > 0:
-            self.base = 2**self.num_bits
+            w = Zn._mode()
         if type(value) == str:
-            self._set_from_string(value)
-        elif isinstance(value, int) or isinstance(value, int):
-            self.value = value
+            n = Zn._from_string(value)
+        elif isinstance(value, int):
+            n = value
         elif isinstance(value, Zn):
-            self.value = value.value
+            n = value.n
         else:
             raise TypeError("%sCan't set integer from value '%s'" % \
                 (fln(), str(value)))
-        self.use_C_division = not not self.num_bits
-        self._update()
-
-    def _set_from_string(self, value):
-        '''We set our value from a string.  This can be either a
-        regular string for an integer or long or a string gotten from
-        our str() method.  In the second case, the value will be made
-        to fit in the current representation, regardless of how many
-        bits or whether it was signed or unsigned when str'd.  Note
-        that the left character must match our current setting or an
-        exception will be raised.
+        if cls is Zn:
+            return Zn._make(n, w)
+        self = _new_object(cls)
+        self.w = w
+        self.n = w.wrap(n)
+        return self
+
+    @staticmethod
+    def _make(n, w):
+        '''Return the Zn of width w for the integer n without the checks
+        in __new__.
+        '''
+        if w.bits:
+            # Width.wrap(), inlined
+            n &= w.mask
+            if w.signed and n & w.sign_bit:
+                n -= w.base
+        if Zn.small_min <= n <= Zn.small_max:
+            small = w.small or Zn._intern(w)
+            return small[n - Zn.small_min]
+        z = _new_object(Zn)
+        z.w = w
+        z.n = n
+        return z
+
+    @staticmethod
+    def _intern(w):
+        'Make the interned values for the width w.'
+        small = []
+        for n in range(Zn.small_min, Zn.small_max + 1):
+            z = _new_object(Zn)
+            z.w = w
+            z.n = n
+            small.append(z)
+        w.small = small
+        return small
+
+    @staticmethod
+    def _mode():
+        'Return the Width of the integer mode of the active settings.'
+        s = settings.active.settings
+        return Width.get(s.bits, s.signed)
+
+    @staticmethod
+    def _from_string(value):
+        '''Return the value of a string.  This can be either a regular
+        string for an integer or a string gotten from our str() method.
+        In the second case, the value will be made to fit in the current
+        representation, regardless of how many bits or whether it was
+        signed or unsigned when str'd.  Note that the left character must
+        match our current setting or an exception will be raised.
         '''
-        assert type(value) == type("")
         try:
             if Zn.left in value:
-                self.value = int(value.split(Zn.left)[0])
-            else:
-                self.value = int(value)
+                return int(value.split(Zn.left)[0])
+            return int(value)
         except:
             msg = "%sCan't set integer from '%s'"
             raise ValueError(msg % (fln(), value))
 
-
     # Properties
     def get_C_division(self):
-        return self.use_C_division
+        return self.w.bits != 0
 
-    def set_C_division(self, use_C_division):
-        self.use_C_division = not not use_C_division
-
-    C_division = property(get_C_division, set_C_division, \
-        doc="Set to True for C type integer division")
+    C_division = property(get_C_division,
+        doc="True for C type integer division (integers with a width)")
 
     def get_bits(self):
-        return self.num_bits
-
-    def set_bits(self, bits):
-        if not isinstance(bits, int) and \
-           not isinstance(bits, int) and \
-           not isinstance(bits, Zn):
-            msg = "%sNumber of bits must be an integer"
-            raise ValueError(msg % fln())
-        if bits < 0:
-            msg = "%sNumber of bits in integer must be >= 0"
-            raise ValueError(msg % fln())
-        if bits != self.num_bits:
-            self.num_bits = bits
-            self.num_bits = bits
-            if bits == 0:
-                self.base = 0 # Will cause 0 div if we use for % calc
-                self.use_C_division = False
-            else:
-                self.base = 2**bits
-                self.use_C_division = True
-            self._update()
+        return self.w.bits
 
-    bits = property(get_bits, set_bits, \
+    bits = property(get_bits, \
         doc="Number of bits in integer (0 for unlimited)")
 
     def get_signed(self):
-        return self.is_signed
-
-    def set_signed(self, signed):
-        if signed != True and signed != False:
-            raise ValueError("%ssigned must be True or False" % fln())
-        self.is_signed = signed
-        self._update()
-
-    signed = property(get_signed, set_signed, doc="Signed if True")
+        return self.w.signed
 
-    def set_value(self, value):
-        if isinstance(value, int) or isinstance(value, int):
-            self.n = value
-        elif isinstance(value, Zn):
-            self.n = value.n
-        else:
-            try:
-                self.n = int(value)
-            except:
-                raise TypeError("%sCan't set integer from '%s'" % \
-                    (fln(), str(value)))
-        self._update()
+    signed = property(get_signed, doc="Signed if True")
 
     def get_value(self):
         return self.n
 
-    value = property(get_value, set_value, doc="Integer's value")
+    value = property(get_value, doc="Integer's value")
+
+    def cast(self, bits, signed):
+        '''Return our value as a Zn of the given number of bits (0 for
+        unlimited) and signedness.
+        '''
+        return Zn._make(self.n, Width.get(bits, signed))
 
     def set_negate_zero(self, value):
         msg = "%svalue must be 0, 1, or 2"
-        if not isinstance(value, int) and not isinstance(value, int):
+        if not isinstance(value, int):
             raise ValueError(msg % fln())
         if value < 0 or value > 2:
             raise ValueError(msg % fln())
         Zn.negate_zero = value
-        self._update()
 
     def get_negate_zero(self):
         return Zn.negate_zero
@@ -750,138 +940,86 @@ class Zn:
     negative_zero = property(get_negate_zero, set_negate_zero, \
         doc="If true, -Zn(0) == Zn(-(2**(n-1)))")
 
-    def _update(self):
-        "The object's state has changed."
-        if self.num_bits != 0:
-            assert self.base == 2**self.num_bits
-        if self.num_bits == 0:
-            self.is_signed = True
-        else:
-            if self.is_signed:
-                self.n &= (self.base - 1)  # Mask off the desired bits
-                # If high bit is on, then convert to negative in 2's
-                # complement
-                if self.n & 2**(self.num_bits - 1):
-                    self.n -= self.base
-            else:
-                self.n &= (self.base-1)
-        # Check our invariants
-        if self.num_bits == 0:
-            assert self.is_signed == True
-        else:
-            if self.is_signed:
-                assert -(self.base >> 1) <= self.n < (self.base >> 1)
-            else:
-                assert 0 <= self.n < self.base
-
     def _auto_cast(self, y):
-        '''y must be a Zn object for us to interoperate with.  We can
-        convert regular integers.
+        '''Return y and our value converted to a type that can be used
+        with it.  Zn operands are handled by the operators themselves.
         '''
-        if isinstance(y, Zn):
-            p = Zn()
-            p.is_signed = y.is_signed and self.is_signed
-            p.num_bits = max(y.num_bits, self.num_bits)
-            y1 = Zn(y, proto=p)
-            x1 = Zn(self, proto=p)
-            return y1, x1
-        elif isinstance(y, mpf):
-            return y, mpf(self.value)
+        if isinstance(y, mpf):
+            return y, mpf(self.n)
         elif isinstance(y, mpc):
-            return y, mpc(self.value, 0)
+            return y, mpc(self.n, 0)
         elif isinstance(y, Julian):
-            return y, Julian(self.value)
+            return y, Julian(self.n)
         elif isinstance(y, ctx_iv.ivmpf):
-            return y, mpi(self.value)
+            return y, mpi(self.n)
         elif isinstance(y, Rational):
-            return y, Rational(self.value, 1)
+            return y, Rational(self.n, 1)
         else:
-            return y, self.value
+            return y, self.n
+
+    def _operands(self, y):
+        '''Return the width of an operation between us and the Zn y and
+        both values reduced to it.
+        '''
+        w = self.w
+        if y.w is w:
+            return w, self.n, y.n
+        w = w.join(y.w)
+        return w, w.wrap(self.n), w.wrap(y.n)
+
+    def _unsigned(self):
+        '''Our value as the unsigned bit pattern for display, or the
+        magnitude if we are unlimited.
+        '''
+        v = self.n
+        if v < 0:
+            if self.w.bits:
+                v = (v & self.w.mask) | self.w.sign_bit
+            else:
+                v = -v
+        return v
 
     def __hex__(self):
-        self._update()
+        w = self.w
         t = ""
-        if self.num_bits != 0:
+        if w.bits != 0:
             t = self._suffix()
         sign = ""
-        num_hex_digits, r = divmod(self.num_bits, 4)
-        if r != 0: num_hex_digits += 1
-        v = self.n
-        if v < 0:
-            sign = " "
-            if self.is_signed and self.num_bits != 0:
-                v = self.n
-                v &= (self.base - 1)  # Mask off the desired bits
-                v |= (2**(self.bits - 1))
-        s = hex(v)[2:]
-        if s[-1] == "L": s = s[:-1]     # Remove "L"
-        if self.num_bits != 0:
-            while len(s) < num_hex_digits:
-                s = "0" + s
-        if self.num_bits != 0:  assert len(s) == num_hex_digits
+        if self.n < 0:
+            sign = " " if w.bits else "-"
+        s = "%x" % self._unsigned()
+        if w.bits != 0:
+            s = s.rjust((w.bits + 3)//4, "0")
         return "%s0x%s%s" % (sign, s, t)
 
     def __oct__(self):
-        self._update()
+        w = self.w
         t = ""
-        if self.num_bits != 0:
+        if w.bits != 0:
             t = self._suffix()
         sign = ""
-        num_oct_digits, r = divmod(self.num_bits, 3)
-        if r != 0: num_oct_digits += 1
-        v = self.n
-        if v < 0:
-            sign = " "
-            if self.is_signed and self.num_bits != 0:
-                v = self.n
-                v &= (self.base - 1)  # Mask off the desired bits
-                v |= (2**(self.bits - 1))
-        s = oct(v)[1:]
-        if s[0] == "o":  s = s[1:]  # Remove leading 'o' if present
-        if self.num_bits != 0:
-            while len(s) < num_oct_digits:
-                s = "0" + s
-        if self.num_bits != 0:  assert len(s) == num_oct_digits
+        if self.n < 0:
+            sign = " " if w.bits else "-"
+        s = "%o" % self._unsigned()
+        if w.bits != 0:
+            s = s.rjust((w.bits + 2)//3, "0")
         return "%s0o%s%s" % (sign, s, t)
 
     def bin(self):
         'Binary representation'
-        self._update()
+        w = self.w
         t = ""
-        if self.num_bits != 0:
+        if w.bits != 0:
             t = self._suffix()
         sign = ""
-        v = self.n
-        if v < 0:
-            sign = " "
-            if self.is_signed and self.num_bits != 0:
-                v = self.n
-                v &= (self.base - 1)  # Mask off the desired bits
-                v |= (2**(self.bits - 1))
-        s = bin(v)[2:]
-        while len(s) > 1 and s[0] == "0":  # Remove leading 0's
-            s = s[1:]
-        if s[-1] == "L": s = s[:-1]     # Remove "L"
-        if self.num_bits != 0:
-            while len(s) > self.num_bits:  # Trim leading 0's to get num bits
-                assert s[0] == "0", "s = '%s'" % s
-                s = s[1:]
-        if self.num_bits == 0:
-            while len(s) > 1 and s[0] == "0":  # Remove leading 0's
-                s = s[1:]
-        else:
-            if len(s) > self.num_bits:
-                s = s[len(s) - self.num_bits:]
-            else:
-                # Add leading zeros if length is not == num bits
-                while len(s) < self.num_bits:
-                    s = "0" + s
-        if self.num_bits != 0:
-            assert len(s) == self.num_bits, "s='%s'  %d bits" % (s, self.num_bits)
+        if self.n < 0:
+            sign = " " if w.bits else "-"
+        s = "{0:b}".format(self._unsigned())
+        if w.bits != 0:
+            s = s[-w.bits:].rjust(w.bits, "0")
         return "%s0b%s%s" % (sign, s, t)
 
     def roman(self):
-        self._update()
         sign = " "
         v = self.n
         if v < 0:
@@ -934,9 +1072,6 @@ class Zn:
     def __int__(self):
         return self.n
 
-    def __long__(self):
-        return self.n
-
     def __float__(self):
         return mpf(self.n)
 
@@ -945,34 +1080,25 @@ class Zn:
 
     def _suffix(self):
         fmt = Zn.space + Zn.left + "%s%d" + Zn.right
-        if self.is_signed:
-            return fmt % ("s", self.num_bits)
+        if self.w.signed:
+            return fmt % ("s", self.w.bits)
         else:
-            return fmt % ("u", self.num_bits)
+            return fmt % ("u", self.w.bits)
 
     def __str__(self):
-        self._update()
-        if self.num_bits == 0:
-            s = str(self.value)
-        else:
-            t = self._suffix()
-            if self.is_signed:
-                s = str(self.value) + t
-            else:
-                if self.n < 0:
-                    s = str(self.base + self.n)
-                else:
-                    s = str(self.value)
-                s += t
-        return s
+        if self.w.bits == 0:
+            return int_str(self.n)
+        if self.w.signed or self.n >= 0:
+            return int_str(self.n) + self._suffix()
+        return int_str(self.w.base + self.n) + self._suffix()
 
     def __repr__(self):
         if debug():
-            if self.signed:
+            if self.w.signed:
                 s = 's'
             else:
                 s = 'u'
-            return "Zn(%d<%c%d>)"%(self.n, s, self.bits)
+            return "Zn(%d<%c%d>)"%(self.n, s, self.w.bits)
         return "Zn(%d)" % self.n
 
     def _sgn(self, x):
@@ -982,9 +1108,9 @@ class Zn:
     def __abs__(self):
         'See comments under __neg__ for some subleties.'
         msg = "%sCan't take the absolute value of the most negative number"
-        if self.is_signed == True and self.n == -(self.base >> 1):
+        if self.w.signed and self.w.bits and self.n == -self.w.sign_bit:
             raise ValueError(msg % fln())
-        return Zn(abs(self.n))
+        return Zn._make(abs(self.n), Zn._mode())
 
     def __neg__(self):
         '''Dealing with the subtleties of 2's complement arithmetic.
@@ -1050,385 +1176,457 @@ class Zn:
         around with numbers like 2**(n-1) and flip between the signed
         an unsigned values and see what happened.
         '''
-        if self.n == 0 and Zn.negate_zero and self.is_signed:
-            return Zn(-(self.base >> 1))
-        return Zn(-self.n)
-
-    def __coerce__(self, other):
-        # hmmmmm.... the types we can encounter
-        print("coersion: %s, %s" %(self, other))
-        if isint_native(other):
-            return self, Zn(other)
-        ot = type(other)
-        if ot == mpc:
-            return mpc(self.value, 0), other
-        if ot == mpf:
-            return mpf(self.value), other
-        if isint_native(other):
-            return self, Zn(other)
-        print("Zn could not coerce type '%s'"%str(ot))
-        return None
+        if self.n == 0 and Zn.negate_zero and self.w.signed:
+            return Zn._make(-self.w.sign_bit, Zn._mode())
+        return Zn._make(-self.n, Zn._mode())
+
+    # Binary operators.  Two Zn of the same width (the common case) skip
+    # straight to making the result; otherwise the values are reduced to
+    # the joined width first.
 
     def __add__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n + y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value + y1.value, proto=x1)
         return x1 + y1
 
-    def __iadd__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value += z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 + x1
-
     def __radd__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(y1.value + x1.value, proto=x1)
         return y1 + x1
 
     def __sub__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n - y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value - y1.value, proto=x1)
         return x1 - y1
 
-    def __isub__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value -= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 - x1
-
     def __rsub__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(y1.value - x1.value, proto=x1)
         return y1 - x1
 
     def __mul__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n * y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value * y1.value, proto=x1)
         return x1 * y1
 
-    def __imul__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value *= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 * x1
-
     def __rmul__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value * y1.value, proto=x1)
-        return x1 * y1
-
-    def __div__(self, y):
-        # print "__div__(%d, %d)"%(self.value, y.value)
-        y1, x1 = self._auto_cast(y)
-        if self.use_C_division:
-            if x1.is_signed == True:
-                sign = x1._sgn(x1.n)*x1._sgn(y1.n)
-                if x1.num_bits != 0:
-                    assert -(x1.base >> 1) <= x1.n < (x1.base >> 1)
-                    assert -(x1.base >> 1) <= y1.n    < (x1.base >> 1)
-                    m = x1.base >> 1
-                    return Zn(sign*((abs(x1.value) % m)//(abs(y1.value) % m)), proto=x1)
-                else:
-                    return Zn(sign*(abs(x1.value)//abs(y1.value)), proto=x1)
-            else:
-                if x1.num_bits != 0:
-                    assert 0 <= x1.n < x1.base
-                    assert 0 <= y1.n    < x1.base
-                return Zn(x1.n//y1.n, proto=x1)
-        else:
-            return Zn(x1.value//y1.value, proto=x1)
+        return y1 * x1
 
-    def __idiv__(self, y):
-        # print "__idiv__(%d, %d)"%(self.value, y.value)
-        y1, x1 = self._auto_cast(y)
-        if not isinstance(y1, Zn) or not isinstance(x1, Zn):
-            raise TypeError("Invalid types to integer __idiv__")
-        if self.use_C_division:
-            sign_x = x1._sgn(x1.value)
-            sign_y = x1._sgn(y1.value)
-            x1.value = sign_x*sign_y*(abs(x1.value)//abs(y1.value))
+    def __floordiv__(self, y):
+        if not isinstance(y, Zn):
+            y1, x1 = self._auto_cast(y)
+            return x1 // y1
+        w, x, y = self._operands(y)
+        if self.w.bits and w.signed:
+            # C division truncates toward zero
+            m = w.sign_bit
+            n = self._sgn(x)*self._sgn(y)*((abs(x) % m)//(abs(y) % m))
         else:
-            x1.value //= y1.value
-        self.is_signed = x1.is_signed
-        self.num_bits = x1.num_bits
-        self.value = x1.value
-        return self
+            n = x//y
+        return Zn._make(n, w)
 
-    def __rdiv__(self, y):
+    def __rfloordiv__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return y1.__div__(x1)
-        return y1 / x1
-
-    __floordiv__ = __div__
-    __ifloordiv__ = __idiv__
-    __rfloordiv__ = __rdiv__
+        return y1 // x1
 
     def __mod__(self, y):
+        if isinstance(y, Zn):
+            w, x, y = self._operands(y)
+            return Zn._make(x % y, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value % y1.value, proto=x1)
         return x1 % y1
 
-    def __imod__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value %= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 % x1
-
     def __rmod__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return y1.__mod__(x1)
         return y1 % x1
 
-    def __cmp__(self, y):
-        if isinstance(y, Zn):
-            if self.value < y.value:  return -1
-            if self.value == y.value: return 0
-            else:                     return 1
-        elif isinstance(y, int) or isinstance(y, int):
-            if self.value < y:  return -1
-            if self.value == y: return 0
-            else:               return 1
-        elif isinstance(y, mpf):
-            if mpf(self.value) < y:  return -1
-            if mpf(self.value) == y: return 0
-            else:                    return 1
-        else:
-            return -1
-
     def __lt__(self, y):
         if isinstance(y, Zn):
-            return self.value < y.value
-        elif isinstance(y, int) or isinstance(y, int):
-            return self.value < y
+            return self.n < y.n
+        elif isinstance(y, int):
+            return self.n < y
         elif isinstance(y, mpf):
-            return mpf(self.value) < y
-        else:
-            raise UnknownOperation()
+            return mpf(self.n) < y
+        return NotImplemented
 
     def __le__(self, y):
         if isinstance(y, Zn):
-            return self.value <= y.value
-        elif isinstance(y, int) or isinstance(y, int):
-            return self.value <= y
+            return self.n <= y.n
+        elif isinstance(y, int):
+            return self.n <= y
         elif isinstance(y, mpf):
-            return mpf(self.value) <= y
-        else:
-            raise UnknownOperation()
+            return mpf(self.n) <= y
+        return NotImplemented
 
     def __gt__(self, y):
         if isinstance(y, Zn):
-            return self.value > y.value
-        elif isinstance(y, int) or isinstance(y, int):
-            return self.value > y
+            return self.n > y.n
+        elif isinstance(y, int):
+            return self.n > y
         elif isinstance(y, mpf):
-            return mpf(self.value) > y
-        else:
-            raise UnknownOperation()
+            return mpf(self.n) > y
+        return NotImplemented
 
     def __ge__(self, y):
         if isinstance(y, Zn):
-            return self.value >= y.value
-        elif isinstance(y, int) or isinstance(y, int):
-            return self.value >= y
+            return self.n >= y.n
+        elif isinstance(y, int):
+            return self.n >= y
         elif isinstance(y, mpf):
-            return mpf(self.value) >= y
-        else:
-            raise UnknownOperation()
+            return mpf(self.n) >= y
+        return NotImplemented
 
     def __eq__(self, y):
         if isinstance(y, Zn):
-            return self.value == y.value
-        elif isinstance(y, int) or isinstance(y, int):
-            return self.value == y
+            return self.n == y.n
+        elif isinstance(y, int):
+            return self.n == y
         elif isinstance(y, mpf):
-            return mpf(self.value) == y
-        else:
-            raise UnknownOperation()
+            return mpf(self.n) == y
+        return NotImplemented
 
     def __ne__(self, y):
-        return not self.__eq__(y)
+        eq = self.__eq__(y)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        # Equal to the hash of the int we compare equal to
+        return hash(self.n)
+
+    def __reduce__(self):
+        return (Zn._make, (self.n, self.w))
 
     def __and__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n & y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value & y1.value, proto=x1)
         return x1 & y1
 
-    def __iand__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value &= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 & x1
-
     def __rand__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(y1.value & x1.value, proto=x1)
         return y1 & x1
 
     def __or__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n | y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value | y1.value, proto=x1)
         return x1 | y1
 
-    def __ior__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value |= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 | x1
-
     def __ror__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(y1.value | x1.value, proto=x1)
         return y1 | x1
 
     def __xor__(self, y):
+        if isinstance(y, Zn):
+            w = self.w
+            if y.w is not w:
+                w = w.join(y.w)
+            return Zn._make(self.n ^ y.n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value ^ y1.value, proto=x1)
         return x1 ^ y1
 
-    def __ixor__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value ^= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 ^ x1
-
     def __rxor__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(y1.value ^ x1.value, proto=x1)
         return y1 ^ x1
 
+    def _shift_operands(self, y):
+        '''Return the width of a shift of us by the Zn y, our value
+        reduced to it and the count, which is y's own value.
+        '''
+        w = self.w
+        if y.w is not w:
+            w = w.join(y.w)
+        if y.n < 0:
+            raise ValueError("%snegative shift count" % fln())
+        return w, w.wrap(self.n), y.n
+
     def __lshift__(self, y):
+        if isinstance(y, Zn):
+            w, x, y = self._shift_operands(y)
+            if w.bits and y >= w.bits:
+                # Everything is shifted out; don't build the huge value
+                return Zn._make(0, w)
+            return Zn._make(x << y, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value << y1.value, proto=x1)
         return x1 << y1
 
-    def __ilshift__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value <<= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 << x1
-
     def __rlshift__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return y1.__lshift__(x1)
         return y1 << x1
 
     def __rshift__(self, y):
+        if isinstance(y, Zn):
+            w, x, y = self._shift_operands(y)
+            return Zn._make(x >> y, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value >> y1.value, proto=x1)
         return x1 >> y1
 
-    def __irshift__(self, y):
-        y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            self.value >>= z.value
-            self.is_signed = x1.is_signed
-            self.bits = x1.num_bits
-            return self
-        return y1 >> x1
-
     def __rrshift__(self, y):
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return y1.__rshift__(x1)
         return y1 >> x1
 
     def __invert__(self):
-        return Zn(~self.value)
+        return Zn._make(~self.n, Zn._mode())
 
     def __truediv__(self, y):
-        # print "__truediv__(%d, %d)"%(self.value, y.value)
-        if isint(self) and isint(y) and (self.C_division or y.C_division):
-            return self.value / y.value
         if isinstance(y, Zn):
-            y = mpf(y.value)
-        return self.value / y
+            if self.w.bits or y.w.bits:
+                return self.n / y.n
+            y = mpf(y.n)
+        return self.n / y
+
+    def __rtruediv__(self, y):
+        return y / self.n
 
     def __pow__(self, y):
+        if isinstance(y, Zn):
+            w, x, y = self._operands(y)
+            if w.bits and y >= 0:
+                # Only the low bits are kept, so reduce as we go
+                return Zn._make(pow(x, y, w.base), w)
+            n = x ** y
+            if not isinstance(n, int):
+                raise TypeError("%sCan't set integer from value '%s'" % \
+                    (fln(), str(n)))
+            return Zn._make(n, w)
         y1, x1 = self._auto_cast(y)
-        if isinstance(y1, Zn) and isinstance(x1, Zn):
-            return Zn(x1.value ** y1.value, proto=x1)
         return x1 ** y1
 
+class Zmod(object):
+    '''An integer modulo m, an element of Z/mZ.  n is always reduced
+    (n % m, so it has the sign of m), and every operation reduces its
+    result at once, so no number made is larger than m**2:  powers use
+    pow(n, e, m) and division multiplies by the inverse pow(x, -1, m).
+    An int or Zn operand is taken modulo m.  Like Zn, Zmod are immutable.
+    '''
+    __slots__ = ("n", "m")
+
+    def __init__(self, n, m):
+        if not isint(n) or not isint(m):
+            raise TypeError("%sModular numbers must be integers" % fln())
+        m = int(m)
+        if abs(m) < 2:
+            raise ValueError("%sModulus must be > 1 in size" % fln())
+        self.n = int(n) % m
+        self.m = m
+
+    @staticmethod
+    def _make(n, m):
+        'Return n modulo m for the reduced n.'
+        x = _new_object(Zmod)
+        x.n = n
+        x.m = m
+        return x
+
+    def _residue(self, y):
+        '''Return the operand y as an int modulo m, or None if it isn't
+        an integer.
+        '''
+        if isinstance(y, Zmod):
+            if y.m != self.m:
+                raise ValueError("%sModuli %d and %d differ" % (fln(), self.m, y.m))
+            return y.n
+        if isint(y):
+            return int(y) % self.m
+        return None
+
+    def __add__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return Zmod._make((self.n + y) % self.m, self.m)
+
+    __radd__ = __add__
+
+    def __sub__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return Zmod._make((self.n - y) % self.m, self.m)
+
+    def __rsub__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return Zmod._make((y - self.n) % self.m, self.m)
+
+    def __mul__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return Zmod._make(self.n*y % self.m, self.m)
+
+    __rmul__ = __mul__
+
+    def inverse(self):
+        'Return the x with self*x == 1.'
+        try:
+            return Zmod._make(pow(self.n, -1, self.m), self.m)
+        except ValueError:
+            raise ValueError("%s%d has no inverse modulo %d" % \
+                (fln(), self.n, self.m))
+
+    def __truediv__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return self*Zmod._make(y, self.m).inverse()
+
+    def __rtruediv__(self, y):
+        y = self._residue(y)
+        if y is None:
+            return NotImplemented
+        return self.inverse()*y
+
+    def __pow__(self, e):
+        '''Return self to the integer power e; a negative e is a power
+        of the inverse.
+        '''
+        if isinstance(e, Zmod):
+            e = e.n
+        if not isint(e):
+            return NotImplemented
+        if e < 0:
+            return self.inverse()**-int(e)
+        return Zmod._make(pow(self.n, int(e), self.m), self.m)
+
+    def __neg__(self):
+        return Zmod._make(-self.n % self.m, self.m)
+
+    def __pos__(self):
+        return self
+
+    def __int__(self):
+        return self.n
+
+    __index__ = __int__
+
+    def __eq__(self, y):
+        if isinstance(y, Zmod):
+            return self.n == y.n and self.m == y.m
+        if isint(y):
+            return self.n == int(y) % self.m
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.n, self.m))
+
+    def __str__(self):
+        return "%s (mod %s)" % (int_str(self.n), int_str(self.m))
+
+    def __repr__(self):
+        return "Zmod(%d, %d)" % (self.n, self.m)
+
+    @staticmethod
+    def product(values, m):
+        '''Return the product of the integers values modulo m, reducing
+        after every multiplication.
+        '''
+        r = 1 % m
+        for v in values:
+            r = r*(int(v) % m) % m
+        return Zmod._make(r, m)
+
+def _zmod_tests():
+    x, y = Zmod(3, 7), Zmod(5, 7)
+    # y x - is y - x and y x / is y times the inverse of x
+    assert x - y == Zmod(-2, 7) == 5 and y - x == 2
+    assert 3 - y == 5 and y - 3 == 2 and -x == 4
+    assert x.inverse() == 5 and x*x.inverse() == 1
+    assert x/y == x*y.inverse() == 2 and x/y*y == x
+    assert 3/y == x/y and x/5 == x/y and 1/x == x.inverse()
+    assert x + y == 1 and 10*x == 2 and x*Zn(10) == 2
+    # Powers are reduced; a Zmod exponent is used as the integer it is
+    # and a negative one is a power of the inverse
+    assert x**4 == 4 and x**Zmod(4, 7) == 4 and x**Zmod(-3, 7) == 4
+    assert x**-1 == x.inverse() and x**-2 == x.inverse()**2 and x**0 == 1
+    big = Zmod(2, 10**9 + 7)**(10**18)
+    assert big.n == pow(2, 10**18, 10**9 + 7)
+    # Not invertible
+    for bad in (lambda: Zmod(6, 8).inverse(), lambda: x/Zmod(0, 7),
+                lambda: Zmod(3, 12)/Zmod(4, 12), lambda: Zmod(2, 8)**-1,
+                lambda: x + Zmod(1, 5), lambda: Zmod(1, 1)):
+        try:
+            bad()
+            raise AssertionError("no ValueError")
+        except ValueError:
+            pass
+    assert Zmod(6, 8)/Zmod(3, 8) == Zmod(2, 8)
+    # A negative modulus:  residues have its sign
+    assert Zmod(3, -13) - 5 == -2 and (Zmod(3, -13) - 5).n == -2
+    assert Zmod(13, -13).n == 0 and Zmod(1, -13).n == -12
+    assert Zmod(3, -13)/Zmod(5, -13)*5 == 3
+    assert str(Zmod(3, -13) - 5) == "-2 (mod -13)"
+    # The product is reduced as it is made
+    values = list(range(1, 30))
+    assert Zmod.product(values, 1000003) == math.factorial(29) % 1000003
+    assert Zmod.product([], 7) == 1 and Zmod.product([7, 3], 7) == 0
+    assert Zmod.product([-2, 3], -13).n == -6
+    assert Zmod.product([Zn(4), 5], 7) == 6
+    try:
+        Zmod(1.5, 7)
+        raise AssertionError("no TypeError")
+    except TypeError:
+        pass
+
 class ipaddr(Zn):
-    def __init__(self, value=0, cidr=None, ipvn=None, prototype=None):
-        Zn.__init__(self)
-        self.is_signed = False
-        self.cidr = None
+    '''An IPv4 or IPv6 address:  an unsigned 32 or 128 bit integer with
+    an optional CIDR prefix length.  Like Zn, it is immutable.
+    '''
+    __slots__ = ("cidr", "ipvn")
+
+    def __new__(cls, value=0, cidr=None, ipvn=None, prototype=None):
         if prototype is not None:
-            self.ipvn = prototype.ipvn
-            self.cidr = prototype.cidr
-        else:
-            if isinstance(value, ipaddr):
-                self.ipvn = value.ipvn
-                self.cidr = value.cidr
-                value = value.value
-            else:
-                value = int(value)
+            ipvn = prototype.ipvn
+            cidr = prototype.cidr
+        elif isinstance(value, ipaddr):
             if ipvn is None:
-                if value < 0xffffffff:
-                    self.ipvn = 'ipv4'
-                else:
-                    self.ipvn = 'ipv6'
+                ipvn = value.ipvn
+            if cidr is None:
+                cidr = value.cidr
+        value = int(value)
+        if ipvn is None:
+            if value < 0xffffffff:
+                ipvn = 'ipv4'
             else:
-                self.ipvn = ipvn
-            if isinstance(cidr, str):
-                cidr = int(cidr)
-            if cidr is not None:
-                if cidr < 0:
-                    raise ValueError("CIDR must not be negative")
-                if self.ipvn == 'ipv4' and cidr > 32:
-                    raise ValueError("CIDR for a IPv4 address cannot be greater than 32")
-                elif self.ipvn == 'ipv6' and cidr > 128:
-                    raise ValueError("CIDR for a IPv6 address cannot be greater than 128")
-            self.cidr = cidr
-        if self.ipvn == 'ipv4':
-            self.bits = 32
-        if self.ipvn == 'ipv6':
-            self.bits = 128
-        self.value = value
-        self._update()
+                ipvn = 'ipv6'
+        if isinstance(cidr, str):
+            cidr = int(cidr)
+        if cidr is not None:
+            if cidr < 0:
+                raise ValueError("CIDR must not be negative")
+            if ipvn == 'ipv4' and cidr > 32:
+                raise ValueError("CIDR for a IPv4 address cannot be greater than 32")
+            elif ipvn == 'ipv6' and cidr > 128:
+                raise ValueError("CIDR for a IPv6 address cannot be greater than 128")
+        self = _new_object(cls)
+        self.ipvn = ipvn
+        self.cidr = cidr
+        if ipvn == 'ipv6':
+            self.w = Width.get(128, False)
+        else:
+            self.w = Width.get(32, False)
+        self.n = self.w.wrap(value)
+        return self
 
     def __str__(self):
         'IP address representation'
@@ -1436,78 +1634,63 @@ class ipaddr(Zn):
         if self.cidr is not None:
             cidr = '/%d'%self.cidr
         if self.ipvn == 'ipv6':
-            pack = lambda n: n>0 and pack(n>>8)+chr(n&0xff) or ''
-            v = pack(self.value)
-            # ipv6 address?
-            if len(v) < 16:
-                v = '\x00'*(16-len(v))+v
+            import socket
+            v = self.n.to_bytes(16, 'big')
             return ' %s%s' % (socket.inet_ntop(socket.AF_INET6, v), cidr)
         else:
-            v = self.value
+            v = self.n
             v = [ (v >> 24) & 0xff, (v >> 16) & 0xff, (v >> 8) & 0xff, v & 0xff ]
             v = [ '%u'%c for c in v ]
             return ' %s%s' % ('.'.join(v), cidr)
 
     def __repr__(self):
-        return "ipaddr(%x/%d)" % (self.n, self.cidr)
+        return "ipaddr(%x/%s)" % (self.n, self.cidr)
+
+    def __reduce__(self):
+        return (ipaddr, (self.n, self.cidr, self.ipvn))
 
     def _check_type(self, v):
         if not isint(v):
             raise TypeError("Operations on IP addresses are limited to integers")
-        if self.ipvn == 'ipv6' or v.ipvn == 'ipv6':
-            ipvn = 'ipv6'
-        else:
-            ipvn = 'ipv4'
-        return v, ipaddr(0, max(self.cidr, v.cidr), ipvn)
+        return int(v)
 
     def __add__(self, y):
-        y = self._check_type(y)
-        return ipaddr(self.value + y.value, self.cidr)
-
-    def __iadd__(self, y):
-        y = self._check_type(y)
-        self.value += y.value
-        return self
+        return ipaddr(self.n + self._check_type(y), prototype=self)
 
     def __sub__(self, y):
-        y = self._check_type(y)
-        return ipaddr(self.value - y.value, self.cidr)
-
-    def __isub__(self, y):
-        y = self._check_type(y)
-        self.value -= y.value
-        return self
+        return ipaddr(self.n - self._check_type(y), prototype=self)
 
     def __mul__(self, y):
-        y = self._check_type(y)
-        return ipaddr(self.value*y.value, self.cidr)
+        return ipaddr(self.n*self._check_type(y), prototype=self)
 
 
-if __name__ == "__main__":
+def _zn_tests():
     # Run unit tests
     # Signed:    0  1  2  3  4  5  6  7  -8  -7  -6  -5  -4  -3  -2  -1
     # Unsigned:  0  1  2  3  4  5  6  7   8   9  10  11  12  13  14  15
     def sgn(x):
         if x < 0: return -1
         return 1
+    # Only unlimited integers divide like Python's (C_division follows
+    # the width), so the Python tests use the values of n bits unwrapped
     def TestSignedPythonArithmetic(n, step=1):
-        Zn().bits = n
-        Zn().signed = True
-        Zn().C_division = False
+        settings.current().bits = 0
         m = 2**n >> 1
         it = range(-m, m, step)
         for i in it:
             for j in it:
                 x, y = Zn(i), Zn(j)
+                assert not x.C_division
                 assert x+y == Zn((i+j))
                 assert x-y == Zn((i-j))
                 assert x*y == Zn((i*j))
-                try: assert x//y == Zn(i//j)
+                try:
+                    assert x//y == Zn(i//j) and x % y == Zn(i % j)
+                    assert x/y == mpf(i)/j
                 except ZeroDivisionError: pass
     def TestUnsignedPythonArithmetic(n, step=1):
-        Zn().bits = n
-        Zn().signed = False
-        Zn().C_division = False
+        settings.current().bits = n
+        settings.current().signed = False
         b = 2**n
         it = range(0, b, step)
         for i in it:
@@ -1516,12 +1699,11 @@ if __name__ == "__main__":
                 assert x+y == Zn((i+j) % b)
                 assert x-y == Zn((i-j) % b)
                 assert x*y == Zn((i*j) % b)
-                try: assert x/y == Zn((i//j) % b)
+                try: assert x//y == Zn(i//j) and x/y == i/j
                 except ZeroDivisionError: pass
     def TestSignedCArithmetic(n, step=1):
-        Zn().bits = n
-        Zn().signed = True
-        Zn().C_division = True
+        settings.current().bits = n
+        settings.current().signed = True
         m = 2**n >> 1
         it = range(-m, m, step)
         for i in it:
@@ -1535,9 +1717,8 @@ if __name__ == "__main__":
                     assert x//y == Zn(sign*((abs(i) % m)//(abs(j) % m)))
                 except ZeroDivisionError: pass
     def TestUnsignedCArithmetic(n, step=1):
-        Zn().bits = n
-        Zn().signed = False
-        Zn().C_division = True
+        settings.current().bits = n
+        settings.current().signed = False
         it = range(0, 2**n, step)
         for i in it:
             for j in it:
@@ -1549,60 +1730,83 @@ if __name__ == "__main__":
                     assert x//y == Zn(i//j)
                 except ZeroDivisionError: pass
     def BitTwiddling():
-        Zn().bits = 4
+        settings.current().bits = 4
         def twiddle(x, y, signed):
-            u, v = Zn(x), Zn(y)
-            u.signed = signed
-            assert u & v == Zn(x & y)
-            assert u | v == Zn(x | y)
-            assert u ^ v == Zn(x ^ y)
-            assert u << v == (Zn((x << y) % (Zn.high_unsigned - 1)))
-            assert u >> v == Zn(x >> y)
-            if y: assert u % v == Zn(x % y)
+            # Results have the joined width of u and v
+            u, v = Zn(x).cast(4, signed), Zn(y)
+            w = u.w.join(v.w)
+            def same(z, n):
+                assert z.w is w and z.n == w.wrap(n)
+            same(u & v, x & y)
+            same(u | v, x | y)
+            same(u ^ v, x ^ y)
+            if v.n > 0: same(u % v, w.wrap(x) % w.wrap(y))
             assert ~u == Zn(~x)
-            w = Zn(u.value); w &= v;  assert w == Zn(x & y)
-            w = Zn(u.value); w |= v;  assert w == Zn(x | y)
-            w = Zn(u.value); w ^= v;  assert w == Zn(x ^ y)
-            w = Zn(u.value); w <<= v; assert w == Zn((x << y) % (Zn.high_unsigned - 1))
-            w = Zn(u.value); w >>= v; assert w == Zn(x >> y)
-        n = Zn.high_unsigned
-        for i in range(n):
-            for j in range(n):
-                twiddle(i, j, True)
-                twiddle(i, j, False)
-        n = Zn.high_signed
-        for i in range(-n, n):
-            for j in range(-n, n):
-                twiddle(i, j, True)
-                twiddle(i, j, False)
+            z = u; z &= v;  same(z, x & y)
+            z = u; z |= v;  same(z, x | y)
+            z = u; z ^= v;  same(z, x ^ y)
+            if v.n < 0:
+                for shift in (lambda: u << v, lambda: u >> v):
+                    try: shift(); assert False, "negative shift"
+                    except ValueError: pass
+                return
+            same(u << v, x << v.n)
+            same(u >> v, w.wrap(x) >> v.n)
+            z = u; z <<= v; same(z, x << v.n)
+            z = u; z >>= v; same(z, w.wrap(x) >> v.n)
+        for signed in (True, False):
+            settings.current().signed = signed
+            n = 2**settings.current().bits
+            for i in range(n):
+                for j in range(n):
+                    twiddle(i, j, True)
+                    twiddle(i, j, False)
+            n = 2**settings.current().bits >> 1
+            for i in range(-n, n):
+                for j in range(-n, n):
+                    twiddle(i, j, True)
+                    twiddle(i, j, False)
+        assert Zn(0).cast(4, True) << Zn(8).cast(4, False) == 0
+        settings.current().bits = 0
+        assert Zn(1) << Zn(100) == 1 << 100
     def Disallowed():
-        '''Note that using lambda functions for the arithmetic operations
-        doesn't work correctly -- e.g., 3 + Zn is allowed.
+        '''Other numbers mix with a Zn on its integer value; the bit
+        operations and complex integer division are refused.
         '''
-        def plus(x, y):
-            return x + y
         x = Zn(1)
-        oplist = (
+        mixed = (
             (lambda x, y: x + y,  "+"),
             (lambda x, y: x - y,  "-"),
             (lambda x, y: x * y,  "*"),
             (lambda x, y: x / y,  "/"),
             (lambda x, y: x // y, "//"),
             (lambda x, y: x % y,  "%"),
+        )
+        bitwise = (
             (lambda x, y: x & y,  "&"),
             (lambda x, y: x | y,  "|"),
             (lambda x, y: x ^ y,  "^"),
             (lambda x, y: x << y, "<<"),
             (lambda x, y: x >> y, ">>"),
         )
-        t = 3
-        for op, opname in oplist:
-            for arg in (t, int(t), float(t), complex(t, t)):
+        for op, opname in mixed:
+            for arg in (3, 3.0):
+                assert op(arg, x) == op(arg, 1), opname
+                assert op(x, arg) == op(1, arg), opname
+                assert type(op(x, arg)) == type(op(1, arg)), opname
+        for op, opname in bitwise:
+            assert op(3, x) == op(Zn(3), x), opname
+            assert op(x, 3) == op(x, Zn(3)), opname
+            for arg in (3.0, 3+3j):
                 try: y = op(arg, x); assert False, opname
                 except TypeError: pass
-                if arg != t and arg != int(t):
-                    try: y = op(x, arg); assert False, opname
-                    except TypeError: pass
+                try: y = op(x, arg); assert False, opname
+                except TypeError: pass
+        for op in (lambda x, y: x // y, lambda x, y: x % y):
+            try: y = op(3+3j, x); assert False
+            except TypeError: pass
+            try: y = op(x, 3+3j); assert False
+            except TypeError: pass
     def TestChangingNumberOfBits():
         # Test signed
         results = (
@@ -1623,18 +1827,12 @@ if __name__ == "__main__":
             ( 1,  1,  1,  1),
             ( 0,  0,  0,  0),
         )
-        x = Zn()
-        x.bits = 4
-        x.signed = True
         for item in results:
             i, compl, bits3, bits2 = item
-            x.bits = 4
-            x.value = i
+            x = Zn(i).cast(4, True)
             assert x.n == compl
-            x.bits = 3
-            assert x.n == bits3
-            x.bits = 2
-            assert x.n == bits2
+            assert x.cast(3, True).n == bits3
+            assert x.cast(2, True).n == bits2
         # Test unsigned
         results = (
             (15,  7,  3),
@@ -1654,27 +1852,32 @@ if __name__ == "__main__":
             ( 1,  1,  1),
             ( 0,  0,  0),
         )
-        x = Zn()
-        x.bits = 4
-        x.signed = False
         for item in results:
             i, bits3, bits2 = item
-            x.bits = 4
-            x.value = i
+            x = Zn(i).cast(4, False)
             assert x.n == i
-            x.bits = 3
-            assert x.n == bits3
-            x.bits = 2
-            assert x.n == bits2
+            assert x.cast(3, False).n == bits3
+            assert x.cast(2, False).n == bits2
     for n in range(1, 6):
         TestSignedPythonArithmetic(n)
         TestUnsignedPythonArithmetic(n)
         TestSignedCArithmetic(n)
         TestUnsignedCArithmetic(n)
+    def TestStrings():
+        settings.current().bits = 0
+        assert Zn("12") == Zn(12) and Zn("-7").n == -7
+        assert Zn(str(Zn(12))) == Zn(12)
+        settings.current().bits = 4
+        settings.current().signed = True
+        assert Zn("12").n == -4
+        settings.current().signed = False
+        assert Zn("12").n == 12
+        try: Zn("twelve"); assert False
+        except ValueError: pass
     BitTwiddling()
     Disallowed()
     TestChangingNumberOfBits()
-    exit(0)
+    TestStrings()
 '''
 $Id: julian.py 1.15 2009/02/11 02:39:22 donp Exp $
 
@@ -1714,18 +1917,12 @@ class Julian(object):
     }
     name_months = dict([[val, key] for key, val in list(month_names.items())])
 
-    # This is a bit of a hack, but it is intended to allow the
-    # calculator to communicate how Julian dates expressed as interval
-    # numbers are supposed to be represented as strings.
-    interval_representation = "a"
-
     # If be_strict is True, there are dates that are illegal and will
     # result in an exception.
     be_strict = False
 
-    # ---------------------------------------------------------------
-    # Class variables below here are private
-    fp = mpFormat()
+    # Julian days are immutable; value is the mpf or mpi day number
+    __slots__ = ("value",)
 
     def __init__(self, s="now"):
         '''Initialization can be done with numerous different objects.
@@ -1828,12 +2025,12 @@ class Julian(object):
             fractional_part = day - d
             h, m, s = self._to_hms(fractional_part)
             return self._check(y, M, d, h, m, s)
-        def form2(date, time):
+        def form2(date, hms):
             y, M, d, h, m, s = form1(date)
             # Now parse the time
             h, m, s = 0, 0, 0
             try:
-                fields = time.split(":")
+                fields = hms.split(":")
                 if len(fields) == 1:
                     # Hour only
                     h = int(fields[0])
@@ -1849,7 +2046,7 @@ class Julian(object):
                 else:
                     raise SyntaxError("")
             except:
-                raise ValueError("'%s' is a bad h:m:s specification" % time)
+                raise ValueError("'%s' is a bad h:m:s specification" % hms)
             msg = ""
             if not (0 <= h < 24): msg = "Bad hour specification"
             if not (0 <= m < 60): msg = "Bad minute specification"
@@ -1883,8 +2080,8 @@ class Julian(object):
                     y, M, d, h, m, s = form3(s)
                 else:
                     date = s[:loc]
-                    time = s[loc+1:]
-                    y, M, d, h, m, s = form2(date, time)
+                    hms = s[loc+1:]
+                    y, M, d, h, m, s = form2(date, hms)
             else:
                 y, M, d, h, m, s = form1(s)
             return y, M, d, h, m, s
@@ -2074,7 +2271,8 @@ class Julian(object):
 
     def _st(self, val):
         assert isinstance(val, mpf)
-        Julian.fp.digits(1)  # We'll display to the nearest tenth second
+        # We'll display to the nearest tenth second
+        settings.current().julian_fp.digits(1)
         if val < 250000:
             return self._units(val)
         y, M, d, h, m, s = self._to_date(val)
@@ -2083,7 +2281,7 @@ class Julian(object):
             if max(h,m,s) != 0:
                 t += [" %02d:%02d" % (h, m)]
                 if s != 0:
-                    t += [":%02d.%01d" % (int(s), int(((10*s)-(10*int(s)))/10)) ]
+                    t += [":%02d.%01d" % (int(s), int(10*s - 10*int(s)))]
             return ''.join(t)
         except:
             msg = "%sDate representation cannot be calculated\n" + \
@@ -2100,8 +2298,9 @@ class Julian(object):
         s = mpf("86400")
         m = mpf("1440")
         h = mpf("24")
-        Julian.fp.digits(3)
-        f = Julian.fp.sig
+        fp = settings.current().julian_fp
+        fp.digits(3)
+        f = fp.sig
         if val < 0:
             sign = -1
             val = abs(val)
@@ -2127,22 +2326,25 @@ class Julian(object):
         if self.value == -inf: return "Julian(-inf)"
         val = self.value - Julian.day_offset
         if isinstance(val, ctx_iv.ivmpf):
-            if Julian.interval_representation == "a":
-                a = self._st(val.mid)
-                b = self._units(val.delta/mpf("2"))
+            # The endpoints and midpoint of an mpi are themselves mpis
+            mid, delta = mpf(val.mid), mpf(val.delta)
+            st = settings.current()
+            if st.cfg["iv_mode"] == "a":
+                a = self._st(mid)
+                b = self._units(delta/mpf("2"))
                 return a + " +-" + b
-            elif Julian.interval_representation == "b":
-                a = self._st(val.mid)
-                p = mpf("100")*val.delta/(mpf("2")*val.mid)
-                Julian.fp.digits(3)
-                b = Julian.fp.sig(p).strip()
+            elif st.cfg["iv_mode"] == "b":
+                a = self._st(mid)
+                p = mpf("100")*delta/(mpf("2")*mid)
+                st.julian_fp.digits(3)
+                b = st.julian_fp.sig(p).strip()
                 return a + " (" + b + "%)"
-            elif Julian.interval_representation == "c":
-                s = " <<" + self._st(val.a) + ", " + \
-                     self._st(val.b) + ">>"
+            elif st.cfg["iv_mode"] == "c":
+                s = " <<" + self._st(mpf(val.a)) + ", " + \
+                     self._st(mpf(val.b)) + ">>"
                 return s
             else:
-                raise Exception("%sBad Julian.interval_representation" % fln())
+                raise Exception("%sBad iv_mode" % fln())
         else:
             return " " + self._st(val)
 
@@ -2172,6 +2374,7 @@ class Julian(object):
         return Julian(self.value * self._convert_to_mpf_or_mpi(other))
     def __div__(self, other):
         return Julian(self.value / self._convert_to_mpf_or_mpi(other))
+    __truediv__ = __div__
 
     def __radd__(self, other):
         return Julian(self._convert_to_mpf_or_mpi(other) + self.value)
@@ -2181,9 +2384,17 @@ class Julian(object):
         return Julian(self._convert_to_mpf_or_mpi(other) * self.value)
     def __rdiv__(self, other):
         raise Exception("%sMeaningless to divide by date/time" % fln())
+    __rtruediv__ = __rdiv__
     def __neg__(self):
-        self.value = -self.value
-        return self
+        return Julian(-self.value)
+
+    def __eq__(self, other):
+        if isinstance(other, Julian):
+            return self.value == other.value
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.value)
 
     def __int__(self):
         if isinstance(self.value, mpf):
@@ -2203,7 +2414,7 @@ class Julian(object):
         else:
             raise Exception("%sProgram bug:  unknown type" % fln())
 
-if __name__ == "__main__":
+def _julian_tests():
     def TestNumericalInit():
         j = Julian(0)
         data = (
@@ -2247,43 +2458,57 @@ if __name__ == "__main__":
         )
         for s, jd in data:
             assert Julian(s).value == jd
-        # Test the :h:m:s forms
+        # Test the :h:m:s forms; these are times today
         Julian.day_offset = mpf("0")
-        fields = str(Julian(":2")).split(":")
-        assert fields[1] == "02"; assert fields[2] == "00"
-        fields = str(Julian(":22")).split(":")
-        assert fields[1] == "22"; assert fields[2] == "00"
-        fields = str(Julian(":22:45")).split(":")
-        assert fields[1] == "22"; assert fields[2] == "45"
-        fields = str(Julian(":22:45:12.3")).split(":")
-        assert fields[1] == "22"; assert fields[2] == "45"
-        assert fields[3] == "12.3"
+        def hms(s):
+            return str(Julian(s)).split()[-1].split(":")
+        assert hms(":2") == ["02", "00"]
+        assert hms(":22") == ["22", "00"]
+        assert hms(":22:45") == ["22", "45"]
+        assert hms(":22:45:12.3") == ["22", "45", "12.3"]
     def TestStringRepresentations():
         # Test string representations (note leading spaces)
         Julian.day_offset = mpf("0")
-        Julian.interval_representation = "c"
+        settings.current().cfg["iv_mode"] = "c"
         j1, j2 = mpf("2451545.0"), mpf("2451545.5")
-        assert str(Julian(j1)) == " 1Jan2000:12:00"
-        assert str(Julian(mpi(j1, j2))) == " <<1Jan2000:12:00, 2Jan2000:00:00>>"
+        assert str(Julian(j1)) == " 1 Jan 2000 12:00"
+        assert str(Julian(mpi(j1, j2))) == " <<1 Jan 2000 12:00, 2 Jan 2000>>"
         Julian.day_offset = mpf("0.5")
-        assert str(Julian(j1)) == " 1Jan2000:00:00"
-        assert str(Julian(mpi(j1, j2))) == " <<1Jan2000:00:00, 1Jan2000:12:00>>"
+        assert str(Julian(j1)) == " 1 Jan 2000"
+        assert str(Julian(mpi(j1, j2))) == " <<1 Jan 2000, 1 Jan 2000 12:00>>"
+        Julian.day_offset = mpf("0")
+        settings.current().cfg["iv_mode"] = "a"
+        assert str(Julian(mpi(j1, j2))) == "1 Jan 2000 18:00 +- 6.00 hours"
     def TestArithmetic():
         Julian.day_offset = mpf("0")
         j = mpf("2451545.0")
-        assert str(Julian(j)) == " 1Jan2000:12:00"
-        assert str(Julian(j) + mpf("1")) == " 2Jan2000:12:00"
-        assert str(Julian(j) - mpf("1")) == " 31Dec1999:12:00"
-        assert str(Julian(j)*2) == " 8Feb8712:12:00"
-        assert str(Julian(j)/2) == " 26Dec-1357:00:00"
-        assert str(mpf("1") + Julian(j)) == " 2Jan2000:12:00"
-        assert str(mpf("0") - Julian(-j)) == " 1Jan2000:12:00"
-        assert str(2*Julian(j)) == " 8Feb8712:12:00"
+        assert str(Julian(j)) == " 1 Jan 2000 12:00"
+        assert str(Julian(j) + mpf("1")) == " 2 Jan 2000 12:00"
+        assert str(Julian(j) - mpf("1")) == " 31 Dec 1999 12:00"
+        assert str(Julian(j)*2) == " 8 Feb 8712 12:00"
+        assert str(Julian(j)/2) == " 26 Dec -1357"
+        assert str(mpf("1") + Julian(j)) == " 2 Jan 2000 12:00"
+        assert str(mpf("0") - Julian(-j)) == " 1 Jan 2000 12:00"
+        assert str(2*Julian(j)) == " 8 Feb 8712 12:00"
     TestNumericalInit()
     TestStringInit()
     TestStringRepresentations()
     TestArithmetic()
 
+class lazy_re(object):
+    '''A regular expression that is compiled the first time it is used.
+    Most of the patterns below are only needed for less common input, so
+    this keeps their compilation out of startup.
+    '''
+    def __init__(self, pattern, flags=0):
+        self.args = (pattern, flags)
+
+    def __getattr__(self, name):
+        # Only called until the attribute is cached in the instance
+        value = getattr(re.compile(*self.args), name)
+        setattr(self, name, value)
+        return value
+
 # Number recognition regular expressions
 integer = re.compile("^[-+]?\d+$")
 
@@ -2315,13 +2540,13 @@ C4 = r"^\(%s(,)%s\)$" % (num, num)
 del num
 
 # Regular expressions
-imag1 =    re.compile(I1, re.X | re.I)
-imag2 =    re.compile(I2, re.X | re.I)
-real =     re.compile(R,  re.X | re.I)
-complex1 = re.compile(C1, re.X | re.I)
-complex2 = re.compile(C2, re.X | re.I)
-complex3 = re.compile(C3, re.X | re.I)
-complex4 = re.compile(C4, re.X | re.I)
+imag1 =    lazy_re(I1, re.X | re.I)
+imag2 =    lazy_re(I2, re.X | re.I)
+real =     lazy_re(R,  re.X | re.I)
+complex1 = lazy_re(C1, re.X | re.I)
+complex2 = lazy_re(C2, re.X | re.I)
+complex3 = lazy_re(C3, re.X | re.I)
+complex4 = lazy_re(C4, re.X | re.I)
 
 # Rationals:  "a/b", and "axb/c" forms are allowed where a and b are
 # integers and x is one or more of the following characters: '+- '.
@@ -2342,16 +2567,16 @@ Ra = r'''
     (\d+)               # Denominator
     $
 '''
-rational = re.compile(Ra, re.X | re.I)
+rational = lazy_re(Ra, re.X | re.I)
 
-ip = re.compile(r"^(\d{1,3})[.](\d{1,3})[.](\d{1,3})[.](\d{1,3})")
-ip6 = re.compile(r"""^(([0-9a-f]{1,4}:){1,1}(:[0-9a-f]{1,4}){1,6})$|
+ip = lazy_re(r"^(\d{1,3})[.](\d{1,3})[.](\d{1,3})[.](\d{1,3})")
+ip6 = lazy_re(r"""^(([0-9a-f]{1,4}:){1,1}(:[0-9a-f]{1,4}){1,6})$|
 ^(([0-9a-f]{1,4}:){1,2}(:[0-9a-f]{1,4}){1,5})$|
 ^(([0-9a-f]{1,4}:){1,3}(:[0-9a-f]{1,4}){1,4})$|
 ^(([0-9a-f]{1,4}:){1,4}(:[0-9a-f]{1,4}){1,3})$|
 ^(([0-9a-f]{1,4}:){1,5}(:[0-9a-f]{1,4}){1,2})$|
 ^(([0-9a-f]{1,4}:){1,6}(:[0-9a-f]{1,4}){1,1})$""")
-ip6 = re.compile(r"""
+ip6 = lazy_re(r"""
     ^((([0-9a-f]{1,4}:){1,6})(:[0-9a-f]{1,4}){1,1})$|
     ^((([0-9a-f]{1,4}:){1,5})(:[0-9a-f]{1,4}){1,2})$|
     ^((([0-9a-f]{1,4}:){1,4})(:[0-9a-f]{1,4}){1,3})$|
@@ -2372,7 +2597,11 @@ ip6 = re.compile(r"""
     ^(:(:[0-9a-f]{1,4}){1,5}:(25[0-5]|2[0-4]\d|[0-1]?\d?\d)(\.(25[0-5]|2[0-4]\d|[0-1]?\d?\d)){3})$
 """, re.X | re.I)
 
-listre = re.compile(r"\s*[{]([^}]*)[}]\s*")
+# Plain decimal integers and reals; the groups are the fraction and the
+# exponent.
+decimal = re.compile(r"[-+]?(?:\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?$")
+
+listre = re.compile(r"\s*[{](.*)[}]\s*$", re.S)
 
 class List(object):
     def __init__(self, items):
@@ -2467,7 +2696,7 @@ class List(object):
     def __len__(self):
         return len(self.items)
 
-vect = re.compile(r"\s*\[([^]]*)\]\s*")
+vect = re.compile(r"\s*\[(.*)\]\s*$", re.S)
 
 class Vector(object):
     def __init__(self, items):
@@ -2572,22 +2801,64 @@ class Number(object):
     # arithmetic is unsigned.
     signed = True
 
+    # Parsed values of this many distinct tokens are remembered
+    memo_size = 4096
+
+    # Types that are never memoized because they are mutable or depend on
+    # the time they were parsed
+    volatile = (Julian, List, Vector)
+
+    # Bases for plain integers in each integer_mode
+    bases = {"hex" : 16, "oct" : 8, "bin" : 2}
+
     def __init__(self, parser):
         self.tokenize = parser
-
-    def get_next_token(self, line):
-        # snag the next token from the line
-        if line != '':
-            token, line = self.tokenize(line)
-            return token, line
-        return None, (), ''
+        self.memo = OrderedDict()
+        # The parsers to try, chosen by the first character of the token
+        self.parsers = {}
+        for c in "{[":
+            self.parsers[c] = (self.j, self.v, self.c, self.L, self.V)
+        self.all_parsers = (
+                    self.ip,   # ipaddr
+                    self.j,    # julian
+                    self.i,    # integer
+                    self.q,    # rational
+                    self.v,    # interval
+                    self.r,    # float
+                    self.c,    # complex
+                )
 
     def __call__(self, s, tags=None):
         assert len(s) > 0
-        suffix = 1
         if tags is not None:
             if 'ipaddr' in tags:
                 return self.ip(s, tags)
+        st = settings.current()
+        key = (s, st.cfg["integer_mode"], st.bits, st.signed, mp.prec)
+        x = self.memo.get(key)
+        if x is None:
+            x = self.parse(s)
+            if x is not None and not isinstance(x, self.volatile):
+                self.memo[key] = x
+                if len(self.memo) > self.memo_size:
+                    self.memo.popitem(last=False)
+        return x
+
+    def parse(self, s):
+        # Plain decimal integers and reals are by far the most common
+        # input, so they are recognized in one step
+        mo = decimal.match(s)
+        if mo:
+            fraction, exponent = mo.groups()
+            mode = settings.current().cfg["integer_mode"]
+            if fraction is None and (exponent is None or mode == "hex"):
+                try:
+                    return Zn(str_int(s, self.bases.get(mode, 10)))
+                except ValueError:
+                    pass
+            else:
+                return self.q(s)
+        suffix = 1
         if s != "now" and s != "today":
             if len(s) > 1 and s[:2] != "0x":
                 if s[-1] in suffixes_ln:
@@ -2597,18 +2868,7 @@ class Number(object):
                     else:
                         suffix = mpf("1e" + str(exponent))
                     s = s[:-1]
-        for func in \
-                (
-                    self.ip,   # ipaddr
-                    self.j,    # julian
-                    self.i,    # integer
-                    self.q,    # rational
-                    self.v,    # interval
-                    self.r,    # float
-                    self.c,    # complex
-                    self.L,    # list
-                    self.V,    # vector
-                ):
+        for func in self.parsers.get(s[0], self.all_parsers):
             x = func(s)
             if x is not None:
                 if suffix == 1:
@@ -2644,7 +2904,7 @@ class Number(object):
 
     def i(self, s):
         # Handle special cases like 0x, 0o, and 0b
-        def_base = config.cfg["integer_mode"]
+        def_base = settings.current().cfg["integer_mode"]
         try:
             value = 0
             match = False
@@ -2653,7 +2913,7 @@ class Number(object):
                     value = int(s[2:], 16)
                     match = True
                 elif s[:2] == "0d":
-                    value = int(s[2:], 10)
+                    value = str_int(s[2:])
                     match = True
                 elif s[:2] == "0o":
                     value = int(s[2:], 8)
@@ -2666,7 +2926,7 @@ class Number(object):
                     value = int(s, 16)
                     match = True
                 elif def_base == "dec":
-                    value = int(s, 10)
+                    value = str_int(s)
                     match = True
                 elif def_base == "oct":
                     value = int(s, 8)
@@ -2677,7 +2937,7 @@ class Number(object):
             if match:
                 return Zn(value)
             if integer.match(s):
-                return Zn(int(s))
+                return Zn(str_int(s))
         except ValueError:
             pass
         except Exception:
@@ -2693,12 +2953,12 @@ class Number(object):
         mo = listre.match(s)
         if mo:
             # is this is a list
-            s = mo.group(1)
             v = []
-            while True:
-                token, s = self.get_next_token(s)
-                if not token: break
-                v.append(self(token))
+            for token, end in self.tokenize(mo.group(1)):
+                x = self(token)
+                if x is None:
+                    raise ValueError(token)
+                v.append(x)
             return List(v)
         return None
 
@@ -2706,21 +2966,19 @@ class Number(object):
         mo = vect.match(s)
         if mo:
             # is this is a vector
-            s = mo.group(1)
             v = []
-            while True:
-                token, s = self.get_next_token(s)
-                if not token: break
-                v.append(self(token))
+            for token, end in self.tokenize(mo.group(1)):
+                x = self(token)
+                if x is None:
+                    raise ValueError(token)
+                v.append(x)
             return Vector(v)
         return None
 
     def ip(self, s, tags=None):
         def unpack(s):
-            v = '0x'
-            for i in range(len(s)):
-                v += '%02x' % ord(s[i])
-            return int(v,16)
+            return int.from_bytes(s, 'big')
+        import socket
         cidr = None
         if '/' in s:
             sparts = s.split('/')
@@ -2731,18 +2989,18 @@ class Number(object):
                 tags = ['ipv4', 'ipv6']
             if 'ipv4' in tags:
                 mo = ip.match(s)
-                if cidr is None:
-                    cidr = 32
                 if mo:
                     dquad = [ int(i) for i in mo.groups() if i ]
                     if max(dquad) > 255:
                         return None
+                    if cidr is None:
+                        cidr = 32
                     ps = socket.inet_pton(socket.AF_INET, s)
                     return ipaddr(unpack(ps), cidr, 'ipv4')
             if 'ipv6' in tags:
-                if cidr is None:
-                    cidr = 128
                 if ip6.match(s):
+                    if cidr is None:
+                        cidr = 128
                     ps = socket.inet_pton(socket.AF_INET6, s)
                     return ipaddr(unpack(ps), cidr, 'ipv6')
         except Exception as e:
@@ -2761,9 +3019,9 @@ class Number(object):
             if idx >= 0:
                 frac = digits[idx+1:]
                 d = 10 ** len(frac)
-                n = int("%s%s" % (digits[:idx], frac))
+                n = str_int(digits[:idx] + frac)
             else:
-                n = int(digits)
+                n = str_int(digits)
             if exp is not None:
                 exp = int(exp[1:])
                 if exp < 0:
@@ -2784,7 +3042,7 @@ class Number(object):
                 sign = "-"
                 del g[0]
             try:
-                num = [int(i) for i in g]
+                num = [str_int(i) for i in g]
             except:
                 raise Exception("Bug:  rational match on non-integer")
             if not num:
@@ -2797,7 +3055,9 @@ class Number(object):
                 msg = "Program bug\nUnexpected number of matches on\n"
                 msg += "'%s'" % s
                 raise Exception(msg)
-            n = int(sign + str(w*d + n))
+            n = w*d + n
+            if sign:
+                n = -n
             return Rational(n, d)
         else:
             return None
@@ -2915,7 +3175,7 @@ class Number(object):
         else:
             return None
 
-if __name__ == "__main__":
+def _number_tests():
     # Test cases
     nums = {
         # Integers
@@ -3038,7 +3298,7 @@ if __name__ == "__main__":
             ),
     }
 
-    n = Number()
+    n = Number(str.split)
     status = 0
     for number in nums:
         for numstr in nums[number]:
@@ -3056,7 +3316,7 @@ if __name__ == "__main__":
                 print(("  Should be %s" % str(number)))
                 print(("  Got       %s" % str(num)))
                 status += 1
-    exit(status)
+    assert status == 0, "%d numbers were read wrong" % status
 
 
 # Strings to identify types
@@ -3086,7 +3346,7 @@ def Convert(x, arg_type, digits=0):
         elif isinstance(x, Rational): return x
         elif isinstance(x, mpf):      return Rational().frac(x, digits)
         elif isinstance(x, mpc):      return Rational().frac(abs(x), digits)
-        elif isinstance(x, ctx_iv.ivmpf):      return Rational(x.mid)
+        elif isinstance(x, ctx_iv.ivmpf):      return Rational().frac(mpf(x.mid), digits)
         elif isinstance(x, Julian):   return Rational().frac(x.to_mpf(), digits)
         else: raise e
     elif arg_type == MPF:
@@ -3094,7 +3354,7 @@ def Convert(x, arg_type, digits=0):
         elif isinstance(x, Rational): return x.mpf()
         elif isinstance(x, mpf):      return x
         elif isinstance(x, mpc):      return abs(x)
-        elif isinstance(x, ctx_iv.ivmpf):      return x.mid
+        elif isinstance(x, ctx_iv.ivmpf):      return mpf(x.mid)
         elif isinstance(x, Julian):   return x.to_mpf()
         else: raise e
     elif arg_type == MPC:
@@ -3102,7 +3362,7 @@ def Convert(x, arg_type, digits=0):
         elif isinstance(x, Rational): return x.mpc()
         elif isinstance(x, mpf):      return mpc(x, 0)
         elif isinstance(x, mpc):      return x
-        elif isinstance(x, ctx_iv.ivmpf):      return mpc(x.mid, 0)
+        elif isinstance(x, ctx_iv.ivmpf):      return mpc(mpf(x.mid), 0)
         elif isinstance(x, Julian):   return mpc(x.to_mpf(), 0)
         else: raise e
     elif arg_type == MPI:
@@ -3127,6 +3387,11 @@ def Convert(x, arg_type, digits=0):
         raise SyntaxError("Unknown type")
 
 if __name__ == "__main__":
+    # Each group starts from the default settings
+    for tests in (_rational_tests, _zn_tests, _zmod_tests, _julian_tests,
+                  _number_tests):
+        with settings.Settings():
+            tests()
     # Unit tests
     def TestConvert():
         n = 1
@@ -3143,7 +3408,7 @@ if __name__ == "__main__":
             (RAT, Rational),
             (MPF, mpf),
             (MPC, mpc),
-            (MPI, mpi),
+            (MPI, ctx_iv.ivmpf),
             (JUL, Julian)
         )
         for number in number_types:
@@ -0,0 +1,352 @@
+'''
+Prime numbers and integer factorization.
+
+    factor(n)       the prime factors of n, smallest first, each as many
+                    times as it divides n
+    is_prime(n)     True if n is prime (by Miller-Rabin)
+    isprime(n)      True if n is prime (by the sieve when it is small)
+    nextprime(n)    the smallest prime greater than n
+    prevprime(n)    the largest prime less than n
+    primepi(n)      the number of primes <= n
+    first(n)        the list of the first n primes
+
+Numbers below sieve_limit are looked up in a segmented sieve of
+Eratosthenes:  each segment covers segment_span numbers with one byte
+per odd number, and is sieved the first time it is needed.  The last
+segments_kept segments are kept, as is the count of primes in every
+segment sieved, so once the sieve is warm these answer in microseconds.
+Above sieve_limit, primality is decided by Miller-Rabin.
+
+Factoring trial-divides by a table of the primes below table_limit,
+which is sieved on first use and kept, then splits what is left with
+Brent's variant of Pollard's rho, testing the pieces with Miller-Rabin.
+Rho finds a factor p in about sqrt(p) steps, so numbers of any size
+factor quickly as long as all but one of their prime factors are below
+about 10**12.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import itertools
+import math
+import threading
+from collections import OrderedDict
+
+# The primes below this are kept in a table once they are needed
+table_limit = 1 << 16
+
+_table = None
+
+# Miller-Rabin with these bases is exact for n below
+# 3317044064679887385961981; above that, a composite passes with a
+# probability far below 4**-13.
+mr_bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+# Steps of rho between gcds
+rho_batch = 128
+
+# The numbers each sieve segment covers (even), how many segments are
+# kept and where the sieve stops; sieve_limit must not be more than
+# table_limit**2
+segment_span = 1 << 20
+segments_kept = 8
+sieve_limit = 1 << 32
+
+_segments = OrderedDict()
+# _counts[k] is the number of primes below k*segment_span
+_counts = [0]
+_lock = threading.Lock()
+
+def sieve(n):
+    '''Return the list of primes below n, found with a sieve of
+    Eratosthenes over the odd numbers.
+    '''
+    if n <= 2:
+        return []
+    # flags[i] is for 2*i + 1
+    size = n//2
+    flags = bytearray([1])*size
+    flags[0] = 0
+    for i in range(1, (math.isqrt(n - 1) - 1)//2 + 1):
+        if flags[i]:
+            p = 2*i + 1
+            start = p*p//2
+            flags[start::p] = bytes(len(range(start, size, p)))
+    return [2] + [2*i + 1 for i in itertools.compress(range(size), flags)]
+
+def table():
+    'Return the primes below table_limit.'
+    global _table
+    if _table is None:
+        _table = sieve(table_limit)
+    return _table
+
+def is_prime(n):
+    '''Return True if the integer n is prime, using trial division by a
+    few primes and then Miller-Rabin.
+    '''
+    if n < 2:
+        return False
+    for p in mr_bases:
+        if n % p == 0:
+            return n == p
+    if n < mr_bases[-1]**2:
+        return True
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    for a in mr_bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for r in range(s - 1):
+            x = x*x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def _sieve_segment(k):
+    '''Return the flags of segment k:  flags[i] is 1 if
+    k*segment_span + 2*i + 1 is prime.
+    '''
+    lo = k*segment_span
+    hi = lo + segment_span
+    size = segment_span//2
+    flags = bytearray([1])*size
+    if k == 0:
+        flags[0] = 0
+    for p in itertools.islice(table(), 1, None):
+        if p*p >= hi:
+            break
+        start = max(p*p, -(-lo//p)*p)
+        if start % 2 == 0:
+            start += p
+        i = (start - lo)//2
+        if i < size:
+            flags[i::p] = bytes((size - 1 - i)//p + 1)
+    return flags
+
+def segment(k):
+    'Return the flags of segment k, sieving it if it isn\'t kept.'
+    with _lock:
+        flags = _segments.get(k)
+        if flags is not None:
+            _segments.move_to_end(k)
+            return flags
+    flags = _sieve_segment(k)
+    with _lock:
+        _segments[k] = flags
+        if len(_segments) > segments_kept:
+            _segments.popitem(last=False)
+    return flags
+
+def _check_limit(n):
+    if n >= sieve_limit:
+        raise ValueError("%d is too large; the limit is %d" % (n, sieve_limit))
+
+def isprime(n):
+    '''Return True if the integer n is prime.
+    '''
+    if n < sieve_limit:
+        if n < 3 or n % 2 == 0:
+            return n == 2
+        k, r = divmod(n, segment_span)
+        return segment(k)[r//2] == 1
+    return is_prime(n)
+
+def nextprime(n):
+    '''Return the smallest prime greater than the integer n.
+    '''
+    if n < 2:
+        return 2
+    n += 1
+    while n < sieve_limit:
+        k, r = divmod(n, segment_span)
+        i = segment(k).find(1, r//2)
+        if i >= 0:
+            return k*segment_span + 2*i + 1
+        n = (k + 1)*segment_span
+    n |= 1
+    while not is_prime(n):
+        n += 2
+    return n
+
+def prevprime(n):
+    '''Return the largest prime less than the integer n.
+    '''
+    if n <= 2:
+        raise ValueError("There is no prime less than %d" % n)
+    if n <= 3:
+        return 2
+    n -= 1
+    if n >= sieve_limit:
+        n -= 1 - n % 2
+        while n >= sieve_limit:
+            if is_prime(n):
+                return n
+            n -= 2
+    while True:
+        k, r = divmod(n, segment_span)
+        i = segment(k).rfind(1, 0, (r + 1)//2)
+        if i >= 0:
+            return k*segment_span + 2*i + 1
+        n = k*segment_span - 1
+
+def _count(k):
+    '''Return the number of primes below k*segment_span, sieving the
+    segments not counted yet.
+    '''
+    while len(_counts) <= k:
+        j = len(_counts) - 1
+        c = segment(j).count(1) + (j == 0)
+        with _lock:
+            if len(_counts) == j + 1:
+                _counts.append(_counts[j] + c)
+    return _counts[k]
+
+def primepi(n):
+    '''Return the number of primes <= the integer n; n must be below
+    sieve_limit.
+    '''
+    if n < 2:
+        return 0
+    _check_limit(n)
+    k, r = divmod(n, segment_span)
+    return _count(k) + segment(k).count(1, 0, (r + 1)//2) + (k == 0)
+
+def first(n):
+    '''Return the list of the first n primes.
+    '''
+    result = []
+    k = 0
+    while len(result) < n:
+        lo = k*segment_span
+        _check_limit(lo)
+        if k == 0:
+            result.append(2)
+        flags = segment(k)
+        result += [lo + 2*i + 1 for i in itertools.compress(range(len(flags)), flags)]
+        k += 1
+    return result[:max(n, 0)]
+
+def rho(n):
+    '''Return a nontrivial factor of n, which must be an odd composite
+    that isn't a perfect power of a prime below table_limit.  This is
+    Brent's variant of Pollard's rho:  the differences are multiplied
+    together and only their product's gcd with n is taken.
+    '''
+    for c in itertools.count(1):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for i in range(r):
+                y = (y*y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for i in range(min(rho_batch, r - k)):
+                    y = (y*y + c) % n
+                    q = q*(x - y) % n
+                g = math.gcd(q, n)
+                k += rho_batch
+            r *= 2
+        if g == n:
+            # The batch went past the factor; redo it one step at a time
+            g = 1
+            while g == 1:
+                ys = (ys*ys + c) % n
+                g = math.gcd(x - ys, n)
+        if g != n:
+            return g
+
+def factor(n):
+    '''Return the list of the prime factors of the integer n, smallest
+    first, each as many times as it divides n.  A negative n has -1 as
+    its first factor and 1 has none.
+    '''
+    if n == 0:
+        raise ValueError("0 has no prime factorization")
+    factors = []
+    if n < 0:
+        factors.append(-1)
+        n = -n
+    for p in table():
+        if p*p > n:
+            if n > 1:
+                factors.append(n)
+            return factors
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+    # n has no factor below table_limit
+    large = []
+    pending = [n]
+    while pending:
+        n = pending.pop()
+        if n == 1:
+            continue
+        if n < table_limit**2 or is_prime(n):
+            large.append(n)
+            continue
+        r = math.isqrt(n)
+        if r*r == n:
+            pending += [r, r]
+            continue
+        d = rho(n)
+        pending += [d, n//d]
+    return factors + sorted(large)
+
+if __name__ == "__main__":
+    assert sieve(30) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert sieve(3) == [2] and sieve(2) == []
+    assert len(table()) == 6542
+    assert [n for n in range(200) if is_prime(n)] == sieve(200)
+    assert not is_prime(3215031751) and is_prime(2**61 - 1)
+    assert factor(1) == [] and factor(-12) == [-1, 2, 2, 3]
+    assert factor(600851475143) == [71, 839, 1471, 6857]
+    assert factor(65537**2) == [65537, 65537]
+    p, q = 2**31 - 1, 1000000007
+    assert factor(p*q*q) == [q, q, p]
+    assert factor(2**64 + 1) == [274177, 67280421310721]
+    for n in range(1, 3000):
+        f = factor(n)
+        assert math.prod(f) == n and all(is_prime(p) for p in f)
+    assert first(10) == sieve(30) and first(0) == []
+    assert first(100000) == [p for p in sieve(1300000)][:100000]
+    assert all(isprime(n) == is_prime(n) for n in range(-5, 5000))
+    assert all(isprime(n) == is_prime(n) for n in range(2**32 - 3000, 2**32 + 3000))
+    assert primepi(10**7) == 664579 and primepi(2) == 1 and primepi(segment_span) == 82025
+    assert nextprime(segment_span - 2) == 1048583 and prevprime(1048583) == 1048573
+    assert nextprime(2**32 - 5) == 2**32 + 15 and prevprime(2**32 + 15) == 4294967291
+    assert nextprime(1) == 2 and nextprime(2) == 3 and prevprime(3) == 2
+    exit(0)
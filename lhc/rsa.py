@@ -0,0 +1,260 @@
+'''
+RSA key arithmetic and the Chinese remainder theorem.
+
+    private(p, q, e)        d, dp, dq and qinv for the primes p, q and
+                            the public exponent e
+    factor_phi(n, phi)      p and q from n = p*q and phi = (p-1)*(q-1)
+    factor_exponents(n, e, d)
+                            p and q from n and the key's two exponents
+    crt(residues, moduli)   the x with x = residues[i] mod moduli[i]
+    decrypt(c, p, q, d)     c**d mod p*q, by a power mod p and one mod q
+    batch_gcd(moduli)       the gcd of each modulus with the product of
+                            the others
+
+Everything is done with Python's integers:  inverses with pow(x, -1, m)
+and square roots with math.isqrt, both exact, so 4096 bit keys take
+milliseconds.
+
+batch_gcd is Bernstein's algorithm:  a product tree of the moduli, then
+P mod n**2 for the product P and each modulus n, from the root down.
+Python's multiplication is Karatsuba and its division is quadratic,
+which makes the top of the trees slower than pairwise gcds, so the
+trees are built with the decimal module, whose multiplication is
+quasi-linear.  Going down, the remainders are kept as fractions
+frac(P/v**2), each the parent's times the sibling squared, so they need
+only multiplications (a scaled remainder tree).
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import math
+from decimal import Decimal, Context, Inexact, Rounded, ROUND_DOWN, \
+        MAX_PREC, MAX_EMAX, MIN_EMIN
+
+def private(p, q, e):
+    '''Return d, dp, dq, qinv of the RSA key with the primes p and q and
+    the public exponent e:  d is the inverse of e mod (p-1)*(q-1), dp
+    and dq are d mod p-1 and q-1 and qinv is the inverse of q mod p.
+    '''
+    if p == q:
+        raise ValueError("p and q must be different primes")
+    try:
+        d = pow(e, -1, (p - 1)*(q - 1))
+        qinv = pow(q, -1, p)
+    except ValueError:
+        raise ValueError("e must be coprime to (p-1)*(q-1)")
+    return d, d % (p - 1), d % (q - 1), qinv
+
+def factor_phi(n, phi):
+    '''Return p, q (p < q) with p*q = n and (p-1)*(q-1) = phi.  p and q
+    are the roots of x**2 - (n + 1 - phi)*x + n.
+    '''
+    s = n + 1 - phi
+    disc = s*s - 4*n
+    r = math.isqrt(disc) if disc >= 0 else -1
+    if r < 0 or r*r != disc or (s - r) % 2:
+        raise ValueError("phi is not the totient of a product of two primes")
+    return (s - r)//2, (s + r)//2
+
+def factor_exponents(n, e, d):
+    '''Return p, q (p < q) with p*q = n, for the exponents e and d of an
+    RSA key.  e*d - 1 is k*phi for a k near (e*d - 1)/n; each k that
+    divides it gives a phi to try.  If d was taken mod lcm(p-1, q-1)
+    rather than phi, no k does, and n is split by a square root of 1
+    other than +-1 instead.
+    '''
+    ed1 = e*d - 1
+    if ed1 <= 0:
+        raise ValueError("e*d must be > 1")
+    k0 = max(ed1//n, 1)
+    for k in range(k0, k0 + 3):
+        if ed1 % k == 0:
+            try:
+                return factor_phi(n, ed1//k)
+            except ValueError:
+                pass
+    # ed1 is a multiple of lcm(p-1, q-1), so a**ed1 = 1 for every a; the
+    # square roots of 1 on the way there are +-1 mod p and mod q
+    t = (ed1 & -ed1).bit_length() - 1
+    r = ed1 >> t
+    for a in range(2, 1000):
+        x = pow(a, r, n)
+        for i in range(t):
+            y = x*x % n
+            if y == 1 and x != 1 and x != n - 1:
+                p = math.gcd(x - 1, n)
+                return min(p, n//p), max(p, n//p)
+            x = y
+            if x == 1:
+                break
+    raise ValueError("n, e and d are not an RSA key")
+
+def crt(residues, moduli):
+    '''Return x, m:  m is the lcm of moduli and x (0 <= x < m) is the
+    integer with x = residues[i] (mod moduli[i]) for every i.  The
+    moduli need not be coprime, but then the residues must agree.
+    '''
+    if len(residues) != len(moduli):
+        raise ValueError("There must be as many residues as moduli")
+    x, m = 0, 1
+    for a, b in zip(residues, moduli):
+        b = abs(b)
+        if b == 0:
+            raise ValueError("Moduli must not be zero")
+        g = math.gcd(m, b)
+        if (a - x) % g:
+            raise ValueError("%d mod %d contradicts the other residues" % (a, b))
+        # x + m*t = a (mod b), solved for t mod b/g
+        t = (a - x)//g*pow(m//g, -1, b//g) % (b//g)
+        x += m*t
+        m = m//g*b
+        x %= m
+    return x, m
+
+def decrypt(c, p, q, d, dp=None, dq=None, qinv=None):
+    '''Return c**d mod p*q, found from c**dp mod p and c**dq mod q, which
+    are about four times quicker together than the one power.  dp, dq
+    and qinv are computed if they aren't given.
+    '''
+    if dp is None:
+        dp = d % (p - 1)
+    if dq is None:
+        dq = d % (q - 1)
+    if qinv is None:
+        qinv = pow(q, -1, p)
+    m1 = pow(c, dp, p)
+    m2 = pow(c, dq, q)
+    h = qinv*(m1 - m2) % p
+    return m2 + h*q
+
+# Exact integer arithmetic, and the same truncating
+_exact = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN,
+                 traps=[Inexact, Rounded])
+_truncate = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN,
+                    rounding=ROUND_DOWN)
+_one = Decimal(1)
+
+def _digits(x):
+    'Return the number of digits of the Decimal integer x > 0.'
+    return x.adjusted() + 1
+
+def _shift(x, d):
+    'Return x//10**d for the Decimal integer x >= 0.'
+    return _truncate.quantize(_exact.scaleb(x, -d), _one)
+
+def batch_gcd(moduli):
+    '''Return the list of gcd(n, P/n) for each n in moduli, where P is
+    the product of all of them:  each modulus's factors shared with
+    another modulus, or the modulus itself if it is repeated.  The
+    moduli must be positive.
+    '''
+    if any(n <= 0 for n in moduli):
+        raise ValueError("Moduli must be positive")
+    if not moduli:
+        return []
+    c = _exact
+    # The product tree:  tree[0] are the moduli and each node above is
+    # the product of two below it (or just one at the end of a level)
+    level = [Decimal(n) for n in moduli]
+    tree = [level]
+    while len(level) > 1:
+        up = [c.multiply(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            up.append(level[-1])
+        tree.append(up)
+        level = up
+    # f/10**k is frac(P/v**2) for a node v, less at most one unit in
+    # the last place for each level above it; guard digits keep that
+    # below a half at the leaves, where it is multiplied by n**2
+    guard = 2*len(tree) + 2
+    root = tree.pop()[0]
+    k = 2*_digits(root) + guard
+    fracs = [(c.divide_int(c.scaleb(_one, k), root), k)]
+    while tree:
+        level = tree.pop()
+        down = []
+        for i in range(len(level)):
+            f, k = fracs[i//2]
+            if i ^ 1 < len(level):
+                # frac(P/v**2) = frac(frac(P/parent**2)*sibling**2)
+                s2 = c.multiply(level[i ^ 1], level[i ^ 1])
+                d = _digits(s2)
+                x = c.multiply(f, s2)
+                x = c.subtract(x, c.scaleb(_shift(x, k), k))
+                f, k = _shift(x, d), k - d
+            down.append((f, k))
+        fracs = down
+    result = []
+    for (f, k), n in zip(fracs, moduli):
+        n2 = n*n
+        scale = 10**k
+        r = (int(f)*n2 + scale//2)//scale % n2
+        result.append(math.gcd(r//n, n))
+    return result
+
+if __name__ == "__main__":
+    import random
+    from .primes import is_prime
+    rnd = random.Random(22)
+    def prime(bits):
+        while True:
+            p = rnd.getrandbits(bits) | (1 << (bits - 1)) | 1
+            if is_prime(p):
+                return p
+    p, q, e = prime(256), prime(256), 65537
+    n, phi = p*q, (p - 1)*(q - 1)
+    d, dp, dq, qinv = private(p, q, e)
+    assert e*d % phi == 1 and qinv*q % p == 1
+    assert factor_phi(n, phi) == (min(p, q), max(p, q))
+    assert factor_exponents(n, e, d) == (min(p, q), max(p, q))
+    lam = phi//math.gcd(p - 1, q - 1)
+    assert factor_exponents(n, e, pow(e, -1, lam)) == (min(p, q), max(p, q))
+    for i in range(20):
+        c = rnd.randrange(n)
+        assert decrypt(c, p, q, d) == pow(c, d, n)
+        assert pow(decrypt(c, p, q, d), e, n) == c
+    assert crt([2, 3, 2], [3, 5, 7]) == (23, 105)
+    assert crt([3, 5], [4, 6]) == (11, 12)
+    assert crt([], []) == (0, 1)
+    ps = [prime(64) for i in range(40)]
+    moduli = [ps[i]*ps[i + 20] for i in range(20)] + [ps[3]*ps[30], ps[5]*ps[25]]
+    product = math.prod(moduli)
+    assert batch_gcd(moduli) == [math.gcd(n, product//n) for n in moduli]
+    assert batch_gcd([15, 15, 7]) == [15, 15, 1] and batch_gcd([]) == []
+    assert batch_gcd([35]) == [1] and batch_gcd([6, 10, 15]) == [6, 10, 15]
+    for bad in (lambda: crt([1, 2], [4, 6]), lambda: factor_phi(15, 9),
+                lambda: private(7, 7, 3), lambda: private(7, 11, 3)):
+        try:
+            bad()
+            raise AssertionError("no ValueError")
+        except ValueError:
+            pass
+    exit(0)
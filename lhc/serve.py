@@ -0,0 +1,256 @@
+'''
+Serve calculator sessions over a socket for --serve.
+
+    hc --serve 7788               TCP on 127.0.0.1 port 7788
+    hc --serve host:7788          TCP on the given interface
+    hc --serve /tmp/hc.sock       Unix domain socket
+
+Every connection is a session with its own stack, registers and
+settings (integer mode, precision, display format, etc.).  The
+client sends one request per line and gets one line back for each:
+
+    2 3 +                    ->  5
+    4 *                      ->  20
+    foo                      ->  ! Invalid input: foo
+
+A plain text request is answered with x as it would be displayed (an
+empty line if the stack is empty), or with '!' and the error messages.
+A request that is a JSON object with a program is answered with JSON:
+
+    {"id": 1, "program": "2 3 +"}
+    -> {"id": 1, "stack": ["5"], "errors": []}
+
+where stack is the whole stack formatted, x last, and id is echoed
+back if given.  Any other line, including one starting with a List
+such as {1 2 3} mean, is a plain text request.  'quit' closes the session.
+
+Each session evaluates its requests on its own calculator context.  It
+is taken from a pool of idle contexts on the session's first request,
+and reset to the loaded configuration and put back when the connection
+closes, so new sessions don't pay for making one.  Requests that
+use a command in Server.heavy run on a thread pool so the event loop can
+keep reading and answering other sessions; a session's requests are
+answered in order, so its context is only used by one thread at a time.
+Commands that read files (stats FILE) aren't available to clients.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from . import settings
+from .engine import Context, EvaluationError
+
+nl = "\n"
+
+class Session(object):
+    '''The state a connection keeps between requests.
+    '''
+    def __init__(self):
+        self.context = None
+
+class Server(object):
+    # Commands that can take long enough to stall other sessions
+    heavy = set(["factor", "!", "zeta", "gamma", "fib", "comb", "perm",
+                 "roots", "ncdf", "invn", "primepi", "primes", "fibs",
+                 "batchgcd"])
+
+    # Idle contexts kept for reuse
+    pool_size = 16
+
+    # The longest request line, in bytes; asyncio's default of 64 KiB is
+    # less than a List of 20000 numbers.  A longer line is answered with
+    # an error and skipped.
+    line_limit = 1 << 24
+
+    def __init__(self, threads=None):
+        # Sessions evaluate on the event loop and the executor at once
+        settings.threaded()
+        self.pool = []
+        self.executor = ThreadPoolExecutor(threads)
+
+    def acquire(self):
+        if self.pool:
+            return self.pool.pop()
+        context = Context()
+        # Clients mustn't read the server's files
+        context.file_access = False
+        return context
+
+    def release(self, context):
+        if len(self.pool) < self.pool_size:
+            context.reset()
+            self.pool.append(context)
+
+    def is_heavy(self, context, program):
+        with context.settings:
+            for line in program.splitlines():
+                line = context.strip_comment(line)
+                if line == '':
+                    continue
+                try:
+                    ops = context.compile(line)
+                except Exception:
+                    # evaluate reports the error
+                    return False
+                for handler, arg, data in ops:
+                    if arg in self.heavy:
+                        return True
+        return False
+
+    def evaluate(self, context, program):
+        '''Run program on context.  Returns the formatted stack and the
+        list of errors.
+        '''
+        try:
+            context.run_program(program)
+            errors = []
+        except EvaluationError as e:
+            errors = e.errors
+        return [context.format(v) for v in context.values()], errors
+
+    async def request(self, session, program):
+        if session.context is None:
+            session.context = self.acquire()
+        context = session.context
+        if self.is_heavy(context, program):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.evaluate,
+                                              context, program)
+        return self.evaluate(context, program)
+
+    def json_request(self, line):
+        '''Return the request in line if it is a JSON object with a
+        program, and None if line is a plain text request.
+        '''
+        if not line.startswith("{"):
+            return None
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return None
+        if isinstance(request, dict) and "program" in request:
+            return request
+        return None
+
+    async def respond(self, session, line):
+        '''Return the reply to one request line.
+        '''
+        request = self.json_request(line)
+        if request is not None:
+            stack, errors = await self.request(session, str(request["program"]))
+            reply = {"stack": stack, "errors": errors}
+            if "id" in request:
+                reply["id"] = request["id"]
+            return json.dumps(reply)
+        stack, errors = await self.request(session, line)
+        if errors:
+            return "! " + "; ".join(errors)
+        if stack:
+            return stack[-1]
+        return ""
+
+    async def read_line(self, reader):
+        '''Return the next request line as bytes (empty at the end of the
+        input), or None if it is longer than line_limit, skipping it.
+        '''
+        try:
+            return await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            # The last line has no newline
+            return e.partial
+        except asyncio.LimitOverrunError:
+            pass
+        while True:
+            try:
+                await reader.readuntil(b"\n")
+                return None
+            except asyncio.IncompleteReadError:
+                return None
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+
+    async def handle(self, reader, writer):
+        session = Session()
+        try:
+            while True:
+                line = await self.read_line(reader)
+                if line is None:
+                    writer.write(("! line too long" + nl).encode("utf-8"))
+                    await writer.drain()
+                    continue
+                if not line:
+                    break
+                line = line.decode("utf-8", "replace").strip()
+                if line == "quit":
+                    break
+                reply = await self.respond(session, line)
+                writer.write((reply + nl).encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if session.context is not None:
+                self.release(session.context)
+
+    async def start(self, address):
+        '''Start listening on address; see the module documentation for
+        its forms.
+        '''
+        if os.sep in address:
+            return await asyncio.start_unix_server(self.handle, address,
+                                                   limit=self.line_limit)
+        host, sep, port = address.rpartition(":")
+        return await asyncio.start_server(self.handle, host or "127.0.0.1",
+                                          int(port), limit=self.line_limit)
+
+    async def serve(self, address, display):
+        server = await self.start(address)
+        names = [str(s.getsockname()) for s in server.sockets]
+        display.msg("Serving on %s" % ", ".join(names))
+        async with server:
+            await server.serve_forever()
+
+def run(options, display):
+    '''Serve on options.serve until interrupted.  options.jobs is the
+    number of threads for heavy requests (0 for the default).
+    '''
+    server = Server(options.jobs or None)
+    try:
+        asyncio.run(server.serve(options.serve, display))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.sep in options.serve and os.path.exists(options.serve):
+            os.unlink(options.serve)
@@ -0,0 +1,190 @@
+'''
+The settings one calculator evaluates with.
+
+A Settings is a calculator's own copy of the configuration, its own
+mpmath context (a clone of mpmath.mp, which holds its precision), its C
+integer mode, the formatter for its dates and a generation count for its
+caches.  The numeric types
+and the formatters read the settings active in the calling thread, so
+calculators in different threads don't see each other's changes:
+
+    with calculator.settings:
+        ...                 # calculator's precision, integer mode, etc.
+
+A thread with no settings active uses default, which is what an
+interactive or batch calculator changes; a thread's settings should
+only be active in one thread at a time.
+
+mpmath values from a cloned context are a different type than mpf, so
+values are still made by the global context mp.  When settings become
+active, mp is given their clone's precision and rounding, and when they
+stop being active what mp has then is saved back to the clone, so
+setting mp.dps or mp.prec while settings are active changes only them.
+mp itself is left alone, so mpmath arithmetic costs what it always has.
+
+That is enough for any number of calculators in one thread.  A process
+that evaluates on several threads at once (the server) calls threaded()
+to have mp read its precision and rounding from the active settings of
+the calling thread on every operation instead, which is slower.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import threading
+from mpmath import mp
+from . import config
+from .mpformat import mpFormat
+
+class Settings(object):
+    '''A calculator's configuration, mpmath context and integer mode.
+    Using it in a with statement makes it the active settings of the
+    thread for the block.
+    '''
+    def __init__(self, cfg=None):
+        if cfg is None:
+            cfg = dict(config.cfg or config.defcfg)
+        self.cfg = cfg
+        self.mp = mp.clone()
+        # The C integer mode:  0 bits is unlimited
+        self.bits = 0
+        self.signed = True
+        # Formats the numbers in dates and times (see numeric.Julian)
+        self.julian_fp = mpFormat()
+        # Bumped whenever a setting that affects how input is parsed
+        # changes (integer mode, C integer width, precision, a reload),
+        # so anything derived from input text can tell that it is stale.
+        self.generation = 0
+        self.saved = []
+
+    def changed(self):
+        self.generation += 1
+
+    def activate(self):
+        'Make these the settings of the calling thread.'
+        switch(active.settings, self)
+        active.settings = self
+
+    def __enter__(self):
+        self.saved.append(active.settings)
+        switch(active.settings, self)
+        active.settings = self
+        return self
+
+    def __exit__(self, *exc):
+        previous = self.saved.pop()
+        switch(self, previous)
+        active.settings = previous
+
+class Active(threading.local):
+    # Replaced by default below; set per thread by Settings
+    settings = None
+
+active = Active()
+
+def current():
+    'Return the settings active in the calling thread.'
+    return active.settings
+
+# True once threaded() has hooked mp to the active settings
+_threaded = False
+
+def switch(old, new):
+    '''Save mp's precision and rounding to the settings old and give it
+    those of new, unless mp reads them from the active settings anyway.
+    '''
+    if _threaded or old is new:
+        return
+    old.mp.prec, old.mp.rounding = mp.prec, mp.rounding
+    mp.prec, mp.rounding = new.mp.prec, new.mp.rounding
+
+class PrecisionRounding(object):
+    '''Stands in for the [prec, rounding] list that mpmath's context and
+    its number types share, reading and writing the active clone's.
+    '''
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(active.settings.mp._prec_rounding)
+
+    def __getitem__(self, i):
+        return active.settings.mp._prec_rounding[i]
+
+    def __setitem__(self, i, value):
+        active.settings.mp._prec_rounding[i] = value
+
+    def __len__(self):
+        return 2
+
+def _attribute(name):
+    def get(ctx):
+        return getattr(active.settings.mp, name)
+    def set(ctx, value):
+        setattr(active.settings.mp, name, value)
+    return property(get, set)
+
+MPContext = type(mp)
+
+class ThreadContext(MPContext):
+    '''The class of mp once it is hooked up to the active settings.
+    '''
+    _prec = _attribute("_prec")
+    _dps = _attribute("_dps")
+
+    def clone(ctx):
+        'Return a new, independent context with the same precision.'
+        a = MPContext()
+        a.prec = ctx.prec
+        return a
+
+def hook(ctx):
+    '''Give the context ctx the precision of the active settings.
+    '''
+    shared = PrecisionRounding()
+    for t in (ctx.mpf, ctx.mpc, ctx.constant):
+        t._ctxdata[2] = shared
+    del ctx._prec, ctx._dps
+    ctx.__class__ = ThreadContext
+    ctx._prec_rounding = shared
+
+def threaded():
+    '''Give each thread the precision of its active settings, so
+    calculators can evaluate in several threads at once.  This can't be
+    undone, and makes every mpmath operation look up the settings.
+    '''
+    global _threaded
+    if not _threaded:
+        s = active.settings
+        s.mp.prec, s.mp.rounding = mp.prec, mp.rounding
+        hook(mp)
+        _threaded = True
+
+default = Settings()
+Active.settings = default
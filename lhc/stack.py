@@ -78,6 +78,18 @@ class Stack(object):
         else:
             raise IndexError("%s" % fln() + "Stack is empty (tried to pop)")
 
+    def popn(self, n):
+        '''Pop n items off the stack and return them in stack order, x
+        last.
+        '''
+        if n > len(self.stack):
+            raise IndexError("%s" % fln() + "Stack is too small (tried to pop %d)" % n)
+        if n <= 0:
+            return []
+        items = self.stack[-n:]
+        del self.stack[-n:]
+        return items
+
     def roll(self, end):
         if self.stack:
             if len(self.stack) == 1:
@@ -0,0 +1,673 @@
+'''
+Statistics of Lists and of streams of numbers.
+
+    Welford()           the count, mean, variance, min and max of a
+                        stream, updated one value at a time
+    summary(values)     a Welford of all of values
+    extremes(values)    the smallest and the largest of values
+    select(values, k)   the kth smallest of values, counting from 0, and
+                        the one after it
+    median(values)      the middle value, or the two middle values
+    Digest()            approximate quantiles of a stream, in constant
+                        memory
+    stream(values)      a Welford and a Digest of an iterable, read a
+                        chunk at a time
+    rows(f)             the lines of a text or CSV file, split into
+                        fields
+    fields(f)           the fields of a text or CSV file, a chunk at a
+                        time
+    read(f, parse)      a Welford and a Digest of the numbers in a file
+
+None of these change or sort values.  Integers and Rationals (over their
+common denominator), and mpf (with any integers among them) whose
+exponents aren't too far apart, are scaled to integers (an mpf is an
+integer times a power of two), which are summed exactly and compared
+quickly; an mpf mean and variance are then rounded once.  For summary
+and extremes, mpf further apart are rounded down to exact_spread bits
+below the largest, far more than the working precision.  Other values
+are summed with Welford's updates, which don't lose precision
+subtracting large sums.
+NumPy is used when it is installed, the values are mpf and float64
+holds the working precision.  select is Hoare's quickselect, which
+takes linear time.
+
+
+Copyright (c) 2011, Vernon Mauery
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or
+without modification, are permitted provided that the following
+conditions are met:
+
+* Redistributions of source code must retain the above copyright
+notice, this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above
+copyright notice, this list of conditions and the following
+disclaimer in the documentation and/or other materials provided
+with the distribution.
+* The names of the contributors may not be used to endorse or
+promote products derived from this software without specific
+prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+import csv
+import itertools
+import math
+import operator
+import random
+import re
+from bisect import bisect_right
+from mpmath import mp, mpf
+from mpmath.libmp import from_int, from_rational, round_nearest
+from .numeric import Rational, Zn, isint, str_int
+
+# NumPy is used when the working precision is no more than this many bits
+float_prec = 53
+
+# Below this many values, select sorts them
+select_sort = 32
+
+# mpf are scaled to integers if their exponents are no more than this
+# many bits apart, and Rationals if their common denominator has no
+# more bits than this
+exact_spread = 1 << 12
+
+# The number of values stream reads at a time
+chunk_size = 1 << 16
+
+# Fields that read parses without its parse function:  an integer or a
+# decimal fraction, which is exactly the integer without the point over
+# a power of ten
+plain_decimal = re.compile(r"[-+]?[0-9]+(?:\.[0-9]+)?")
+
+# Lines of plain decimals; a chunk's fields are matched as one string,
+# which is much faster than matching each
+plain_lines = re.compile(r"(?:[-+]?[0-9]+(?:\.[0-9]+)?\n)*")
+
+# The quantiles the stats command reports
+quantiles = (0.5, 0.9, 0.99)
+
+# A Digest keeps about half this many centroids (the compression of
+# the t-digest); the more it keeps, the closer its quantiles are
+digest_size = 200
+
+_numpy = None
+
+def numpy():
+    '''Return the numpy module, or None if it isn't installed.  It is
+    imported when first needed, since it takes a while.
+    '''
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as np
+        except ImportError:
+            np = False
+        _numpy = np
+    return _numpy or None
+
+def array(values):
+    '''Return values as a NumPy float64 array, or None if NumPy isn't
+    installed, the precision is too high for float64 or values aren't
+    all mpf.
+    '''
+    if mp.prec > float_prec or not values:
+        return None
+    np = numpy()
+    if np is None or not all(type(v) is mpf for v in values):
+        return None
+    return np.fromiter(map(float, values), np.float64, len(values))
+
+def _ratio(n, d):
+    'Return n/d as an int if it is one and as a Rational if not.'
+    q = Rational(n, d)
+    if q.d == 1:
+        return q.n
+    return q
+
+def scaled(values, rounded=False):
+    '''Return ints, e, d with values[i] == ints[i]*2**e/d, if values are
+    all integers and Rationals with a common denominator d of no more
+    than exact_spread bits (e is None), or all finite mpf and integers
+    with exponents no more than exact_spread apart (d is 1); otherwise
+    return None, None, None.  If rounded, mpf further apart are scaled
+    too, with ints[i] the floor of values[i]/2**e.
+    '''
+    if all(isint(v) for v in values):
+        return [int(v) for v in values], None, 1
+    if all(isinstance(v, (int, Zn, Rational)) for v in values):
+        d = math.lcm(*set(v.d for v in values if isinstance(v, Rational)))
+        if d.bit_length() > exact_spread:
+            return None, None, None
+        return [v.n*(d//v.d) if isinstance(v, Rational) else int(v)*d
+                for v in values], None, d
+    if all(type(v) is mpf for v in values):
+        parts = [v._mpf_ for v in values]
+    elif all(type(v) is mpf or isint(v) for v in values):
+        parts = [v._mpf_ if type(v) is mpf else from_int(int(v))
+                 for v in values]
+    else:
+        return None, None, None
+    # Zero is the only mpf with no mantissa and a zero exponent
+    if any(not man and exp for sign, man, exp, bc in parts):
+        return None, None, None
+    exps = [exp for sign, man, exp, bc in parts if man]
+    if not exps:
+        return [0]*len(parts), 0, 1
+    e = min(exps)
+    top = max(exps) + max(bc for sign, man, exp, bc in parts)
+    if top - e <= exact_spread:
+        return [(-man if sign else man) << (exp - e)
+                for sign, man, exp, bc in parts], e, 1
+    if not rounded:
+        return None, None, None
+    e = top - exact_spread
+    return [(-man if sign else man) << (exp - e) if exp >= e else
+            (-man if sign else man) >> (e - exp)
+            for sign, man, exp, bc in parts], e, 1
+
+def unscaled(i, e, d=1):
+    '''Return i*2**e/d, for ints, e and d from scaled:  an int or
+    Rational if e is None, and an mpf rounded once if not.
+    '''
+    if e is None:
+        return _ratio(i, d)
+    return mp.ldexp(mp.make_mpf(from_rational(i, d, mp.prec, round_nearest)), e)
+
+def _exact(x):
+    'Return x as an int if it is a whole Rational.'
+    if isinstance(x, Rational) and x.d == 1:
+        return x.n
+    return x
+
+class Welford(object):
+    '''The count, mean, sum of squared deviations (m2), min and max of
+    the values added so far.  Each value changes the mean by its
+    difference from it over the count, which keeps the variance accurate
+    however large the mean is (Welford, 1962).
+    '''
+    def __init__(self):
+        self.n = 0
+        self.mean = mpf(0)
+        self.m2 = mpf(0)
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d/self.n
+        self.m2 += d*(x - self.mean)
+        try:
+            if self.n == 1 or x < self.min:
+                self.min = x
+            if self.n == 1 or x > self.max:
+                self.max = x
+        except TypeError:
+            # Complex numbers have no order
+            self.min = self.max = None
+
+    def merge(self, other):
+        '''Add the values the Welford other has summed, by Chan's
+        formulas for combining means and m2s (Chan et al., 1979).
+        Exact sums (ints and Rationals) stay exact.
+        '''
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean = _exact(self.mean + d*Rational(other.n, n))
+        self.m2 = _exact(self.m2 + other.m2 + d*d*Rational(self.n*other.n, n))
+        try:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        except TypeError:
+            self.min = self.max = None
+        self.n = n
+
+    def variance(self):
+        'Return the population variance, m2/n.'
+        if self.n == 0:
+            raise ValueError("Statistics of no values")
+        if isint(self.m2):
+            return _ratio(int(self.m2), self.n)
+        return _exact(self.m2/self.n)
+
+def summary(values):
+    '''Return a Welford of values:  exact (ints and Rationals) if they
+    are all integers, rounded once from exact sums if they are mpf that
+    scale to integers, and otherwise floating point.
+    '''
+    s = Welford()
+    if not values:
+        return s
+    a = array(values)
+    if a is not None:
+        s.n = len(a)
+        s.mean = mpf(float(a.mean()))
+        s.m2 = mpf(float(a.var()))*s.n
+        s.min, s.max = mpf(float(a.min())), mpf(float(a.max()))
+        return s
+    # Rounding leaves each value within 2**-exact_spread of the largest,
+    # which the sums must not be able to add up to the working precision
+    rounded = mp.prec + 2*len(values).bit_length() + 8 < exact_spread
+    ints, e, d = scaled(values, rounded)
+    if ints is not None:
+        return scaled_summary(ints, e, d)
+    for v in values:
+        s.add(mpf(int(v)) if isint(v) else v)
+    return s
+
+def scaled_summary(ints, e, d):
+    '''Return a Welford of the values ints[i]*2**e/d, for ints, e and d
+    as scaled returns them.
+    '''
+    s = Welford()
+    n = len(ints)
+    total = sum(ints)
+    s.n = n
+    s.mean = unscaled(total, e, d*n)
+    m2 = n*sum(map(operator.mul, ints, ints)) - total*total
+    s.m2 = unscaled(m2, None if e is None else 2*e, d*d*n)
+    s.min, s.max = unscaled(min(ints), e, d), unscaled(max(ints), e, d)
+    return s
+
+def extremes(values):
+    '''Return the smallest and the largest of values, themselves rather
+    than copies.  Scaled values are compared as their integers; if
+    several share the smallest or largest, those are compared as they
+    are.
+    '''
+    if not values:
+        raise ValueError("Statistics of no values")
+    ints, e, d = scaled(values, True)
+    if ints is None:
+        return min(values), max(values)
+    return _extreme(values, ints, min), _extreme(values, ints, max)
+
+def _extreme(values, ints, best):
+    'Return the best (min or max) of values by their scaled ints.'
+    i = best(ints)
+    if ints.count(i) == 1:
+        return values[ints.index(i)]
+    return best(v for v, j in zip(values, ints) if j == i)
+
+def select(values, k):
+    '''Return the kth smallest of values (0 <= k < len(values)) and the
+    next larger or equal one, or None if k is the last.  Each pass keeps
+    only the values on the side of a random pivot that the kth is on, so
+    on average this compares about 4*len(values) times.
+    '''
+    if not 0 <= k < len(values):
+        raise IndexError("There is no value %d of %d" % (k, len(values)))
+    after = None
+    while len(values) > select_sort:
+        pivot = random.choice(values)
+        below = [v for v in values if v < pivot]
+        if k < len(below):
+            values = below
+            after = pivot
+            continue
+        above = [v for v in values if pivot < v]
+        equal = len(values) - len(below) - len(above)
+        if k < len(below) + equal:
+            if k + 1 < len(below) + equal:
+                return pivot, pivot
+            return pivot, min(above) if above else after
+        k -= len(below) + equal
+        values = above
+    values = sorted(values)
+    if k + 1 < len(values):
+        return values[k], values[k + 1]
+    return values[k], after
+
+def median(values):
+    '''Return the middle of values:  a list of the one middle value or
+    the two middle values, smallest first.
+    '''
+    if not values:
+        raise ValueError("Statistics of no values")
+    h = len(values) >> 1
+    a = array(values)
+    if a is not None:
+        np = numpy()
+        part = np.partition(a, [h - 1, h] if len(a) > 1 else [h])
+        if len(a) & 1:
+            return [mpf(float(part[h]))]
+        return [mpf(float(part[h - 1])), mpf(float(part[h]))]
+    ints, e, d = scaled(values)
+    if ints is not None:
+        if len(ints) & 1:
+            return [unscaled(select(ints, h)[0], e, d)]
+        return [unscaled(i, e, d) for i in select(ints, h - 1)]
+    if len(values) & 1:
+        return [select(values, h)[0]]
+    return list(select(values, h - 1))
+
+class Digest(object):
+    '''Approximate quantiles of a stream of real numbers, as floats, from
+    a merging t-digest (Dunning, 2019).  Values are added a chunk at a
+    time:  they are sorted in with the centroids (means and weights) kept
+    so far, and runs of them are merged into new centroids.  The runs
+    are short in the tails and long in the middle, so about size/2
+    centroids are kept whatever the number of values, and the extreme
+    quantiles are the most accurate.
+    '''
+    def __init__(self, size=None):
+        self.size = size or digest_size
+        self.means = []
+        self.weights = []
+        self.n = 0
+        self.min = None
+        self.max = None
+
+    def add(self, values):
+        'Add the floats in the list values.'
+        if not values:
+            return
+        lo, hi = min(values), max(values)
+        if self.n == 0:
+            self.min, self.max = lo, hi
+        else:
+            self.min, self.max = min(self.min, lo), max(self.max, hi)
+        # Merge the sorted values with the centroids, which are sorted
+        values = sorted(values)
+        means, weights = [], []
+        start = 0
+        for m, w in zip(self.means, self.weights):
+            i = bisect_right(values, m, start)
+            means += values[start:i]
+            weights += [1]*(i - start)
+            means.append(m)
+            weights.append(w)
+            start = i
+        means += values[start:]
+        weights += [1]*(len(values) - start)
+        self.n += len(values)
+        below = list(itertools.accumulate(weights))
+        self.means, self.weights = [], []
+        start = 0
+        # Centroid j ends at the quantile where the scale function
+        # k(q) = size/(2*pi)*asin(2*q - 1) has gone up by 1 since it began
+        for j in range(1, self.size//2 + 1):
+            q = (1 - math.cos(2*math.pi*j/self.size))/2
+            end = len(means) if 2*j == self.size else bisect_right(below, q*self.n)
+            if end > start:
+                weight = below[end - 1] - (below[start - 1] if start else 0)
+                total = math.fsum(map(operator.mul, means[start:end], weights[start:end]))
+                self.means.append(total/weight)
+                self.weights.append(weight)
+                start = end
+
+    def quantile(self, q):
+        '''Return an estimate of the q quantile (0 <= q <= 1), which is
+        interpolated between the centers of the centroids around it.
+        '''
+        if self.n == 0:
+            raise ValueError("Statistics of no values")
+        t = q*self.n
+        below = 0
+        center, mean = 0, self.min
+        for m, w in zip(self.means, self.weights):
+            c = below + w/2
+            if t <= c:
+                return mean + (m - mean)*(t - center)/(c - center)
+            center, mean = c, m
+            below += w
+        if center >= self.n:
+            return self.max
+        return mean + (self.max - mean)*(t - center)/(self.n - center)
+
+def stream(values, chunk=None):
+    '''Return a Welford and a Digest of the values the iterable values
+    generates.  They are read chunk (chunk_size) at a time, and each
+    chunk is summarized and merged in, so only one chunk is kept.
+    '''
+    values = iter(values)
+    total, digest = Welford(), Digest()
+    while True:
+        block = list(itertools.islice(values, chunk or chunk_size))
+        if not block:
+            return total, digest
+        total.merge(summary(block))
+        # Zn converts to mpf, not float
+        digest.add([float(int(v)) if isinstance(v, Zn) else float(v) for v in block])
+
+def rows(f, column=None):
+    '''Return an iterator over the lines of the file f, each as a list
+    of fields, and the index of the field to read from each, or None to
+    read them all.  f is CSV if its first line has a comma, and otherwise
+    its fields are separated by white space.  column is the index of the
+    field to read, or its name in the first line.  A CSV file with more
+    than one field in its first line must have a column given, since
+    its columns are usually different quantities.
+    '''
+    lines = iter(f)
+    first = next(lines, '')
+    lines = itertools.chain([first], lines)
+    if ',' in first:
+        rows = csv.reader(lines)
+        if column is None:
+            raise ValueError("Give the column to read from a CSV file")
+    else:
+        rows = map(str.split, lines)
+    if isinstance(column, str):
+        names = [name.strip() for name in next(rows, [])]
+        if column not in names:
+            raise ValueError("There is no column '%s'" % column)
+        column = names.index(column)
+    return rows, column
+
+def fields(f, column=None, chunk=None):
+    '''Generate lists of the fields read from the file f (see rows),
+    stripped and without empty ones, chunk (chunk_size) lines at a time.
+    '''
+    rows_, column = rows(f, column)
+    while True:
+        lines = list(itertools.islice(rows_, chunk or chunk_size))
+        if not lines:
+            return
+        if column is None:
+            block = itertools.chain.from_iterable(lines)
+        else:
+            try:
+                block = list(map(operator.itemgetter(column), lines))
+            except IndexError:
+                block = [row[column] for row in lines if len(row) > column]
+        yield list(filter(None, map(str.strip, block)))
+
+def _parsed(block, parse):
+    'Return the real numbers parse makes of the strings in block.'
+    values = []
+    for field in block:
+        try:
+            x = parse(field)
+        except Exception:
+            continue
+        if isinstance(x, (int, Zn, Rational, mpf)):
+            values.append(x)
+    return values
+
+def read(f, parse, column=None, plain=True, chunk=None):
+    '''Return a Welford and a Digest of the real numbers in the fields
+    of the file f (see fields), parsed by parse; fields that aren't
+    real numbers (names, times, etc.) are skipped.  If plain is true,
+    fields matching plain_decimal are read without parse, which is only
+    right if parse makes the same numbers of them (decimal integer mode
+    with no width).  The file is read chunk (chunk_size) lines at a
+    time, and each chunk is summarized and merged in, so only one chunk
+    is kept.
+    '''
+    total, digest = Welford(), Digest()
+    for block in fields(f, column, chunk):
+        lines = "\n".join(block) + "\n"
+        if not plain:
+            decimals, others = [], block
+        elif plain_lines.fullmatch(lines) and lines.count("\n") == len(block):
+            decimals, others = block, []
+        else:
+            found = list(map(plain_decimal.fullmatch, block))
+            decimals = list(itertools.compress(block, found))
+            others = [field for field, mo in zip(block, found) if not mo]
+        if decimals:
+            digits = map(operator.methodcaller('replace', '.', ''), decimals)
+            try:
+                ints = list(map(int, digits))
+            except ValueError:
+                # A field too long for int()
+                ints = [str_int(d.replace('.', '')) for d in decimals]
+            # The length of each from its point (-1 if it has none) is one
+            # more than its digits after the point
+            dots = list(map(str.find, decimals, itertools.repeat('.')))
+            tails = set(map(operator.sub, map(len, decimals), dots))
+            if min(dots) >= 0 and len(tails) == 1:
+                most = tails.pop() - 1
+            else:
+                places = [len(d) - 1 - p if p >= 0 else 0
+                          for d, p in zip(decimals, dots)]
+                most = max(places)
+                scale = [10**k for k in range(most + 1)]
+                ints = [i*scale[most - p] for i, p in zip(ints, places)]
+            total.merge(scaled_summary(ints, None, 10**most))
+            digest.add(list(map(float, decimals)))
+        if others:
+            values = _parsed(others, parse)
+            total.merge(summary(values))
+            # Zn converts to mpf, not float
+            digest.add([float(int(v)) if isinstance(v, Zn) else float(v)
+                        for v in values])
+    return total, digest
+
+if __name__ == "__main__":
+    mp.dps = 30
+    rnd = random.Random(24)
+    for n in (1, 2, 5, 31, 32, 33, 100, 1001):
+        values = [rnd.randrange(-50, 50) for i in range(n)]
+        copy = list(values)
+        s = sorted(values)
+        for k in range(0, n, max(1, n//17)):
+            assert select(values, k) == (s[k], s[k + 1] if k + 1 < n else None)
+        assert median(values) == (s[n//2 - 1:n//2 + 1] if n % 2 == 0 else [s[n//2]])
+        assert values == copy
+        w = summary(values)
+        assert w.n == n and w.min == s[0] and w.max == s[-1]
+        assert w.mean == Rational(sum(values), n)
+        assert w.m2 == Rational(sum((v*n - sum(values))**2 for v in values), n*n)
+        f = summary([mpf(v) for v in values])
+        assert abs(f.mean - mpf(sum(values))/n) < 1e-20
+        assert abs(f.variance() - mpf(w.variance())) < 1e-20
+        assert (f.min, f.max) == (s[0], s[-1])
+    big = summary([mpf(10)**20 + i for i in range(10)])
+    assert big.variance() == mpf(33)/4
+    assert summary([mpf(10)**20 + i for i in range(10)] + [mp.mpc(0, 0)]).n == 11
+    values = [mpf(rnd.random())*2**rnd.randrange(-60, 60) for i in range(1001)]
+    values[7] = mpf(0)
+    exact, w = summary(values), Welford()
+    for v in values:
+        w.add(v)
+    assert exact.min == min(values) and exact.max == max(values)
+    assert abs(exact.mean - w.mean) < 1e-25*abs(w.mean)
+    assert abs(exact.variance() - w.variance()) < 1e-25*w.variance()
+    assert median(values) == [sorted(values)[500]]
+    assert scaled([mpf(1), mp.inf]) == (None, None, None)
+    assert scaled([mpf(1), mpf(2)**-5000]) == (None, None, None)
+    assert scaled([mpf(1), mpf(2)**-5000], True) == ([1 << 4095, 0], -4095, 1)
+    assert scaled([mpf(-1), mpf(2)**-5000], True)[0] == [-1 << 4095, 0]
+    assert scaled([3, mpf(0.5), Zn(-2)]) == ([6, 1, -4], -1, 1)
+    wide = [mpf(v)*2**(3000*(i % 3) - 3000) for i, v in enumerate(values[:300])]
+    exact, w = summary(wide), Welford()
+    for v in wide:
+        w.add(v)
+    assert abs(exact.mean - w.mean) < 1e-25*abs(w.mean)
+    assert abs(exact.variance() - w.variance()) < 1e-25*w.variance()
+    assert extremes(wide) == (min(wide), max(wide))
+    mixed = [Zn(5), mpf(-2.5), 7, mpf(7), mpf(2)**-5000, mpf(-2.5)]
+    assert summary(mixed).mean == mpf(14)/6
+    assert extremes(mixed)[0] is mixed[1] and extremes(mixed)[1] == 7
+    assert extremes([mpf(2)**-5001, 9, mpf(2)**-5000]) == (mpf(2)**-5001, 9)
+    assert extremes([Rational(1, 3), 2, Rational(-1, 2)]) == (Rational(-1, 2), 2)
+    assert scaled([Rational(1, 2), 3, Rational(-1, 3)]) == ([3, 18, -2], None, 6)
+    q = summary([Rational(3, 2), Rational(5, 2), 4])
+    assert (q.mean, q.variance(), q.min, q.max) == (Rational(8, 3), Rational(19, 18), Rational(3, 2), 4)
+    assert summary([2, 4, 4, 4, 5, 5, 7, 9]).variance() == 4
+    values = [rnd.randrange(-10**6, 10**6) for i in range(5000)]
+    w, t = stream(values, 700)
+    whole = summary(values)
+    assert (w.n, w.mean, w.m2, w.min, w.max) == \
+           (whole.n, whole.mean, whole.m2, whole.min, whole.max)
+    values.sort()
+    for p in (0.001, 0.01, 0.1, 0.5, 0.9, 0.99, 0.999):
+        rank = bisect_right(values, t.quantile(p))/len(values)
+        assert abs(rank - p) <= 0.003
+    assert (t.quantile(0), t.quantile(1)) == (values[0], values[-1])
+    assert len(t.means) <= digest_size//2 + 1 and sum(t.weights) == 5000
+    w, t = stream([mpf(v)/7 for v in values], 999)
+    assert abs(w.mean - mpf(sum(values))/7/5000) < 1e-20
+    assert abs(w.variance()*49/whole.variance() - 1) < 1e-20
+    w, t = stream([3, 1, 2])
+    assert (w.mean, t.quantile(0.5)) == (2, 2.0)
+    lines = ["time,ms,note", "12:00:01,1.5,ok", "12:00:02,2.5,", "12:00:03,x,", "", "12:00:04,-1,"]
+    def parse(s):
+        try:
+            return Rational(int(s), 1)
+        except ValueError:
+            pass
+        if s.count('.') == 1:
+            a, b = s.split('.')
+            return Rational(int(a + b), 10**len(b))
+        raise ValueError(s)
+    assert list(fields(lines, "ms")) == [["1.5", "2.5", "x", "-1"]]
+    assert list(fields(lines, 1, 2)) == [["ms", "1.5"], ["2.5", "x"], ["-1"]]
+    assert list(fields(["1 2.5", " 3", "four 5"])) == [["1", "2.5", "3", "four", "5"]]
+    try:
+        list(fields(lines))
+        raise AssertionError("CSV read without a column")
+    except ValueError:
+        pass
+    for plain in (True, False):
+        w, t = read(lines, parse, "ms", plain)
+        assert (w.n, w.mean, w.min, w.max) == (3, 1, -1, Rational(5, 2))
+        w, t = read(["1 2.5", " 3", "four 5", "-0.25 1/2"], parse, None, plain, 2)
+        assert (w.n, w.mean, w.max) == (5, Rational(45, 20), 5)
+        assert w.variance() == summary([1, Rational(5, 2), 3, 5, Rational(-1, 4)]).variance()
+        w, t = read(['n', '"1\n2"', '3.5'], parse, 0, plain)
+        assert (w.n, w.mean) == (1, Rational(7, 2))
+    assert median([mpf(2), mpf(-1), mpf(0.5), mpf(4)]) == [mpf(0.5), mpf(2)]
+    assert summary([Rational(1, 2), 3]).mean == mpf(7)/4
+    c = summary([mp.mpc(1, 2), mp.mpc(3, 4)])
+    assert c.mean == mp.mpc(2, 3) and c.min is None
+    try:
+        summary([]).variance()
+        raise AssertionError("variance of no values")
+    except ValueError:
+        pass
+    if numpy() is not None:
+        mp.prec = float_prec
+        values = [mpf(rnd.gauss(0, 1))*10**rnd.randrange(-5, 5) for i in range(1001)]
+        a = array(values)
+        ints, e, d = scaled(values)
+        assert a is not None and len(a) == len(values)
+        f, exact = summary(values), scaled_summary(ints, e, d)
+        assert (f.n, f.min, f.max) == (exact.n, exact.min, exact.max)
+        assert abs(f.mean - exact.mean) < 1e-12*abs(exact.max - exact.min)
+        assert abs(f.variance()/exact.variance() - 1) < 1e-12
+        assert median(values) == [sorted(values)[500]]
+        mp.prec = float_prec + 1
+        assert array(values) is None
+    exit(0)